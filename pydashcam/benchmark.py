@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+""" Micro-benchmarks for the Novatek GPS parser, run: python benchmark.py [video]
+
+The parser suite times the parser on synthetic clips (make_fixtures) of several
+durations, 'python benchmark.py -o results.json' runs only the suite and writes
+its results as JSON, '-c' compares them against the results of another commit.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import make_fixtures
+import nvtk_mp42gpx
+
+# clip durations (s) of the parser suite
+SUITE_DURATIONS = (60, 600, 3600)
+SUITE_REPEAT = 5
+# bump when the meaning of the JSON results changes
+RESULTS_FORMAT = 1
+
+
+def make_payload(trailing=24):
+    """ builds a Novatek style GPS payload (as found after the 'free'/'GPS ' header) """
+    record = struct.pack('<IIIIII3sxffff', 12, 34, 56, 21, 1, 9, b'ANE',
+                         5230.1234, 1320.5678, 12.5, 270.0)
+    return b'\x00' * 4 + record + b'\x00' * trailing
+
+
+def bench_get_gps_offset(number=20000):
+    """ compares the marker locator against the byte by byte scan """
+    data = make_payload()
+    assert nvtk_mp42gpx.get_gps_offset(data) == nvtk_mp42gpx.scan_gps_offset(data)
+    scan = timeit.timeit(lambda: nvtk_mp42gpx.scan_gps_offset(data), number=number)
+    fast = timeit.timeit(lambda: nvtk_mp42gpx.get_gps_offset(data), number=number)
+    print("get_gps_offset: scan %.2fus, locator %.2fus per payload (x%.1f faster)"
+          % (scan / number * 1e6, fast / number * 1e6, scan / fast))
+
+
+def bench_decode_gps_payloads(count=3000, number=20):
+    """ compares the numpy batch decoder against decoding the payloads one by one """
+    if nvtk_mp42gpx.np is None:
+        print("decode_gps_payloads: numpy not installed, skipped")
+        return
+    payloads = [make_payload()] * count
+    batch = timeit.timeit(
+        lambda: nvtk_mp42gpx.decode_gps_payloads(payloads, False), number=number)
+    single = timeit.timeit(
+        lambda: [nvtk_mp42gpx.get_gps_data(payload, False) for payload in payloads],
+        number=number)
+    print("decode_gps_payloads: per record %.2fms, batch %.2fms for %d payloads (x%.1f faster)"
+          % (single / number * 1e3, batch / number * 1e3, count, single / batch))
+
+
+def make_video(path, frames=300, width=1920, height=1080, fps=30):
+    """ writes a synthetic test video (moving gradients) """
+    import cv2
+    import numpy as np
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    base = np.indices((height, width)).sum(axis=0)
+    for index in range(frames):
+        frame = np.dstack([base + index, base * 2 + index, base // 2]) % 256
+        writer.write(frame.astype(np.uint8))
+    writer.release()
+
+
+def bench_frame_decoder(video_path=None, depth=4, width=600):
+    """ sustained decoded fps of the threaded pipeline against decoding on the caller's
+    thread, as the viewer did before (read, convert, resize) """
+    try:
+        import cv2
+        import frame_pipeline
+    except ImportError:
+        print("frame_decoder: OpenCV not installed, skipped")
+        return
+    tmp_dir = None
+    if video_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        video_path = os.path.join(tmp_dir.name, 'bench.mp4')
+        make_video(video_path)
+
+    cap = cv2.VideoCapture(video_path)
+    size = frame_pipeline.get_scaled_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                          int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width)
+    start = time.perf_counter()
+    frames = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        frames += 1
+    single = frames / (time.perf_counter() - start)
+    cap.release()
+
+    cap = cv2.VideoCapture(video_path)
+    decoder = frame_pipeline.FrameDecoder(cap, width, depth=depth)
+    start = time.perf_counter()
+    decoder.start()
+    frames = 0
+    busy = 0.0
+    while not decoder.is_finished():
+        get_start = time.perf_counter()
+        item = decoder.get()
+        busy += time.perf_counter() - get_start
+        if item is None:
+            time.sleep(0.0005)
+        else:
+            frames += 1
+    threaded = frames / (time.perf_counter() - start)
+    decoder.stop()
+    cap.release()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+    print("frame_decoder: %d frames %dx%d, single thread %.1ffps (%.2fms per frame on the "
+          "GUI thread), pipeline (depth %d) %.1ffps (%.3fms per frame on the GUI thread)"
+          % (frames, size[0], size[1], single, 1000.0 / single, depth, threaded,
+             busy / max(frames, 1) * 1000))
+
+
+def bench_route_levels(count=36000):
+    """ size and render+save time of the map page with the whole route in one polyline
+    against the route simplified per zoom level (count fixes: 10h at 1Hz by default) """
+    try:
+        import route_simplify
+    except ImportError:
+        print("route_levels: numpy not installed, skipped")
+        return
+    # a clean 1Hz drive, an outlier would only stretch the bounding box
+    fixes = list(make_fixtures.make_drive(count, outliers=0))
+    lats = [fix[1] for fix in fixes]
+    lons = [fix[2] for fix in fixes]
+    start = time.perf_counter()
+    levels = route_simplify.get_route_levels(lats, lons)
+    simplify = time.perf_counter() - start
+    print("route_levels: %d fixes simplified in %.2fs to %s points (max zoom: points)"
+          % (count, simplify, ", ".join("%d: %d" % (level["maxZoom"], len(level["points"]))
+                                        for level in levels)))
+    try:
+        import folium
+    except ImportError:
+        print("route_levels: folium not installed, map size skipped")
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'map.html')
+        start = time.perf_counter()
+        full_map = folium.Map(location=(lats[0], lons[0]), zoom_start=15)
+        folium.PolyLine(list(zip(lats, lons)), tooltip="Route").add_to(full_map)
+        full_map.save(path)
+        full_time = time.perf_counter() - start
+        full_size = os.path.getsize(path)
+        start = time.perf_counter()
+        lod_map = folium.Map(location=(lats[0], lons[0]), zoom_start=15)
+        levels = route_simplify.get_route_levels(lats, lons)
+        lod_map.get_root().html.add_child(folium.Element(
+            "<script>window.routeLevels = %s;</script>" % json.dumps(levels)))
+        lod_map.save(path)
+        lod_time = time.perf_counter() - start
+        lod_size = os.path.getsize(path)
+    print("route_levels: map page full route %.1fKB in %.2fs, simplified levels %.1fKB in %.2fs, "
+          "the most detailed level the page draws has %d of %d points"
+          % (full_size / 1024.0, full_time, lod_size / 1024.0, lod_time,
+             len(levels[-1]["points"]), count))
+
+
+def time_call(func, repeat):
+    """ (best, median) wall time in s of 'repeat' calls, the output of func is discarded """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def get_creation_time_reader():
+    """ (name, function(path)) of the viewer's read_mp4_creation_time, or of probe_mp4
+    it is built on where the viewer cannot be imported (no GUI dependencies) """
+    try:
+        import run
+        return 'read_mp4_creation_time', run.read_mp4_creation_time
+    except Exception:
+        pass
+
+    def probe(path):
+        with open(path, 'rb') as in_fh:
+            return nvtk_mp42gpx.probe_mp4(in_fh)
+    return 'probe_mp4', probe
+
+
+def run_suite(durations=SUITE_DURATIONS, repeat=SUITE_REPEAT, gps_rate=1):
+    """ times the parser on synthetic MP4 and TS clips of the given durations (s),
+    returns a list of result dicts """
+    reader_name, reader = get_creation_time_reader()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for duration in durations:
+            mp4_path = os.path.join(tmp_dir, 'bench.mp4')
+            ts_path = os.path.join(tmp_dir, 'bench.ts')
+            fixes = make_fixtures.make_mp4(mp4_path, duration, gps_rate)
+            make_fixtures.make_ts(ts_path, duration, gps_rate)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gps_data = nvtk_mp42gpx.process_file(mp4_path, False, False)
+            payloads = [b'\x00' * make_fixtures.PAYLOAD_HEAD + make_fixtures.make_record(*fix)
+                        + b'\x00' * make_fixtures.PAYLOAD_TAIL
+                        for fix in make_fixtures.make_drive(fixes, gps_rate)]
+            cases = [
+                ('process_file.mp4', mp4_path,
+                 lambda: nvtk_mp42gpx.process_file(mp4_path, False, False)),
+                ('process_file.ts', ts_path,
+                 lambda: nvtk_mp42gpx.process_file(ts_path, False, False)),
+                ('get_gps_offset', None,
+                 lambda: [nvtk_mp42gpx.get_gps_offset(payload) for payload in payloads]),
+                ('generate_gpx', None, lambda: nvtk_mp42gpx.generate_gpx(gps_data, 'bench.gpx')),
+                ('remove_outliers', None, lambda: nvtk_mp42gpx.remove_outliers(gps_data)),
+                (reader_name, mp4_path, lambda: reader(mp4_path)),
+            ]
+            for name, path, func in cases:
+                best, median = time_call(func, repeat)
+                results.append({
+                    'name': name,
+                    'duration': duration,
+                    'fixes': fixes,
+                    'bytes': os.path.getsize(path) if path else None,
+                    'best': best,
+                    'median': median,
+                })
+    return results
+
+
+def get_commit():
+    """ the git commit of the benchmarked tree, None outside of a git checkout """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_report(results, repeat):
+    """ the suite results with what they were measured on, as written to JSON """
+    return {
+        'format': RESULTS_FORMAT,
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': nvtk_mp42gpx.np is not None,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def print_suite(results):
+    for result in results:
+        print("%s: %ds (%d fixes) best %.2fms, median %.2fms, %.2fus per fix"
+              % (result['name'], result['duration'], result['fixes'], result['best'] * 1e3,
+                 result['median'] * 1e3, result['best'] / max(result['fixes'], 1) * 1e6))
+
+
+def compare_reports(old, new):
+    """ prints the change of the best times between two reports (new / old) """
+    old_results = {(result['name'], result['duration']): result for result in old['results']}
+    print("comparing %s (old) with %s (new)" % (old.get('commit'), new.get('commit')))
+    for result in new['results']:
+        previous = old_results.get((result['name'], result['duration']))
+        if previous is None or not previous['best']:
+            continue
+        print("%s: %ds %.2fms -> %.2fms (x%.2f)"
+              % (result['name'], result['duration'], previous['best'] * 1e3,
+                 result['best'] * 1e3, result['best'] / previous['best']))
+
+
+def get_args():
+    """ parsing arguments """
+    parser = argparse.ArgumentParser(description='Benchmarks of the GPS parser and the viewer.')
+    parser.add_argument('video', nargs='?', default=None,
+                        help='video for the frame decoder benchmark (default: a synthetic one).')
+    parser.add_argument('-o', metavar='output', default=None,
+                        help=('run the parser suite only and write its results as JSON '
+                              '(\'-\' for stdout).'))
+    parser.add_argument('-c', metavar='baseline', default=None,
+                        help='compare the parser suite with the JSON results of an earlier run.')
+    parser.add_argument('-t', metavar='seconds', type=float, nargs='+', default=SUITE_DURATIONS,
+                        help='clip durations of the parser suite (default: %s).'
+                             % ' '.join(str(duration) for duration in SUITE_DURATIONS))
+    parser.add_argument('-r', metavar='repeat', type=int, default=SUITE_REPEAT,
+                        help='runs per measurement, the best one counts (default %d).'
+                             % SUITE_REPEAT)
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    """ main function """
+    args = get_args()
+    if args.o is None:
+        bench_get_gps_offset()
+        bench_decode_gps_payloads()
+        bench_frame_decoder(args.video)
+        bench_route_levels()
+    results = run_suite(args.t, args.r)
+    report = get_report(results, args.r)
+    if args.o == '-':
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        print_suite(results)
+        if args.o is not None:
+            with open(args.o, 'w') as out_fh:
+                json.dump(report, out_fh, indent=1)
+    if args.c is not None:
+        with open(args.c) as in_fh:
+            compare_reports(json.load(in_fh), report)
+
+
+if __name__ == "__main__":
+    main()
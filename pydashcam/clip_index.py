@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+""" Persistent spatial index over a clip archive, to find the footage that
+passed near a place (and between two dates) without parsing the archive again.
+
+Every indexed track is cut into chunks of CHUNK_FIXES fixes; the bounding box
+of each chunk goes into an SQLite R-tree, its time span and fixes into a table
+with the same id, so a query only refines the chunks whose box it hits. The time span
+is not a dimension of the tree: the clips' times are unrelated to where they
+were recorded, splitting nodes by time made spatial queries scan most of the tree.
+
+run: python clip_index.py index.db index -i <files/dirs>
+     python clip_index.py index.db near <lat> <lon> <radius m> [-a <from>] [-b <to>]
+     python clip_index.py index.db box <south> <west> <north> <east> [-a <from>] [-b <to>]
+(dates as 2021-01-09T21:16:27Z)
+"""
+
+import argparse
+import array
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import nvtk_mp42gpx
+import track_cache
+
+# bump when the schema or the chunk layout changes
+INDEX_VERSION = 1
+# fixes per R-tree entry, about a minute of driving at 1Hz
+CHUNK_FIXES = 60
+EARTH_R = nvtk_mp42gpx.EARTH_R
+# the widest time range of a query
+MIN_EPOCH = -(2 ** 62)
+MAX_EPOCH = 2 ** 62
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    identity TEXT NOT NULL,
+    start_epoch REAL,
+    end_epoch REAL,
+    fixes INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_boxes USING rtree(
+    id,
+    min_lat, max_lat,
+    min_lon, max_lon
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    clip_id INTEGER NOT NULL,
+    start_epoch REAL NOT NULL,
+    end_epoch REAL NOT NULL,
+    track BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_clip_id ON chunks (clip_id);
+"""
+
+
+def pack_chunk(gps_data):
+    """ packs the fixes of a chunk as float64 (epoch, lat, lon) triples """
+    data = array.array('d')
+    for gps in gps_data:
+        data.extend((gps.epoch, gps.lat, gps.lon))
+    return data.tobytes()
+
+
+def unpack_chunk(data):
+    """ yields (epoch, lat, lon) of the fixes packed by pack_chunk """
+    values = array.array('d')
+    values.frombytes(data)
+    return zip(values[0::3], values[1::3], values[2::3])
+
+
+def get_distance(lat1, lon1, lat2, lon2):
+    """ great circle distance in meters (haversine, as in nvtk_mp42gpx.calculate_speed) """
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    hav_lat = (1 - math.cos(lat2 - lat1)) / 2
+    hav_lon = (1 - math.cos(math.radians(lon2 - lon1))) / 2
+    hav_h = min(hav_lat + math.cos(lat1) * math.cos(lat2) * hav_lon, 1.0)
+    return 2 * EARTH_R * math.asin(hav_h ** 0.5)
+
+
+def get_radius_box(lat, lon, radius):
+    """ (south, west, north, east) of a box containing the circle of 'radius' meters;
+    near the poles or the antimeridian the box covers all longitudes """
+    dlat = math.degrees(radius / EARTH_R)
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    if cos_lat <= 1e-9:
+        return lat - dlat, -180.0, lat + dlat, 180.0
+    dlon = dlat / cos_lat
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return lat - dlat, -180.0, lat + dlat, 180.0
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+class ClipIndex(object):
+    """ R-tree of the indexed clips' tracks in an SQLite database """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            raise ValueError("index '%s' has version %d, expected %d"
+                             % (db_path, version, INDEX_VERSION))
+        self.db.executescript(SCHEMA)
+        self.db.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM clips").fetchone()[0]
+
+    def is_current(self, path, identity):
+        """ True if the file is indexed and did not change since """
+        row = self.db.execute("SELECT identity FROM clips WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == identity
+
+    def remove(self, path):
+        """ removes the file from the index (no commit) """
+        row = self.db.execute("SELECT id FROM clips WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM chunk_boxes WHERE id IN"
+                            " (SELECT id FROM chunks WHERE clip_id = ?)", row)
+            self.db.execute("DELETE FROM chunks WHERE clip_id = ?", row)
+            self.db.execute("DELETE FROM clips WHERE id = ?", row)
+
+    def add(self, path, identity, gps_data, chunk_fixes=CHUNK_FIXES):
+        """ (re)indexes the file with its list of GpsFix (no commit) """
+        self.remove(path)
+        gps_data = sorted(gps_data, key=lambda gps: gps.epoch)
+        cursor = self.db.execute(
+            "INSERT INTO clips (path, identity, start_epoch, end_epoch, fixes)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (path, identity, gps_data[0].epoch if gps_data else None,
+             gps_data[-1].epoch if gps_data else None, len(gps_data)))
+        clip_id = cursor.lastrowid
+        for first in range(0, len(gps_data), chunk_fixes):
+            # the chunks overlap by a fix, so the road between two chunks is not lost
+            chunk = gps_data[max(first - 1, 0):first + chunk_fixes]
+            lats = [gps.lat for gps in chunk]
+            lons = [gps.lon for gps in chunk]
+            cursor = self.db.execute(
+                "INSERT INTO chunks (clip_id, start_epoch, end_epoch, track) VALUES (?, ?, ?, ?)",
+                (clip_id, chunk[0].epoch, chunk[-1].epoch, pack_chunk(chunk)))
+            self.db.execute(
+                "INSERT INTO chunk_boxes (id, min_lat, max_lat, min_lon, max_lon)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid, min(lats), max(lats), min(lons), max(lons)))
+
+    def commit(self):
+        self.db.commit()
+
+    def get_chunks(self, south, west, north, east, start, end):
+        """ yields (path, min lat, max lat, min lon, max lon, start, end, packed track)
+        of the chunks whose box and time span intersect the query; the R-tree keeps its
+        bounds as float32 (rounded outwards), so the fixes are compared exactly by the
+        caller. The time span is checked on the chunks the tree returns """
+        return self.db.execute(
+            "SELECT clips.path, chunk_boxes.min_lat, chunk_boxes.max_lat, chunk_boxes.min_lon,"
+            " chunk_boxes.max_lon, chunks.start_epoch, chunks.end_epoch, chunks.track"
+            " FROM chunk_boxes JOIN chunks ON chunks.id = chunk_boxes.id"
+            " JOIN clips ON clips.id = chunks.clip_id"
+            " WHERE chunk_boxes.max_lat >= ? AND chunk_boxes.min_lat <= ?"
+            " AND chunk_boxes.max_lon >= ? AND chunk_boxes.min_lon <= ?"
+            " AND chunks.end_epoch >= ? AND chunks.start_epoch <= ?",
+            (south, north, west, east, start, end))
+
+    def query_box(self, south, west, north, east, start=MIN_EPOCH, end=MAX_EPOCH):
+        """ clips with fixes inside the box and time range, as a list of
+        (path, first epoch, last epoch) of those fixes, sorted by the first epoch """
+        found = {}
+        for (path, min_lat, max_lat, min_lon, max_lon, chunk_start, chunk_end,
+             data) in self.get_chunks(south, west, north, east, start, end):
+            if (south <= min_lat and max_lat <= north and west <= min_lon and max_lon <= east
+                    and start <= chunk_start and chunk_end <= end):
+                # the whole chunk is inside, no need to look at its fixes
+                epochs = (chunk_start, chunk_end)
+            else:
+                epochs = [epoch for epoch, lat, lon in unpack_chunk(data)
+                          if south <= lat <= north and west <= lon <= east
+                          and start <= epoch <= end]
+                if not epochs:
+                    continue
+            first, last = found.get(path, (epochs[0], epochs[-1]))
+            found[path] = (min(first, epochs[0]), max(last, epochs[-1]))
+        return sorted(((path, first, last) for path, (first, last) in found.items()),
+                      key=lambda item: item[1])
+
+    def query_radius(self, lat, lon, radius, start=MIN_EPOCH, end=MAX_EPOCH):
+        """ clips that passed within 'radius' meters of (lat, lon) in the time range,
+        as a list of (path, epoch, distance) of their closest fix, sorted by the epoch """
+        south, west, north, east = get_radius_box(lat, lon, radius)
+        found = {}
+        for path, _, _, _, _, _, _, data in self.get_chunks(south, west, north, east, start, end):
+            for epoch, fix_lat, fix_lon in unpack_chunk(data):
+                if not (south <= fix_lat <= north and west <= fix_lon <= east
+                        and start <= epoch <= end):
+                    continue
+                distance = get_distance(lat, lon, fix_lat, fix_lon)
+                if distance <= radius and (path not in found or distance < found[path][1]):
+                    found[path] = (epoch, distance)
+        return sorted(((path, epoch, distance) for path, (epoch, distance) in found.items()),
+                      key=lambda item: item[1])
+
+
+def index_files(clip_index, in_files, deobfuscate, jobs=1, cache=None):
+    """ indexes the files that are new or changed since they were indexed,
+    returns the number of (re)indexed files """
+    pending = {}
+    for in_file in in_files:
+        path = os.path.abspath(in_file)
+        try:
+            identity = track_cache.get_file_identity(path)
+        except OSError as error:
+            print("Error: cannot read file '%s' (%s), skipping it." % (in_file, error))
+            continue
+        if clip_index.is_current(path, identity):
+            print("File '%s' is already indexed." % in_file)
+            continue
+        pending[path] = identity
+    indexed = 0
+    for path, gps_data in nvtk_mp42gpx.process_files(list(pending), deobfuscate, False,
+                                                     jobs, cache):
+        if gps_data is None:
+            continue
+        # files without GPS data are recorded too, so they are not parsed again
+        clip_index.add(path, pending[path], gps_data)
+        indexed += 1
+        # committed now and then, an interrupted run keeps what it indexed
+        if indexed % 100 == 0:
+            clip_index.commit()
+    clip_index.commit()
+    return indexed
+
+
+def format_epoch(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+def get_args():
+    """ parsing arguments """
+    parser = argparse.ArgumentParser(
+        description='Spatial index over Novatek MP4/MOV/TS clips: which clips passed near a place.')
+    parser.add_argument('db', help='index database file.')
+    commands = parser.add_subparsers(dest='command')
+    index = commands.add_parser('index', help='add new or changed clips to the index.')
+    index.add_argument('-i', metavar='input', nargs='+', required=True,
+                       help='input file(s), globs (eg: *) or directory(ies).')
+    index.add_argument('-d', action='store_true',
+                       help='deobfuscates coordinates (see nvtk_mp42gpx).')
+    index.add_argument('-j', metavar='jobs', type=int, default=1,
+                       help='number of files processed in parallel (0 uses all CPU cores).')
+    index.add_argument('-c', metavar='cache', nargs='?', const='', default=None,
+                       help='use the track cache (optionally specify the cache directory).')
+    near = commands.add_parser('near', help='clips that passed within a radius of a point.')
+    near.add_argument('lat', type=float)
+    near.add_argument('lon', type=float)
+    near.add_argument('radius', type=float, help='radius in meters.')
+    box = commands.add_parser('box', help='clips with GPS data inside a bounding box.')
+    for name in ('south', 'west', 'north', 'east'):
+        box.add_argument(name, type=float)
+    for command in (near, box):
+        command.add_argument('-a', metavar='from', type=nvtk_mp42gpx.convert_to_epoch,
+                             default=MIN_EPOCH, help='only GPS data after this UTC date/time.')
+        command.add_argument('-b', metavar='to', type=nvtk_mp42gpx.convert_to_epoch,
+                             default=MAX_EPOCH, help='only GPS data before this UTC date/time.')
+    args = parser.parse_args(sys.argv[1:])
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+    return args
+
+
+def main():
+    """ main function """
+    args = get_args()
+    with ClipIndex(args.db) as clip_index:
+        if args.command == 'index':
+            cache = track_cache.TrackCache(args.c or None) if args.c is not None else None
+            jobs = args.j if args.j > 0 else (os.cpu_count() or 1)
+            in_files = nvtk_mp42gpx.check_in_file(args.i)
+            indexed = index_files(clip_index, in_files, args.d, jobs, cache)
+            print("Indexed %d file(s), %d in the index." % (indexed, len(clip_index)))
+            return
+        started = time.perf_counter()
+        if args.command == 'near':
+            results = clip_index.query_radius(args.lat, args.lon, args.radius, args.a, args.b)
+            for path, epoch, distance in results:
+                print("%s\t%s\t%.1fm" % (path, format_epoch(epoch), distance))
+        else:
+            results = clip_index.query_box(args.south, args.west, args.north, args.east,
+                                           args.a, args.b)
+            for path, first, last in results:
+                print("%s\t%s\t%s" % (path, format_epoch(first), format_epoch(last)))
+        print("%d clip(s) found in %.1f ms." % (len(results), (time.perf_counter() - started) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+""" Threaded video decoding for the viewer: a decoder thread reads, downsizes
+and colour converts the frames into a bounded ring of preallocated NumPy
+buffers, the GUI thread only picks up ready frames. No Tk in here, so the
+pipeline can be used (and benchmarked) without a display. """
+
+import bisect
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_WIDTH = 600
+DEFAULT_DEPTH = 4
+MIN_RATE = 0.5
+MAX_RATE = 8.0
+
+
+def get_scaled_size(width, height, target_width=None, target_height=None):
+    """ (width, height) scaled to the target width or height, keeping the aspect ratio """
+    if target_width is None and target_height is None:
+        return width, height
+    if target_width is None:
+        return int(width * target_height / float(height)), target_height
+    return target_width, int(height * target_width / float(width))
+
+
+class FrameDecoder(object):
+    """ decodes a cv2.VideoCapture on a worker thread into a ring of 'depth' buffers;
+    the capture must not be used by anybody else while the decoder runs """
+
+    def __init__(self, cap, width=DEFAULT_WIDTH, height=None, depth=DEFAULT_DEPTH):
+        self.cap = cap
+        self.size = get_scaled_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                    int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width, height)
+        self.depth = max(2, depth)
+        self.buffers = np.empty((self.depth, self.size[1], self.size[0], 3), np.uint8)
+        self.scratch = np.empty((self.size[1], self.size[0], 3), np.uint8)
+        self.raw = None
+        self.lock = threading.Condition()
+        self.free = collections.deque(range(self.depth))
+        # (buffer, frame index, position in ms) in decoding order
+        self.ready = collections.deque()
+        # buffer handed out by the last get(), reused once the next frame is taken
+        self.current = None
+        self.seek_to = None
+        # frames the display wants next, the decoder grab()s up to it when behind
+        self.target = None
+        self.next_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        # frames skipped by grab() or dropped from the ring without being shown
+        self.dropped = 0
+        self.finished = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """ starts the decoder thread """
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """ stops the decoder thread and waits for it """
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def seek(self, position_msec):
+        """ drops the decoded frames and continues decoding at position_msec """
+        with self.lock:
+            self.seek_to = position_msec
+            self.target = None
+            self.release_ready()
+            self.finished = False
+            self.lock.notify_all()
+
+    def skip_to(self, frame_index):
+        """ lets the decoder skip (without decoding them) the frames before frame_index """
+        with self.lock:
+            self.target = frame_index
+
+    def release_ready(self):
+        """ gives all decoded but not yet taken buffers back (lock held) """
+        while self.ready:
+            self.free.append(self.ready.popleft()[0])
+
+    def get(self, frame_index=None):
+        """ returns (frame index, position in ms, RGB frame) of the next decoded frame,
+        or with frame_index the newest one not after it (older ones are dropped);
+        None if no such frame is ready. The frame stays valid until the next get() """
+        with self.lock:
+            if not self.ready:
+                return None
+            if frame_index is None:
+                count = 1
+            else:
+                count = 0
+                for _, index, _ in self.ready:
+                    if index > frame_index:
+                        break
+                    count += 1
+                if count == 0:
+                    return None
+            for _ in range(count - 1):
+                self.free.append(self.ready.popleft()[0])
+                self.dropped += 1
+            buffer, index, position = self.ready.popleft()
+            if self.current is not None:
+                self.free.append(self.current)
+            self.current = buffer
+            self.lock.notify_all()
+        return index, position, self.buffers[buffer]
+
+    def is_finished(self):
+        """ True once the end of the video is reached and all frames were taken """
+        with self.lock:
+            return self.finished and not self.ready
+
+    def run(self):
+        """ decoder thread: fills free buffers until stopped """
+        while True:
+            with self.lock:
+                while self.running and (not self.free or self.finished) and self.seek_to is None:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                seek_to, self.seek_to = self.seek_to, None
+                buffer = self.free.popleft() if self.free else None
+                target = self.target
+            if seek_to is not None:
+                self.cap.set(cv2.CAP_PROP_POS_MSEC, seek_to)
+                self.next_index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if buffer is None:
+                continue
+            skipped = 0
+            # behind the display: grab() only demuxes/decodes, no retrieve and conversion
+            while target is not None and self.next_index + skipped < target and seek_to is None:
+                if not self.cap.grab():
+                    break
+                skipped += 1
+            ret, raw = self.cap.read(self.raw)
+            if ret:
+                self.raw = raw
+                # after read() the capture reports the frame that was just read
+                index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+                self.next_index = index + 1
+                position = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                # downsized first, the colour conversion then only touches the small frame
+                cv2.resize(raw, self.size, dst=self.scratch, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(self.scratch, cv2.COLOR_BGR2RGB, dst=self.buffers[buffer])
+            with self.lock:
+                self.dropped += skipped
+                if self.seek_to is not None:
+                    # the frame belongs to the position before the seek
+                    self.free.append(buffer)
+                elif ret:
+                    self.ready.append((buffer, index, position))
+                else:
+                    self.free.append(buffer)
+                    self.finished = True
+                self.lock.notify_all()
+
+
+class KeyframeIndex(object):
+    """ sorted keyframe positions (ms) of a video; seeking to a keyframe is cheap,
+    the decoder does not have to decode forward from the previous one """
+
+    def __init__(self, times=None):
+        self.positions = [time_s * 1000.0 for time_s in times or []]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest(self, position):
+        """ the keyframe position closest to position (ms), position itself without index """
+        if not self.positions:
+            return position
+        index = bisect.bisect_left(self.positions, position)
+        if index == 0:
+            return self.positions[0]
+        if index == len(self.positions):
+            return self.positions[-1]
+        before, after = self.positions[index - 1], self.positions[index]
+        return before if position - before <= after - position else after
+
+
+class PlaybackClock(object):
+    """ maps the elapsed wall time to a video position, at a playback rate between
+    MIN_RATE and MAX_RATE; 'clock' (seconds) can be replaced, e.g. in tests """
+
+    def __init__(self, rate=1.0, clock=time.monotonic):
+        self.clock = clock
+        self.rate = min(max(rate, MIN_RATE), MAX_RATE)
+        self.running = False
+        self.origin_time = clock()
+        self.origin_position = 0.0
+
+    def position(self):
+        """ current video position in ms """
+        if not self.running:
+            return self.origin_position
+        return self.origin_position + (self.clock() - self.origin_time) * 1000.0 * self.rate
+
+    def rebase(self, position):
+        self.origin_position = position
+        self.origin_time = self.clock()
+
+    def start(self):
+        if not self.running:
+            self.rebase(self.origin_position)
+            self.running = True
+
+    def pause(self):
+        if self.running:
+            self.rebase(self.position())
+            self.running = False
+
+    def seek(self, position):
+        self.rebase(position)
+
+    def set_rate(self, rate):
+        """ changes the rate (clamped to MIN_RATE..MAX_RATE) without a jump in position """
+        self.rebase(self.position())
+        self.rate = min(max(rate, MIN_RATE), MAX_RATE)
+        return self.rate
+
+    def time_until(self, position):
+        """ wall time in s until the clock reaches position (ms), 0 if already passed """
+        if not self.running:
+            return 0.0
+        return max(0.0, (position - self.position()) / 1000.0 / self.rate)
+
+
+class PlaybackScheduler(object):
+    """ picks the frame that is due according to the wall clock: frames that are late
+    are dropped (in the ring, or skipped with grab() by the decoder when it is behind)
+    instead of slowing the playback down """
+
+    def __init__(self, decoder, fps, rate=1.0, clock=time.monotonic):
+        self.decoder = decoder
+        self.fps = fps
+        self.clock = PlaybackClock(rate, clock)
+        # shown frames that were already overdue (the decoder did not keep up)
+        self.late = 0
+        self.shown = 0
+        self.last_index = None
+
+    @property
+    def dropped(self):
+        """ frames that were skipped or dropped without being shown """
+        return self.decoder.dropped
+
+    def target_frame(self):
+        """ index of the frame due now """
+        return int(self.clock.position() * self.fps / 1000.0)
+
+    def seek(self, position):
+        self.decoder.seek(position)
+        self.clock.seek(position)
+        self.last_index = None
+
+    def tick(self):
+        """ returns (frame index, position in ms, RGB frame) to show now, or None """
+        if not self.clock.running:
+            # paused (e.g. after a seek): the next decoded frame, the clock follows it
+            item = self.decoder.get()
+            if item is not None:
+                self.clock.seek(item[1])
+                self.last_index = item[0]
+            return item
+        target = self.target_frame()
+        self.decoder.skip_to(target)
+        item = self.decoder.get(target)
+        if item is None:
+            return None
+        index = item[0]
+        if index < target:
+            self.late += 1
+        self.shown += 1
+        self.last_index = index
+        return item
+
+    def delay(self):
+        """ ms until the frame after the last one shown is due (at least 1) """
+        if self.last_index is None:
+            return 1
+        due = (self.last_index + 1) * 1000.0 / self.fps
+        return max(1, int(round(self.clock.time_until(due) * 1000)))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+""" Synthetic Novatek MP4 and TS files with the layouts nvtk_mp42gpx parses,
+for tests and benchmarks without real footage. The video is dummy data, only
+the container structure and the GPS records are real:
+
+MP4: ftyp, mdat (dummy video with a 'free'/'GPS ' atom per fix), moov with
+     mvhd, a video trak (mdhd, hdlr, stts, stss) and the 'gps ' index atom
+TS:  dummy video packets and PES private stream 2 packets on PID 0x300, one
+     per fix, some of them split over two packets the way B4K cameras do
+
+run: python make_fixtures.py <directory> [-t seconds] [-g fixes per second] [-p packets]
+"""
+
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import time
+
+import nvtk_mp42gpx
+
+DEFAULT_START = 1610186400  # 2021-01-09T10:00:00Z
+# dummy video bytes per second of MP4
+DEFAULT_VIDEO_RATE = 16 * 1024
+# dummy video packets per fix in a TS file
+DEFAULT_TS_PACKETS = 100
+DEFAULT_FPS = 30
+# fraction of the fixes that are thrown off, for remove_outliers
+DEFAULT_OUTLIERS = 0.01
+MP4_TIMESCALE = 1000
+VIDEO_TIMESCALE = 30000
+VIDEO_PID = 0x0100
+PES_PRIVATE_2 = b'\x00\x00\x01\xbf'
+# bytes of the GPS record that end up in the first packet of a split fix
+SPLIT_BYTES = 14
+# bytes before and after the record in a 'GPS ' payload
+PAYLOAD_HEAD = 4
+PAYLOAD_TAIL = 24
+
+
+def make_atom(atom_type, body):
+    return struct.pack('>I4s', 8 + len(body), atom_type) + body
+
+
+def to_novatek_coordinate(coordinate):
+    """ signed degrees -> (hemisphere index 0/1, DDDmm.mmmm) """
+    value = abs(coordinate)
+    degrees = math.floor(value)
+    return coordinate < 0, degrees * 100 + (value - degrees) * 60
+
+
+def make_drive(count, gps_rate=1, seed=1, start_epoch=DEFAULT_START, outliers=DEFAULT_OUTLIERS):
+    """ a synthetic drive of 'count' fixes, 'gps_rate' per second at ~15m/s with a slowly
+    changing heading; yields (epoch, lat, lon, speed m/s, bearing) """
+    rnd = random.Random(seed)
+    lat, lon = 52.5, 13.4
+    heading = 0.0
+    step = 15.0 / gps_rate
+    for index in range(count):
+        heading += rnd.gauss(0, 0.05)
+        lat += math.degrees(step * math.cos(heading) / nvtk_mp42gpx.EARTH_R)
+        lon += math.degrees(step * math.sin(heading) / nvtk_mp42gpx.EARTH_R
+                            / math.cos(math.radians(lat)))
+        fix_lat, fix_lon = lat, lon
+        if rnd.random() < outliers:
+            fix_lat += rnd.choice((-1, 1)) * rnd.uniform(1, 10)
+        yield (start_epoch + index // gps_rate, fix_lat, fix_lon,
+               15.0 + rnd.gauss(0, 1), math.degrees(heading) % 360)
+
+
+def make_record(epoch, lat, lon, speed, bearing):
+    """ a Novatek GPS record (nvtk_mp42gpx.NOVATEK_RECORD) """
+    tm_time = time.gmtime(epoch)
+    lat_south, lat_raw = to_novatek_coordinate(lat)
+    lon_west, lon_raw = to_novatek_coordinate(lon)
+    return struct.pack(nvtk_mp42gpx.NOVATEK_RECORD, tm_time.tm_hour, tm_time.tm_min,
+                       tm_time.tm_sec, tm_time.tm_year - 2000, tm_time.tm_mon, tm_time.tm_mday,
+                       b'A', b'S' if lat_south else b'N', b'W' if lon_west else b'E',
+                       lat_raw, lon_raw, speed / 0.514444, bearing)
+
+
+def write_filler(out_fh, size, chunk=b'\x00' * 65536):
+    while size > 0:
+        out_fh.write(chunk[:size])
+        size -= len(chunk)
+
+
+def make_mp4(path, duration, gps_rate=1, video_rate=DEFAULT_VIDEO_RATE, fps=DEFAULT_FPS,
+             seed=1, start_epoch=DEFAULT_START, outliers=DEFAULT_OUTLIERS):
+    """ writes a MP4 of 'duration' seconds with gps_rate fixes per second and
+    video_rate dummy bytes per second; returns the number of fixes """
+    count = int(duration * gps_rate)
+    records = [make_record(*fix) for fix in
+               make_drive(count, gps_rate, seed, start_epoch, outliers)]
+    gps_size = 8 + 4 + PAYLOAD_HEAD + nvtk_mp42gpx.NOVATEK_RECORD_SIZE + PAYLOAD_TAIL
+    video_size = int(video_rate / gps_rate)
+    ftyp = make_atom(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    mdat_size = 8 + count * (video_size + gps_size)
+    if len(ftyp) + mdat_size > 0xFFFFFFFF:
+        raise ValueError("%d bytes do not fit into 32 bit atom offsets" % mdat_size)
+    entries = []
+    with open(path, 'wb') as out_fh:
+        out_fh.write(ftyp)
+        out_fh.write(struct.pack('>I4s', mdat_size, b'mdat'))
+        offset = len(ftyp) + 8
+        for record in records:
+            write_filler(out_fh, video_size)
+            offset += video_size
+            out_fh.write(make_atom(b'free', b'GPS ' + b'\x00' * PAYLOAD_HEAD + record
+                                   + b'\x00' * PAYLOAD_TAIL))
+            entries.append((offset, gps_size))
+            offset += gps_size
+
+        # the camera stamps the container with the local end time of the clip
+        creation_time = int(start_epoch + duration) + nvtk_mp42gpx.MP4_EPOCH_OFFSET
+        frames = int(duration * fps)
+        frame_duration = VIDEO_TIMESCALE // fps
+        mvhd = make_atom(b'mvhd', struct.pack('>IIIII', 0, creation_time, creation_time,
+                                              MP4_TIMESCALE, int(duration * MP4_TIMESCALE))
+                         + b'\x00' * 80)
+        mdhd = make_atom(b'mdhd', struct.pack('>IIIII', 0, creation_time, creation_time,
+                                              VIDEO_TIMESCALE, frames * frame_duration)
+                         + b'\x00' * 4)
+        hdlr = make_atom(b'hdlr', struct.pack('>I4s4s', 0, b'\x00' * 4, b'vide') + b'\x00' * 13)
+        stts = make_atom(b'stts', struct.pack('>IIII', 0, 1, frames, frame_duration))
+        # a keyframe every second
+        keyframes = range(1, frames + 1, fps)
+        stss = make_atom(b'stss', struct.pack('>II', 0, len(keyframes))
+                         + b''.join(struct.pack('>I', sample) for sample in keyframes))
+        stbl = make_atom(b'stbl', stts + stss)
+        trak = make_atom(b'trak', make_atom(b'mdia', mdhd + hdlr + make_atom(b'minf', stbl)))
+        gps = make_atom(b'gps ', struct.pack('>II', 0x101, len(entries))
+                        + b''.join(struct.pack('>II', *entry) for entry in entries))
+        out_fh.write(make_atom(b'moov', mvhd + trak + gps))
+    return count
+
+
+def make_ts_packet(pid, payload, start=False):
+    """ a TS packet with the given (up to 184 bytes, zero padded) payload """
+    header = struct.pack('>BHB', nvtk_mp42gpx.TS_SYNC, (0x4000 if start else 0) | pid, 0x10)
+    return header + payload + b'\x00' * (nvtk_mp42gpx.TS_PACKET_SIZE - 4 - len(payload))
+
+
+def make_ts(path, duration, gps_rate=1, packets=DEFAULT_TS_PACKETS, split_every=5, seed=2,
+            start_epoch=DEFAULT_START, outliers=DEFAULT_OUTLIERS):
+    """ writes a TS of 'duration' seconds with gps_rate fixes per second, 'packets' dummy
+    video packets per fix and every split_every-th fix split over two packets
+    (0: none); returns the number of fixes """
+    count = int(duration * gps_rate)
+    video = make_ts_packet(VIDEO_PID, b'\x00' * 184)
+    filler = video * packets
+    with open(path, 'wb') as out_fh:
+        for index, fix in enumerate(make_drive(count, gps_rate, seed, start_epoch, outliers)):
+            record = make_record(*fix)
+            out_fh.write(filler)
+            if split_every and index % split_every == 0:
+                # the start of the record closes the first packet, the second one
+                # begins with the number of bytes to skip before the rest
+                head = PES_PRIVATE_2 + b'\x00' * (184 - 4 - SPLIT_BYTES) + record[:SPLIT_BYTES]
+                out_fh.write(make_ts_packet(nvtk_mp42gpx.GPS_PID, head, True))
+                out_fh.write(make_ts_packet(nvtk_mp42gpx.GPS_PID,
+                                            b'\x03' + b'\x00' * 3 + record[SPLIT_BYTES:]))
+            else:
+                out_fh.write(make_ts_packet(nvtk_mp42gpx.GPS_PID,
+                                            PES_PRIVATE_2 + b'\x00' * 20 + record, True))
+    return count
+
+
+def get_args():
+    """ parsing arguments """
+    parser = argparse.ArgumentParser(
+        description='Writes synthetic Novatek MP4 and TS files with GPS data.')
+    parser.add_argument('directory', help='output directory.')
+    parser.add_argument('-t', metavar='seconds', type=float, default=180,
+                        help='duration of the clips (default 180).')
+    parser.add_argument('-g', metavar='rate', type=int, default=1,
+                        help='GPS fixes per second (default 1).')
+    parser.add_argument('-p', metavar='packets', type=int, default=DEFAULT_TS_PACKETS,
+                        help='dummy video packets per fix in the TS file (default %d).'
+                             % DEFAULT_TS_PACKETS)
+    parser.add_argument('-v', metavar='bytes', type=int, default=DEFAULT_VIDEO_RATE,
+                        help='dummy video bytes per second in the MP4 file (default %d).'
+                             % DEFAULT_VIDEO_RATE)
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    """ main function """
+    args = get_args()
+    os.makedirs(args.directory, exist_ok=True)
+    mp4_path = os.path.join(args.directory, 'synthetic.mp4')
+    ts_path = os.path.join(args.directory, 'synthetic.ts')
+    print("Wrote %d fixes to '%s'." % (make_mp4(mp4_path, args.t, args.g, args.v), mp4_path))
+    print("Wrote %d fixes to '%s'." % (make_ts(ts_path, args.t, args.g, args.p), ts_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,65 @@
 """ This script will crudely extract embedded GPS data from Novatek generated MP4/TS files. """
 
 import os
+import io
 import sys
 import argparse
+import bisect
+import collections
 import glob
+import itertools
+import mmap
+import re
 import struct
 import math
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, without it every payload is decoded on its own
+    np = None
+
+# upper limit for the 'moov' box read by probe_mp4, real A229 headers are well below 1MB
+MAX_MOOV_SIZE = 32 * 1024 * 1024
+# GPS atoms closer to each other than this many bytes are fetched with a single read
+GPS_READ_GAP = 64 * 1024
+# ...as long as the merged read does not grow beyond this
+GPS_READ_MAX = 4 * 1024 * 1024
+# the A{N,S}{E,W} marker of a Novatek payload, the greedy prefix makes a single
+# match() land on the last marker in the data (the same one the byte scan finds)
+GPS_MARKER_LAST = re.compile(b'(?s).*A[NS][EW]')
+# Novatek GPS record, starts 24 bytes before the A{N,S}{E,W} marker
+NOVATEK_RECORD = '<IIIIIIsssxffff'
+NOVATEK_RECORD_SIZE = struct.calcsize(NOVATEK_RECORD)
+# below this many payloads the numpy batch decoder is not worth its setup cost
+BATCH_MIN = 16
+# 'GPS ' atoms decoded per batch by iter_gps_data
+GPS_BATCH_ATOMS = 500
+# remove_outliers drops one fix of every pair of consecutive fixes that would need
+# more than this speed (m/s), the one farther from the median position of the
+# fixes within this time window (seconds) around it
+OUTLIER_SPEED = 1000
+OUTLIER_WINDOW = 300
+# epochs are whole seconds, fixes within the same second count as this far apart
+MIN_FIX_INTERVAL = 1.0
+# values gathered at once for the rolling median
+MEDIAN_CHUNK = 4 * 1024 * 1024
+# earth radius meters
+EARTH_R = 6.3781E6
+# seconds between the MP4 epoch (1904-01-01) and the unix epoch (1970-01-01)
+MP4_EPOCH_OFFSET = 2082844800
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# MPEG-TS packet size, sync byte and the PID the Novatek GPS packets are sent on
+TS_PACKET_SIZE = 188
+TS_SYNC = 0x47
+GPS_PID = 0x0300
+# TS packets read at once by the TS scanner
+TS_CHUNK_PACKETS = 4096
+# seconds between two looks at a TS file that is followed while being written
+FOLLOW_INTERVAL = 0.5
+DT_FORMAT = re.compile(r'(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)Z?$')
 
 
 def check_out_file(out_file, force):
@@ -72,6 +125,22 @@ def get_args():
                               'The \'-s f\' will sort the output by the file name. '
                               'The \'-s d\' will sort the output by the GPS date (default). '
                               'The \'-s n\' will not sort the output.'))
+    parser.add_argument('-j', metavar='jobs', type=int, default=1,
+                        help=('number of files processed in parallel by worker processes '
+                              '(default 1, 0 uses all CPU cores).'))
+    parser.add_argument('-F', metavar='idle', nargs='?', type=float, const=-1, default=None,
+                        help=('follow a TS file that is still being written and print new '
+                              'GPS data as it arrives; optionally stop after \'idle\' seconds '
+                              'without new data.'))
+    parser.add_argument('-c', metavar='cache', nargs='?', const='', default=None,
+                        help=('cache the decoded tracks and reuse them for files that did not '
+                              'change (optionally specify the cache directory).'))
+    parser.add_argument('-S', metavar='store', default=None,
+                        help=('append the decoded tracks to a columnar track store '
+                              '(directory, partitioned by vehicle and day) instead of writing '
+                              'GPX; clips that are already stored unchanged are skipped.'))
+    parser.add_argument('-V', metavar='vehicle', default='default',
+                        help='vehicle the tracks are stored under with \'-S\' (default: default).')
     try:
         args = parser.parse_args(sys.argv[1:])
         force = args.f
@@ -93,7 +162,9 @@ def get_args():
         if args.o and args.m:
             print(("Warning: '-m' is set: output file name will be derived from input file name,"
                    "'-o' will be ignored"))
-        if not args.m:
+        if args.F is not None or args.S is not None:
+            out_file = None
+        elif not args.m:
             out_file = args.o[0]
             if not check_out_file(out_file, force):
                 sys.exit(1)
@@ -103,24 +174,27 @@ def get_args():
         multiple = args.m
         deobfuscate = args.d
         del_outliers = args.e
+        jobs = args.j if args.j > 0 else (os.cpu_count() or 1)
+        cache = None
+        if args.c is not None:
+            import track_cache
+            cache = track_cache.TrackCache(args.c or None)
+        # None: do not follow, -1: follow without an idle timeout
+        follow = args.F
+        store = None
+        if args.S is not None:
+            import track_store
+            store = track_store.TrackStoreWriter(args.S, args.V)
         in_file = check_in_file(args.i)
 
     except TypeError:
         parser.print_help()
         sys.exit(1)
-    return in_file, out_file, force, multiple, deobfuscate, sort_by, del_outliers
-
-
-def fix_time(datetime):
-    """ time format manipulation -> YYYY-MM-DDTHH:mm:SSZ """
-    date = ("%d-%02d-%02dT%02d:%02d:%02dZ"
-            % ((datetime['Year'] + 2000),
-               int(datetime['Month']),
-               int(datetime['Day']),
-               int(datetime['Hour']),
-               int(datetime['Minute']),
-               int(datetime['Second'])))
-    return date
+    except ValueError as error:
+        print("ERROR: %s." % error)
+        sys.exit(1)
+    return (in_file, out_file, force, multiple, deobfuscate, sort_by, del_outliers,
+            jobs, cache, follow, store)
 
 
 def fix_coordinates(hemisphere, coordinate, deobfuscate=False):
@@ -169,8 +243,8 @@ def deobfuscate_coord(latitude, longitude):
     return latitude, longitude
 
 
-def get_gps_offset(data):
-    """ finds gps payload position within the data backet """
+def scan_gps_offset(data):
+    """ finds gps payload position within the data backet (byte by byte) """
     # start at the end with 20 bytes allowed for trailing data
     pointer = len(data) - 20
     beginning = 0
@@ -193,52 +267,179 @@ def get_gps_offset(data):
     return offset
 
 
+def get_gps_offset(data):
+    """ finds gps payload position within the data backet """
+    # the marker must start after the first byte and leave 20 bytes of trailing data,
+    # ie. it is searched within data[1:len(data) - 17]
+    end = len(data) - 17
+    if end < 4:
+        return -1
+    try:
+        found = GPS_MARKER_LAST.match(data, 1, end)
+    except TypeError:
+        # not a buffer the re module understands
+        return scan_gps_offset(data)
+    if not found:
+        return -1
+    # the A{N,S}{E,W} is 24 bytes away from the beginning of the data packet
+    return found.end() - 3 - 24
+
+
+def days_from_civil(year, month, day):
+    """ number of days between 1970-01-01 and the given (proleptic gregorian) date """
+    # http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def is_leap_year(year):
+    """ gregorian leap year rule """
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def get_epoch(year, month, day, hour, minute, second):
+    """ UTC epoch of the given date/time fields, with plain integer arithmetic;
+    raises ValueError for impossible dates (as the strptime based parsing did) """
+    if not (1 <= year <= 9999 and 1 <= month <= 12):
+        raise ValueError("invalid date %s-%s-%s" % (year, month, day))
+    days_in_month = DAYS_IN_MONTH[month - 1] + (month == 2 and is_leap_year(year))
+    if not (1 <= day <= days_in_month and 0 <= hour < 24 and 0 <= minute < 60
+            and 0 <= second < 62):
+        raise ValueError("invalid date/time %s-%s-%sT%s:%s:%s"
+                         % (year, month, day, hour, minute, second))
+    return (days_from_civil(year, month, day) * 86400
+            + hour * 3600 + minute * 60 + second)
+
+
 def convert_to_epoch(datetime):
-    """ converts the 'datetime' to the epoch time """
-    # 2021-01-09T21:16:27Z -> %Y-%m-%dT%H:%M:%SZ
-    # Assuming the timezone always Z.
-    time_struct = time.strptime(datetime[:-1] + 'UTC', "%Y-%m-%dT%H:%M:%S%Z")
-    # Warning: the 'epoch' will not be in the UTC, due to limitation of the mktime
-    # this is is not important as the epoch is only used for sorting and it will
-    # work as long as it is internally consistent.
-    # I decided to stick to time (as opposed to datetime) for compatibility reasons
-    # as datetime might not be available on all systems.
-    epoch = int(time.mktime(time_struct))
-    return epoch
-
-
-def decode_azdome(gps, data):
+    """ converts the 'datetime' (eg: 2021-01-09T21:16:27Z) to the UTC epoch time """
+    found = DT_FORMAT.match(datetime)
+    if not found:
+        raise ValueError("unsupported date/time format '%s'" % datetime)
+    return get_epoch(*[int(value) for value in found.groups()])
+
+
+class GpsFix(object):
+    """ a single decoded GPS fix, with the date/time already split into integers
+    (full year) and the coordinates as raw values, hemispheres and signed floats """
+    __slots__ = ('epoch', 'year', 'month', 'day', 'hour', 'minute', 'second',
+                 'lat_hemi', 'lat_raw', 'lat', 'lon_hemi', 'lon_raw', 'lon',
+                 'speed', 'bearing')
+
+    def __init__(self, year, month, day, hour, minute, second,
+                 lat_hemi, lat_raw, lat, lon_hemi, lon_raw, lon, speed, bearing, epoch=None):
+        self.year = year
+        self.month = month
+        self.day = day
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+        self.lat_hemi = lat_hemi
+        self.lat_raw = lat_raw
+        self.lat = lat
+        self.lon_hemi = lon_hemi
+        self.lon_raw = lon_raw
+        self.lon = lon
+        self.speed = speed
+        self.bearing = bearing
+        self.epoch = epoch
+
+    @property
+    def dt(self):
+        """ the date/time as YYYY-MM-DDTHH:mm:SSZ, only formatted when needed """
+        return ("%d-%02d-%02dT%02d:%02d:%02dZ"
+                % (self.year, self.month, self.day, self.hour, self.minute, self.second))
+
+    def __repr__(self):
+        return "GpsFix(%s, %f, %f, %f, %f)" % (self.dt, self.lat, self.lon,
+                                               self.speed, self.bearing)
+
+    def as_dict(self):
+        """ returns the fix in the nested dict format used by older versions of the script """
+        return {
+            'Epoch': self.epoch,
+            'DT': {
+                'Year': self.year - 2000,
+                'Month': self.month,
+                'Day': self.day,
+                'Hour': self.hour,
+                'Minute': self.minute,
+                'Second': self.second,
+                'DT': self.dt,
+            },
+            'Loc': {
+                'Lat': {
+                    'Raw': self.lat_raw,
+                    'Hemi': self.lat_hemi,
+                    'Float': self.lat,
+                },
+                'Lon': {
+                    'Raw': self.lon_raw,
+                    'Hemi': self.lon_hemi,
+                    'Float': self.lon,
+                },
+                'Speed': self.speed,
+                'Bearing': self.bearing,
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, gps):
+        """ builds a fix from the nested dict format (see as_dict) """
+        date = gps['DT']
+        loc = gps['Loc']
+        return cls(int(date['Year']) + 2000, int(date['Month']), int(date['Day']),
+                   int(date['Hour']), int(date['Minute']), int(date['Second']),
+                   loc['Lat']['Hemi'], loc['Lat']['Raw'], loc['Lat']['Float'],
+                   loc['Lon']['Hemi'], loc['Lon']['Raw'], loc['Lon']['Float'],
+                   loc['Speed'], loc['Bearing'], gps['Epoch'])
+
+
+def fixes_as_dicts(gps_data):
+    """ compatibility adapter: converts a list of GpsFix to the nested dict format """
+    return [gps.as_dict() if gps else gps for gps in gps_data]
+
+
+def as_fix(gps):
+    """ compatibility adapter: returns the GpsFix of a fix given as GpsFix or in the
+    nested dict format of older versions, None stays None; anything else is an error """
+    if isinstance(gps, dict):
+        return GpsFix.from_dict(gps)
+    # not isinstance(): run as a script this module is __main__, while the cache
+    # and the worker processes build their fixes with the nvtk_mp42gpx.GpsFix class
+    if gps is None or type(gps).__name__ == 'GpsFix':
+        return gps
+    raise TypeError("unsupported GPS data point: %r" % (gps,))
+
+
+def decode_azdome(data):
     """ decodes azdome specific payload """
     payload = []
     # really crude XOR decryptor
     for index in range(len(data)):
         payload.append(chr(struct.unpack_from('>B', data, index)[0] ^ 0xAA))
     try:
-        gps['DT']['Year'] = ''.join(payload[14:18])
-        gps['DT']['Month'] = ''.join(payload[18:20])
-        gps['DT']['Day'] = ''.join(payload[20:22])
-        gps['DT']['Hour'] = ''.join(payload[22:24])
-        gps['DT']['Minute'] = ''.join(payload[24:26])
-        gps['DT']['Second'] = ''.join(payload[26:28])
-        gps['DT']['DT'] = "%s-%s-%sT%s:%s:%sZ" % (
-            gps['DT']['Year'],
-            gps['DT']['Month'],
-            gps['DT']['Day'],
-            gps['DT']['Hour'],
-            gps['DT']['Minute'],
-            gps['DT']['Second'])
-        gps['Loc']['Lat']['Raw'] = float(''.join(payload[45:53])) / 10000
-        gps['Loc']['Lat']['Hemi'] = payload[44]
-        gps['Loc']['Lon']['Raw'] = float(''.join(payload[54:62])) / 1000
-        gps['Loc']['Lon']['Hemi'] = payload[53]
-        gps['Loc']['Lat']['Float'] = fix_coordinates(
-            gps['Loc']['Lat']['Hemi'], gps['Loc']['Lat']['Raw'])
-        gps['Loc']['Lon']['Float'] = fix_coordinates(
-            gps['Loc']['Lon']['Hemi'], gps['Loc']['Lon']['Raw'])
-        # speed is not as accurate as it could be, only -1/+0 km/h.
-        gps['Loc']['Speed'] = float(''.join(payload[69:71])) / 3.6
-        # no bearing data
-        gps['Loc']['Bearing'] = 0
+        lat_raw = float(''.join(payload[45:53])) / 10000
+        lat_hemi = payload[44]
+        lon_raw = float(''.join(payload[54:62])) / 1000
+        lon_hemi = payload[53]
+        gps = GpsFix(
+            int(''.join(payload[14:18])),
+            int(''.join(payload[18:20])),
+            int(''.join(payload[20:22])),
+            int(''.join(payload[22:24])),
+            int(''.join(payload[24:26])),
+            int(''.join(payload[26:28])),
+            lat_hemi, lat_raw, fix_coordinates(lat_hemi, lat_raw),
+            lon_hemi, lon_raw, fix_coordinates(lon_hemi, lon_raw),
+            # speed is not as accurate as it could be, only -1/+0 km/h.
+            float(''.join(payload[69:71])) / 3.6,
+            # no bearing data
+            0)
     except ValueError:
         # skipping "bad" payload
         return None
@@ -247,102 +448,195 @@ def decode_azdome(gps, data):
 
 def get_gps_data(data, deobfuscate):
     """ gets gps data from a trimmed packet payload """
-    gps = {
-        'Epoch': None,
-        'DT': {
-            'Year': None,
-            'Month': None,
-            'Day': None,
-            'Hour': None,
-            'Minute': None,
-            'Second': None,
-            'DT': None
-        },
-        'Loc': {
-            'Lat': {
-                'Raw': None,
-                'Hemi': None,
-                'Float': None,
-            },
-            'Lon': {
-                'Raw': None,
-                'Hemi': None,
-                'Float': None,
-            },
-            'Speed': None,
-            'Bearing': None,
-        },
-    }
     offset = get_gps_offset(data)
     # in python3 data[0] is an int and in python2 data[0] is a str...
     # to make the script version agnostic one uses struct.upack as char
     azdome = False
     if struct.unpack_from('>c', data)[0] in [b'\x05', b'\xF0']:
-        out = decode_azdome(gps, data)
-        if out:
-            gps = out
-            azdome = True
+        azdome = decode_azdome(data) is not None
 
     if not azdome and offset >= 0:
 
         # Added Bearing as per RetiredTechie contribuition:
         # http://retiredtechie.fitchfamily.org/2018/05/13/dashcam-openstreetmap-mapping/
 
-        gps['DT']['Hour'], gps['DT']['Minute'], gps['DT']['Second'] = struct.unpack_from(
-            '<III', data, offset)
-        offset = offset + (3 * 4)
-        gps['DT']['Year'], gps['DT']['Month'], gps['DT']['Day'] = struct.unpack_from(
-            '<III', data, offset)
-        offset = offset + (3 * 4)
-        active, gps['Loc']['Lat']['Hemi'], gps['Loc']['Lon']['Hemi'] = struct.unpack_from(
-            '<sss', data, offset)
-        offset = offset + 4  # 3bytes for '<sss' and 1byte for an unkown char
-        gps['Loc']['Lat']['Raw'], gps['Loc']['Lon']['Raw'] = struct.unpack_from(
-            '<ff', data, offset)
-        offset = offset + (2 * 4)
-        gps['Loc']['Speed'], gps['Loc']['Bearing'] = struct.unpack_from(
-            '<ff', data, offset)
+        (hour, minute, second, year, month, day, active, lat_hemi, lon_hemi,
+         lat_raw, lon_raw, speed, bearing) = struct.unpack_from(
+             # 3bytes for '<sss' and 1byte for an unkown char
+             '<IIIIIIsssxffff', data, offset)
 
         try:
             active = active.decode()
-            gps['Loc']['Lat']['Hemi'] = gps['Loc']['Lat']['Hemi'].decode()
-            gps['Loc']['Lon']['Hemi'] = gps['Loc']['Lon']['Hemi'].decode()
+            lat_hemi = lat_hemi.decode()
+            lon_hemi = lon_hemi.decode()
 
         except UnicodeDecodeError as error:
             print("Skipping: garbage data. Error: %s." % str(error))
             return None
 
         if deobfuscate:
-            gps['Loc']['Lat']['Raw'], gps['Loc']['Lon']['Raw'] = deobfuscate_coord(
-                gps['Loc']['Lat']['Raw'], gps['Loc']['Lon']['Raw'])
-
-        gps['Loc']['Lat']['Float'] = fix_coordinates(
-            gps['Loc']['Lat']['Hemi'], gps['Loc']['Lat']['Raw'], deobfuscate)
-        gps['Loc']['Lon']['Float'] = fix_coordinates(
-            gps['Loc']['Lon']['Hemi'], gps['Loc']['Lon']['Raw'], deobfuscate)
-        gps['Loc']['Speed'] = fix_speed(gps['Loc']['Speed'])
-        gps['DT']['DT'] = fix_time(gps['DT'])
+            lat_raw, lon_raw = deobfuscate_coord(lat_raw, lon_raw)
+
+        gps = GpsFix(year + 2000, month, day, hour, minute, second,
+                     lat_hemi, lat_raw, fix_coordinates(lat_hemi, lat_raw, deobfuscate),
+                     lon_hemi, lon_raw, fix_coordinates(lon_hemi, lon_raw, deobfuscate),
+                     fix_speed(speed), bearing)
     else:
         return None
     try:
-        gps['Epoch'] = convert_to_epoch(gps['DT']['DT'])
+        gps.epoch = get_epoch(gps.year, gps.month, gps.day, gps.hour, gps.minute, gps.second)
     except ValueError:
         return None
 
     return gps
 
 
-def get_gps_atom(gps_atom_info, in_fh, deobfuscate):
-    """ gets payload from a 'free' atom type and checks if it is there is a 'GPS ' payload """
+class GpsTrack(object):
+    """ columnar (numpy arrays) version of a list of GpsFix, one array per GpsFix field """
+    __slots__ = ('epoch', 'year', 'month', 'day', 'hour', 'minute', 'second',
+                 'lat_hemi', 'lat_raw', 'lat', 'lon_hemi', 'lon_raw', 'lon',
+                 'speed', 'bearing')
+
+    def __init__(self, **columns):
+        for name in self.__slots__:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def __iter__(self):
+        return self.fixes()
+
+    def fixes(self):
+        """ yields the track as GpsFix records """
+        columns = [getattr(self, name).tolist() for name in self.__slots__]
+        for (epoch, year, month, day, hour, minute, second, lat_hemi, lat_raw, lat,
+             lon_hemi, lon_raw, lon, speed, bearing) in zip(*columns):
+            yield GpsFix(year, month, day, hour, minute, second, lat_hemi, lat_raw, lat,
+                         lon_hemi, lon_raw, lon, speed, bearing, epoch)
+
+
+def get_novatek_dtype():
+    """ numpy structured dtype matching NOVATEK_RECORD """
+    return np.dtype({
+        'names': ['hour', 'minute', 'second', 'year', 'month', 'day',
+                  'active', 'lat_hemi', 'lon_hemi', 'lat_raw', 'lon_raw', 'speed', 'bearing'],
+        'formats': ['<u4', '<u4', '<u4', '<u4', '<u4', '<u4',
+                    'S1', 'S1', 'S1', '<f4', '<f4', '<f4', '<f4'],
+        'offsets': [0, 4, 8, 12, 16, 20, 24, 25, 26, 28, 32, 36, 40],
+        'itemsize': NOVATEK_RECORD_SIZE,
+    })
+
+
+def get_epochs(year, month, day, hour, minute, second):
+    """ get_epoch for whole (int64) columns, returns (epochs, valid mask) """
+    valid = ((year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12)
+             & (hour >= 0) & (hour < 24) & (minute >= 0) & (minute < 60)
+             & (second >= 0) & (second < 62))
+    # impossible months are replaced so the lookups below stay in range
+    month = np.where(valid, month, 1)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month = np.array(DAYS_IN_MONTH, dtype=np.int64)[month - 1] + (leap & (month == 2))
+    valid &= (day >= 1) & (day <= days_in_month)
+    # days_from_civil
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    epochs = days * 86400 + hour * 3600 + minute * 60 + second
+    return epochs, valid
+
+
+def decode_gps_batch(payloads, deobfuscate):
+    """ decodes all Novatek payloads at once with a numpy structured dtype, returns
+    (GpsTrack, indexes) where indexes maps the track rows back to the payloads;
+    payloads it can not handle (azdome, no marker, bad date) are left out """
+    records = bytearray()
+    indexes = []
+    for index, payload in enumerate(payloads):
+        if payload is None or payload[:1] in (b'\x05', b'\xF0'):
+            continue
+        offset = get_gps_offset(payload)
+        if offset < 0:
+            continue
+        records += payload[offset:offset + NOVATEK_RECORD_SIZE]
+        indexes.append(index)
+    raw = np.frombuffer(bytes(records), dtype=get_novatek_dtype())
+
+    lat_raw = raw['lat_raw'].astype(np.float64)
+    lon_raw = raw['lon_raw'].astype(np.float64)
+    if deobfuscate:
+        lat_raw, lon_raw = deobfuscate_coord(lat_raw, lon_raw)
+    lat, lon = lat_raw, lon_raw
+    if not deobfuscate:
+        # same as fix_coordinates(): DDDmm.mmmm -> DDD.dddd
+        lat_minutes = np.mod(lat, 100.0)
+        lon_minutes = np.mod(lon, 100.0)
+        lat = (lat - lat_minutes) / 100.0 + (lat_minutes / 60.0)
+        lon = (lon - lon_minutes) / 100.0 + (lon_minutes / 60.0)
+    # the locator only accepts A[NS][EW] so the hemispheres are always valid
+    lat_hemi = raw['lat_hemi'].astype('U1')
+    lon_hemi = raw['lon_hemi'].astype('U1')
+    lat = np.where(lat_hemi == 'S', -lat, lat)
+    lon = np.where(lon_hemi == 'W', -lon, lon)
+
+    year = raw['year'].astype(np.int64) + 2000
+    columns = {
+        'year': year,
+        'month': raw['month'].astype(np.int64),
+        'day': raw['day'].astype(np.int64),
+        'hour': raw['hour'].astype(np.int64),
+        'minute': raw['minute'].astype(np.int64),
+        'second': raw['second'].astype(np.int64),
+    }
+    epoch, valid = get_epochs(columns['year'], columns['month'], columns['day'],
+                              columns['hour'], columns['minute'], columns['second'])
+    columns.update({
+        'epoch': epoch,
+        'lat_hemi': lat_hemi,
+        'lat_raw': lat_raw,
+        'lat': lat,
+        'lon_hemi': lon_hemi,
+        'lon_raw': lon_raw,
+        'lon': lon,
+        'speed': fix_speed(raw['speed'].astype(np.float64)),
+        'bearing': raw['bearing'].astype(np.float64),
+    })
+    if not valid.all():
+        columns = {name: column[valid] for name, column in columns.items()}
+        indexes = [index for index, keep in zip(indexes, valid.tolist()) if keep]
+    return GpsTrack(**columns), indexes
+
+
+def decode_gps_payloads(payloads, deobfuscate):
+    """ decodes a list of payloads (None entries stay None) into GpsFix records,
+    uses the batch decoder when numpy is available and falls back to get_gps_data """
+    gps_data = [None] * len(payloads)
+    pending = range(len(payloads))
+    if np is not None and len(payloads) >= BATCH_MIN:
+        track, indexes = decode_gps_batch(payloads, deobfuscate)
+        for index, gps in zip(indexes, track.fixes()):
+            gps_data[index] = gps
+        done = set(indexes)
+        pending = [index for index in pending if index not in done]
+    for index in pending:
+        if payloads[index] is not None:
+            gps_data[index] = get_gps_data(payloads[index], deobfuscate)
+    return gps_data
+
+
+def get_gps_payload(gps_atom_info, data):
+    """ checks the 'free' atom header of the given atom data and returns its 'GPS ' payload """
     atom_pos, atom_size = gps_atom_info
-    if atom_size == 0 or atom_pos == 0:
-        print("Error! skipping atom at %x atom size:%d!" % (int(atom_pos), atom_size))
-        return None
-    in_fh.seek(atom_pos)
-    data = in_fh.read(atom_size)
     expected_type = 'free'
     expected_magic = 'GPS '
-    atom_size1, atom_type, magic = struct.unpack_from('>I4s4s', data)
+    try:
+        atom_size1, atom_type, magic = struct.unpack_from('>I4s4s', data)
+    except struct.error:
+        print("Error! skipping truncated atom at %x atom size:%d!" % (int(atom_pos), atom_size))
+        return None
     try:
         atom_type = atom_type.decode()
         magic = magic.decode()
@@ -358,93 +652,354 @@ def get_gps_atom(gps_atom_info, in_fh, deobfuscate):
         print("Skipping: garbage atom type or magic. Error: %s." % str(error))
         return None
 
-    out = get_gps_data(data[12:], deobfuscate)
-    return out
+    return data[12:]
+
+
+def coalesce_ranges(ranges, max_gap=GPS_READ_GAP, max_read=GPS_READ_MAX):
+    """ sorts the (position, size) ranges and merges the ones less than max_gap bytes apart,
+    returns a list of (start, end, [indexes into ranges]) reads """
+    reads = []
+    for index in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        pos, size = ranges[index]
+        end = pos + size
+        if reads:
+            start, last_end, indexes = reads[-1]
+            if pos - last_end <= max_gap and max(end, last_end) - start <= max_read:
+                reads[-1] = start, max(end, last_end), indexes
+                indexes.append(index)
+                continue
+        reads.append((pos, end, [index]))
+    return reads
+
+
+def get_gps_atoms(gps_atom_infos, in_fh, deobfuscate, max_gap=GPS_READ_GAP):
+    """ decodes the 'GPS ' payloads of the atoms of a 'gps ' chunk index, fetched with
+    a few large sequential reads; the output keeps the order of the index """
+    payloads = [None] * len(gps_atom_infos)
+    valid = []
+    for index, (atom_pos, atom_size) in enumerate(gps_atom_infos):
+        if atom_size == 0 or atom_pos == 0:
+            print("Error! skipping atom at %x atom size:%d!" % (int(atom_pos), atom_size))
+        else:
+            valid.append(index)
+    reads = coalesce_ranges([gps_atom_infos[index] for index in valid], max_gap)
+    for start, end, indexes in reads:
+        in_fh.seek(start, 0)
+        chunk = memoryview(in_fh.read(end - start))
+        for index in indexes:
+            atom_pos, atom_size = gps_atom_infos[valid[index]]
+            payload = get_gps_payload(gps_atom_infos[valid[index]],
+                                      chunk[atom_pos - start:atom_pos - start + atom_size])
+            if payload is not None:
+                # copy the few bytes needed so the chunk can be dropped right away
+                payloads[valid[index]] = payload.tobytes()
+    return decode_gps_payloads(payloads, deobfuscate)
+
+
+def get_gps_payloads_from_buffer(gps_atom_infos, buf):
+    """ slices the 'GPS ' payloads of the listed atoms out of a memoryview without copying,
+    the caller has to release() the returned views """
+    payloads = []
+    for atom_pos, atom_size in gps_atom_infos:
+        if atom_size == 0 or atom_pos == 0:
+            print("Error! skipping atom at %x atom size:%d!" % (int(atom_pos), atom_size))
+            payloads.append(None)
+            continue
+        data = buf[atom_pos:atom_pos + atom_size]
+        payload = get_gps_payload((atom_pos, atom_size), data)
+        data.release()
+        payloads.append(payload)
+    return payloads
+
+
+def write_gpx(gps_data, out_fh, out_file):
+    """ streams GPX formatted data of the given GPS data (any iterable) into an open
+    text file handle, returns the number of track points written """
+    out_fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<gpx version="1.0"\n'
+                 '\tcreator="Sergei\'s Novatek MP4 GPS parser"\n'
+                 '\txmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
+                 '\txmlns="http://www.topografix.com/GPX/1/0"\n'
+                 '\txsi:schemaLocation="http://www.topografix.com/GPX/1/0 '
+                 'http://www.topografix.com/GPX/1/0/gpx.xsd">\n')
+    out_fh.write("\t<name>%s</name>\n" % out_file)
+    out_fh.write('\t<url>sergei.nz</url>\n')
+    out_fh.write("\t<trk><name>%s</name><trkseg>\n" % out_file)
+    count = 0
+    for gps in gps_data:
+        if gps:
+            gps = as_fix(gps)
+            out_fh.write("\t\t<trkpt lat=\"%f\" lon=\"%f\"><time>%s</time>"
+                         "<speed>%f</speed><course>%f</course></trkpt>\n"
+                         % (gps.lat, gps.lon, gps.dt, gps.speed, gps.bearing))
+            count += 1
+    out_fh.write('\t</trkseg></trk>\n'
+                 '</gpx>\n')
+    return count
 
 
 def generate_gpx(gps_data, out_file):
     """ generates GPX formatted data from given GPS data """
-    gpx = ('<?xml version="1.0" encoding="UTF-8"?>\n'
-           '<gpx version="1.0"\n'
-           '\tcreator="Sergei\'s Novatek MP4 GPS parser"\n'
-           '\txmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
-           '\txmlns="http://www.topografix.com/GPX/1/0"\n'
-           '\txsi:schemaLocation="http://www.topografix.com/GPX/1/0 '
-           'http://www.topografix.com/GPX/1/0/gpx.xsd">\n')
-    gpx += "\t<name>%s</name>\n" % out_file
-    gpx += '\t<url>sergei.nz</url>\n'
-    gpx += "\t<trk><name>%s</name><trkseg>\n" % out_file
-    for gps in gps_data:
-        if gps:
-            gpx += ("\t\t<trkpt lat=\"%f\" lon=\"%f\"><time>%s</time>"
-                    % (gps['Loc']['Lat']['Float'],
-                       gps['Loc']['Lon']['Float'],
-                       gps['DT']['DT']))
+    gpx = io.StringIO()
+    write_gpx(gps_data, gpx, out_file)
+    return gpx.getvalue()
+
+
+def get_pid_pattern(pid):
+    """ regex matching the sync byte and PID of a TS packet header
+    (with or without the payload unit start indicator) """
+    high = pid >> 8 & 0x1F
+    return re.compile(b'\\x47[' + re.escape(bytes([high])) + re.escape(bytes([high | 0x40]))
+                      + b']' + re.escape(bytes([pid & 0xFF])))
+
+
+class TsScanner(object):
+    """ incremental MPEG-TS scanner, feed() it chunks of the stream and it returns
+    the GPS data found in the packets of the given PID """
+
+    def __init__(self, deobfuscate, pid=GPS_PID):
+        self.deobfuscate = deobfuscate
+        self.pid_pattern = get_pid_pattern(pid)
+        # bytes of an incomplete packet (or of a resync) waiting for the next chunk
+        self.pending = b''
+        # stream offset of the first byte of self.pending
+        self.offset = 0
+        self.partial = b''
+
+    def feed(self, data):
+        """ scans the complete packets of pending + data, keeps the incomplete rest """
+        buf = self.pending + data if self.pending else data
+        gps_data = []
+        pos = self.scan(buf, gps_data, False)
+        self.pending = buf[pos:]
+        self.offset += pos
+        return gps_data
 
-            gpx += ("<speed>%f</speed><course>%f</course></trkpt>\n"
-                    % (gps['Loc']['Speed'],
-                       gps['Loc']['Bearing']))
-    gpx += ('\t</trkseg></trk>\n'
-            '</gpx>\n')
-    return gpx
+    def finish(self):
+        """ scans what is left at the end of the stream (incomplete packets are dropped) """
+        gps_data = []
+        pos = self.scan(self.pending, gps_data, True)
+        self.offset += len(self.pending)
+        self.pending = b''
+        return gps_data
 
+    def scan(self, buf, gps_data, final):
+        """ processes the packets in buf, returns the position of the first unprocessed byte """
+        pos = 0
+        while len(buf) - pos >= TS_PACKET_SIZE:
+            count = (len(buf) - pos) // TS_PACKET_SIZE
+            end = pos + count * TS_PACKET_SIZE
+            # all sync bytes of the chunk are checked at once
+            syncs = buf[pos:end:TS_PACKET_SIZE]
+            synced = len(syncs) - len(syncs.lstrip(b'G'))
+            if synced:
+                self.scan_packets(buf, pos, pos + synced * TS_PACKET_SIZE, gps_data)
+                pos += synced * TS_PACKET_SIZE
+                continue
+            # lost sync, look for the next 'G' followed by two more 188 bytes apart
+            resync = self.find_sync(buf, pos + 1, final)
+            if resync < 0:
+                if final:
+                    return len(buf)
+                # every candidate before the last two packets' worth of bytes was checked
+                # and rejected, only a candidate in that tail can still need more data;
+                # the rest is dropped so garbage does not pile up in self.pending
+                return max(pos, len(buf) - 2 * TS_PACKET_SIZE)
+            print("\tResynchronised TS stream at %x (skipped %d bytes)."
+                  % (self.offset + resync, resync - pos))
+            pos = resync
+        return pos
+
+    @staticmethod
+    def find_sync(buf, start, final):
+        """ position of the next sync byte that is followed by two more, -1 if more data
+        is needed (or when final, if there is none) """
+        pos = buf.find(b'G', start)
+        while pos >= 0:
+            checks = [pos + TS_PACKET_SIZE, pos + 2 * TS_PACKET_SIZE]
+            if not final and checks[-1] >= len(buf):
+                return -1
+            if all(buf[check] == TS_SYNC for check in checks if check < len(buf)):
+                return pos
+            pos = buf.find(b'G', pos + 1)
+        return -1
 
-def parse_ts(in_fh, deobfuscate):
-    """ crude TS parser """
-    gps_data = []
-    is_ts = False
-    # Testing for 'G' sync header every 188 bytes 3 times
+    def scan_packets(self, buf, start, end, gps_data):
+        """ handles the GPS packets in buf[start:end], which holds only aligned packets """
+        for found in self.pid_pattern.finditer(buf, start, end):
+            pos = found.start()
+            if (pos - start) % TS_PACKET_SIZE:
+                # the PID pattern matched inside of a payload
+                continue
+            frame = buf[pos + 4:pos + TS_PACKET_SIZE]
+            # 0x000001 = Beginning of the PES header, 0xBF = Private Stream 2,
+            # navigational data;
+            # see http://dvd.sourceforge.net/dvdinfo/pes-hdr.html
+            # this whole nonsense with partial variable is because of malicious
+            # and purposeful data obfuscation on B4K cameras.
+            if frame[:4] == b'\x00\x00\x01\xbf':
+                data = get_gps_data(frame, self.deobfuscate)
+                if data:
+                    gps_data.append(data)
+                else:
+                    self.partial = frame[-14:]
+            elif self.partial:
+                jump = struct.unpack_from('<B', frame)[0] + 1
+                data = get_gps_data(self.partial + frame[jump:], self.deobfuscate)
+                gps_data.append(data)
+                self.partial = b''
+
+
+def is_ts_file(in_fh):
+    """ tests for the 'G' sync byte every 188 bytes 3 times """
     # to make sure we have TS stream here.
     # It is possible to drop this test entirely,
     # as subsequent tests will catch out garbage data
     in_fh.seek(0, 0)
     test_sync_1 = in_fh.read(1)
-    in_fh.seek(188, 0)
+    in_fh.seek(TS_PACKET_SIZE, 0)
     test_sync_2 = in_fh.read(1)
-    in_fh.seek(376, 0)
+    in_fh.seek(2 * TS_PACKET_SIZE, 0)
     test_sync_3 = in_fh.read(1)
-    if test_sync_1 == test_sync_2 == test_sync_3 == b'G':
-        is_ts = True
+    return test_sync_1 == test_sync_2 == test_sync_3 == b'G'
+
+
+def parse_ts(in_fh, deobfuscate):
+    """ crude TS parser, reads the stream in large chunks and only looks at the GPS packets """
+    gps_data = []
+    is_ts = is_ts_file(in_fh)
+    if is_ts:
         in_fh.seek(0, 0)
-        position = 0
-        partial = ''
+        scanner = TsScanner(deobfuscate)
         while True:
-            header = in_fh.read(4)
-            if header[1:3] in [b'C\x00', b'\x03\x00']:
-                frame = in_fh.read(184)
-                # 0x000001 = Beginning of the PES header, 0xBF = Private Stream 2,
-                # navigational data;
-                # see http://dvd.sourceforge.net/dvdinfo/pes-hdr.html
-                # this whole nonsense with partial variable is because of malicious
-                # and purposeful data obfuscation on B4K cameras.
-                if frame[:4] == b'\x00\x00\x01\xbf':
-                    data = get_gps_data(frame, deobfuscate)
-                    if data:
-                        gps_data.append(data)
-                    else:
-                        partial = frame[-14:]
-                else:
-                    if partial:
-                        # note due to weirdness of python3+ if I just
-                        # struct.unpack('<B', frame[0]) it blows up
-                        # while in python2.7 it works.
-                        # for some silly reason frame[0] is an int in python3+.
-                        jump = struct.unpack_from('<B', frame[:1])[0] + 1
-                        data = get_gps_data(partial + frame[jump:], deobfuscate)
-                        gps_data.append(data)
-                        partial = ''
-            position += 188
-            in_fh.seek(position, 0)
-            if not header:
+            chunk = in_fh.read(TS_PACKET_SIZE * TS_CHUNK_PACKETS)
+            if not chunk:
                 break
+            gps_data += scanner.feed(chunk)
+        gps_data += scanner.finish()
     return gps_data, is_ts
 
 
-def parse_moov(in_fh, deobfuscate):
-    """ crude MP4/MOV (moov) parser """
+class TsFollower(object):
+    """ follows a TS file that is still being written (like 'tail -f'), the offset of
+    the first unprocessed packet can be stored and passed back in to resume later """
+
+    def __init__(self, in_file, deobfuscate, offset=0):
+        self.in_file = in_file
+        self.scanner = TsScanner(deobfuscate)
+        self.scanner.offset = offset
+
+    @property
+    def offset(self):
+        """ offset of the first packet that has not been processed yet """
+        return self.scanner.offset
+
+    def poll(self):
+        """ returns the fixes written since the last call, without waiting """
+        gps_data = []
+        with open(self.in_file, 'rb') as in_fh:
+            in_fh.seek(0, 2)
+            size = in_fh.tell()
+            read_from = self.scanner.offset + len(self.scanner.pending)
+            if size < read_from:
+                print("\tFile '%s' was truncated, starting over." % self.in_file)
+                self.scanner = TsScanner(self.scanner.deobfuscate)
+                read_from = 0
+            in_fh.seek(read_from, 0)
+            while True:
+                # incomplete packets at the end are held back by the scanner
+                chunk = in_fh.read(TS_PACKET_SIZE * TS_CHUNK_PACKETS)
+                if not chunk:
+                    break
+                gps_data += self.scanner.feed(chunk)
+        return [gps for gps in gps_data if gps]
+
+    def follow(self, interval=FOLLOW_INTERVAL, idle_timeout=None):
+        """ yields new fixes as they are written, with at most 'interval' seconds of delay;
+        stops after idle_timeout seconds without new fixes (None: never) """
+        last_fix = time.time()
+        while True:
+            gps_data = self.poll()
+            for gps in gps_data:
+                yield gps
+            if gps_data:
+                last_fix = time.time()
+            elif idle_timeout is not None and time.time() - last_fix > idle_timeout:
+                return
+            time.sleep(interval)
+
+
+def follow_file(in_file, deobfuscate, idle_timeout=None):
+    """ prints the fixes of a TS file that is being written, one line per fix """
+    print("Following file '%s' (Ctrl+C to stop)..." % in_file)
+    follower = TsFollower(in_file, deobfuscate)
+    count = 0
+    try:
+        for gps in follower.follow(idle_timeout=idle_timeout):
+            print("%s %f %f %f %f" % (gps.dt, gps.lat, gps.lon, gps.speed, gps.bearing))
+            sys.stdout.flush()
+            count += 1
+    except KeyboardInterrupt:
+        pass
+    print("Stopped at offset %d after %d GPS data points." % (follower.offset, count))
+    return count > 0
+
+
+def map_file(in_fh):
+    """ memory-maps the given file handle read-only, returns None if that is not possible """
+    try:
+        return mmap.mmap(in_fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+        # no fileno (e.g. BytesIO), empty file, pipe or other non-seekable input
+        return None
+
+
+def parse_moov_buffer(buf, deobfuscate):
+    """ crude MP4/MOV (moov) parser working on a memoryview of the whole file """
     gps_data = []
     offset = 0
     is_moov = False
+    end = len(buf)
+    while offset + 8 <= end:
+        atom_size, atom_type = get_atom_info(buf[offset:offset + 8])
+        if atom_size == 0:
+            break
+
+        if atom_type == 'moov':
+            print("\tFound the 'moov' atom.")
+            is_moov = True
+            sub_offset = offset + 8
+            while sub_offset < (offset + atom_size) and sub_offset + 8 <= end:
+                sub_atom_size, sub_atom_type = get_atom_info(buf[sub_offset:sub_offset + 8])
+                if sub_atom_size < 8:
+                    break
+
+                if str(sub_atom_type) == 'gps ':
+                    print("\tFound the gps chunk descriptor atom.")
+                    gps_offset = 16 + sub_offset  # +16 = skip headers
+                    gps_end = min(sub_offset + sub_atom_size, end)
+                    gps_atom_infos = [get_gps_atom_info(buf[pos:pos + 8])
+                                      for pos in range(gps_offset, gps_end - 7, 8)]
+                    payloads = get_gps_payloads_from_buffer(gps_atom_infos, buf)
+                    try:
+                        gps_data += decode_gps_payloads(payloads, deobfuscate)
+                    finally:
+                        for payload in payloads:
+                            if payload is not None:
+                                payload.release()
+
+                sub_offset += sub_atom_size
+
+        offset += atom_size
+    return gps_data, is_moov
+
+
+def read_gps_index(in_fh):
+    """ reads the (position, size) entries of the 'gps ' chunk index atoms with plain
+    seek/read on the file handle, returns (entries, is_moov) """
+    gps_atom_infos = []
+    offset = 0
+    is_moov = False
     while True:
         atom_size, atom_type = get_atom_info(in_fh.read(8))
         if atom_size == 0:
@@ -461,34 +1016,260 @@ def parse_moov(in_fh, deobfuscate):
                     print("\tFound the gps chunk descriptor atom.")
                     gps_offset = 16 + sub_offset  # +16 = skip headers
                     in_fh.seek(gps_offset, 0)
-                    while gps_offset < (sub_offset + sub_atom_size):
-                        data = get_gps_atom(get_gps_atom_info(in_fh.read(8)), in_fh, deobfuscate)
-                        gps_data.append(data)
-                        gps_offset += 8
-                        in_fh.seek(gps_offset, 0)
+                    index = in_fh.read(max(sub_offset + sub_atom_size - gps_offset, 0))
+                    gps_atom_infos += [get_gps_atom_info(index[pos:pos + 8])
+                                       for pos in range(0, len(index) - 7, 8)]
 
                 sub_offset += sub_atom_size
                 in_fh.seek(sub_offset, 0)
 
         offset += atom_size
         in_fh.seek(offset, 0)
-    return gps_data, is_moov
+    return gps_atom_infos, is_moov
 
 
-def calculate_speed(coord_dt1, coord_dt2):
-    """ calculates speed based two sets of coordinates/datetimes """
+def parse_moov_fh(in_fh, deobfuscate, max_gap=GPS_READ_GAP):
+    """ crude MP4/MOV (moov) parser using plain seek/read on the file handle,
+    GPS payloads closer than max_gap bytes are fetched with a single read """
+    gps_atom_infos, is_moov = read_gps_index(in_fh)
+    return get_gps_atoms(gps_atom_infos, in_fh, deobfuscate, max_gap), is_moov
+
+
+def parse_moov(in_fh, deobfuscate, use_mmap=True, max_gap=GPS_READ_GAP):
+    """ crude MP4/MOV (moov) parser, memory-mapped when possible """
+    mapped = map_file(in_fh) if use_mmap else None
+    if mapped is None:
+        return parse_moov_fh(in_fh, deobfuscate, max_gap)
+    buf = memoryview(mapped)
+    try:
+        return parse_moov_buffer(buf, deobfuscate)
+    finally:
+        buf.release()
+        mapped.close()
+
+
+def find_atom(in_fh, wanted_type):
+    """ walks the top level atoms of the file and returns (body offset, body size) of the
+    first atom of the wanted type, or None if there is no such atom """
+    in_fh.seek(0, 2)
+    file_size = in_fh.tell()
+    offset = 0
+    while offset + 8 <= file_size:
+        in_fh.seek(offset, 0)
+        header = in_fh.read(8)
+        atom_size, atom_type = get_atom_info(header)
+        header_size = 8
+        if atom_size == 1:
+            # 64bit 'largesize' follows the type
+            atom_size = struct.unpack('>Q', in_fh.read(8))[0]
+            header_size = 16
+        elif atom_size == 0:
+            # atom extends to the end of the file
+            atom_size = file_size - offset
+        if atom_size < header_size:
+            break
+        if atom_type == wanted_type:
+            return offset + header_size, min(atom_size, file_size - offset) - header_size
+        offset += atom_size
+    return None
+
+
+def iter_atoms(buf, start, end):
+    """ yields (atom type, body start, atom end) for the atoms in buf[start:end] """
+    while start + 8 <= end:
+        atom_size, atom_type = get_atom_info(buf[start:start + 8])
+        header_size = 8
+        if atom_size == 1 and start + 16 <= end:
+            atom_size = struct.unpack_from('>Q', buf, start + 8)[0]
+            header_size = 16
+        elif atom_size == 0:
+            atom_size = end - start
+        if atom_size < header_size or start + atom_size > end:
+            break
+        yield atom_type, start + header_size, start + atom_size
+        start += atom_size
+
+
+def find_child(buf, start, end, path):
+    """ follows the given atom type path (eg: ['mdia', 'minf']) down from buf[start:end],
+    returns the (body start, atom end) of the last atom in the path or None """
+    for wanted_type in path:
+        for atom_type, body_start, atom_end in iter_atoms(buf, start, end):
+            if atom_type == wanted_type:
+                start, end = body_start, atom_end
+                break
+        else:
+            return None
+    return start, end
+
+
+def read_moov(in_fh, max_size=MAX_MOOV_SIZE):
+    """ reads just the 'moov' box body, returns None if missing or bigger than max_size """
+    found = find_atom(in_fh, 'moov')
+    if not found:
+        return None
+    moov_offset, moov_size = found
+    if moov_size > max_size:
+        print("Warning: 'moov' atom is %d bytes, larger than the %d bytes limit."
+              % (moov_size, max_size))
+        return None
+    in_fh.seek(moov_offset, 0)
+    return in_fh.read(moov_size)
+
+
+def get_time_header(buf, start):
+    """ decodes the (creation time, timescale, duration) of a 'mvhd' or 'mdhd' body """
+    version = struct.unpack_from('>B', buf, start)[0]
+    if version == 1:
+        creation_time, _, timescale, duration = struct.unpack_from('>QQIQ', buf, start + 4)
+    else:
+        creation_time, _, timescale, duration = struct.unpack_from('>IIII', buf, start + 4)
+    return creation_time, timescale, duration
+
+
+def get_video_trak(moov):
+    """ returns (body start, atom end) of the video 'trak', falls back to the first 'trak' """
+    first = None
+    for atom_type, body_start, atom_end in iter_atoms(moov, 0, len(moov)):
+        if atom_type != 'trak':
+            continue
+        if first is None:
+            first = body_start, atom_end
+        hdlr = find_child(moov, body_start, atom_end, ['mdia', 'hdlr'])
+        if hdlr and moov[hdlr[0] + 8:hdlr[0] + 12] == b'vide':
+            return body_start, atom_end
+    return first
+
+
+def get_sample_stats(moov, stts):
+    """ sums up the (sample count, total duration) of a 'stts' body """
+    start, end = stts
+    entry_count = struct.unpack_from('>I', moov, start + 4)[0]
+    entry_count = min(entry_count, (end - start - 8) // 8)
+    total_samples = 0
+    total_duration = 0
+    for index in range(entry_count):
+        sample_count, sample_duration = struct.unpack_from('>II', moov, start + 8 + index * 8)
+        total_samples += sample_count
+        total_duration += sample_count * sample_duration
+    return total_samples, total_duration
+
+
+def probe_mp4(in_fh, max_moov_size=MAX_MOOV_SIZE):
+    """ reads the container header only (the 'moov' box) and returns a dict with
+    the raw 'mvhd' creation time (seconds since 1904-01-01), timescale, duration
+    (in seconds) and the video frame rate; returns None if it is not a MP4/MOV file """
+    try:
+        moov = read_moov(in_fh, max_moov_size)
+        if not moov:
+            return None
+        mvhd = find_child(moov, 0, len(moov), ['mvhd'])
+        if not mvhd:
+            return None
+        creation_time, timescale, duration = get_time_header(moov, mvhd[0])
+        probe = {
+            'CreationTime': creation_time,
+            'Timescale': timescale,
+            'Duration': duration / timescale if timescale > 0 else 0,
+            'FPS': 0,
+        }
+        trak = get_video_trak(moov)
+        if trak:
+            # stts durations are in the media (mdhd) timescale, not in the movie one
+            media_timescale = timescale
+            mdhd = find_child(moov, trak[0], trak[1], ['mdia', 'mdhd'])
+            if mdhd:
+                media_timescale = get_time_header(moov, mdhd[0])[1]
+            stts = find_child(moov, trak[0], trak[1], ['mdia', 'minf', 'stbl', 'stts'])
+            if stts:
+                total_samples, total_duration = get_sample_stats(moov, stts)
+                if total_duration > 0 and media_timescale > 0:
+                    probe['FPS'] = total_samples / (total_duration / media_timescale)
+    except struct.error:
+        # truncated or garbage header
+        return None
+    return probe
+
+
+def get_sync_samples(moov, stss):
+    """ returns the sorted (0 based) sample numbers of a 'stss' body """
+    start, end = stss
+    entry_count = struct.unpack_from('>I', moov, start + 4)[0]
+    entry_count = min(entry_count, (end - start - 8) // 4)
+    samples = struct.unpack_from('>%dI' % entry_count, moov, start + 8)
+    return sorted(sample - 1 for sample in samples if sample > 0)
+
+
+def get_sample_times(moov, stts, samples):
+    """ decode times (in the media timescale) of the given sorted sample numbers,
+    walking the run length coded durations of a 'stts' body once """
+    start, end = stts
+    entry_count = struct.unpack_from('>I', moov, start + 4)[0]
+    entry_count = min(entry_count, (end - start - 8) // 8)
+    entries = struct.unpack_from('>%dI' % (entry_count * 2), moov, start + 8)
+    times = []
+    entry = 0
+    first_sample = 0
+    first_time = 0
+    for sample in samples:
+        while entry < entry_count and sample >= first_sample + entries[entry * 2]:
+            first_sample += entries[entry * 2]
+            first_time += entries[entry * 2] * entries[entry * 2 + 1]
+            entry += 1
+        if entry == entry_count:
+            # beyond the samples described by stts
+            break
+        times.append(first_time + (sample - first_sample) * entries[entry * 2 + 1])
+    return times
+
+
+def read_keyframe_times(in_fh, max_moov_size=MAX_MOOV_SIZE):
+    """ reads the sync sample table ('stss') of the video track and returns the sorted
+    keyframe times in seconds; every frame is a keyframe if there is no 'stss'.
+    Returns None if it is not a MP4/MOV file or the video track has no 'stts' """
+    try:
+        moov = read_moov(in_fh, max_moov_size)
+        if not moov:
+            return None
+        trak = get_video_trak(moov)
+        if not trak:
+            return None
+        mdhd = find_child(moov, trak[0], trak[1], ['mdia', 'mdhd'])
+        stbl = find_child(moov, trak[0], trak[1], ['mdia', 'minf', 'stbl'])
+        if not mdhd or not stbl:
+            return None
+        timescale = get_time_header(moov, mdhd[0])[1]
+        stts = find_child(moov, stbl[0], stbl[1], ['stts'])
+        if not stts or timescale <= 0:
+            return None
+        stss = find_child(moov, stbl[0], stbl[1], ['stss'])
+        if stss:
+            samples = get_sync_samples(moov, stss)
+        else:
+            samples = range(get_sample_stats(moov, stts)[0])
+        return [sample_time / timescale for sample_time in get_sample_times(moov, stts, samples)]
+    except struct.error:
+        return None
+
+
+def get_distance(lat1, lon1, lat2, lon2):
+    """ great circle distance in meters between two positions (degrees) """
     # https://en.wikipedia.org/wiki/Haversine_formula
-    lat1, lon1, dt1 = coord_dt1
-    lat2, lon2, dt2 = coord_dt2
     lat1 = math.radians(lat1)
     lon1 = math.radians(lon1)
     lat2 = math.radians(lat2)
     lon2 = math.radians(lon2)
-    earth_r = 6.3781E6  # earth radius meters
     hav_lat = (1 - math.cos(lat2 - lat1)) / 2
     hav_lon = (1 - math.cos(lon2 - lon1)) / 2
     hav_h = hav_lat + math.cos(lat1) * math.cos(lat2) * hav_lon
-    distance = 2 * earth_r * math.asin(hav_h ** 0.5)
+    return 2 * EARTH_R * math.asin(min(hav_h, 1.0) ** 0.5)
+
+
+def calculate_speed(coord_dt1, coord_dt2):
+    """ calculates speed based two sets of coordinates/datetimes """
+    lat1, lon1, dt1 = coord_dt1
+    lat2, lon2, dt2 = coord_dt2
+    distance = get_distance(lat1, lon1, lat2, lon2)
     try:
         speed = distance / abs(dt2 - dt1)
     except ZeroDivisionError:
@@ -496,47 +1277,164 @@ def calculate_speed(coord_dt1, coord_dt2):
     return speed
 
 
-def remove_outliers(gps_data):
-    """ crudely deletes outliers based on timestamp and coordinate delta """
+def get_distances_np(lats1, lons1, lats2, lons2):
+    """ vectorized get_distance """
+    lats1 = np.radians(lats1)
+    lats2 = np.radians(lats2)
+    hav_lat = (1 - np.cos(lats2 - lats1)) / 2
+    hav_lon = (1 - np.cos(np.radians(lons2) - np.radians(lons1))) / 2
+    hav_h = hav_lat + np.cos(lats1) * np.cos(lats2) * hav_lon
+    return 2 * EARTH_R * np.arcsin(np.sqrt(np.minimum(hav_h, 1.0)))
+
+
+def get_window_bounds(epochs, window):
+    """ (first, last) index arrays of the fixes within window / 2 seconds before and
+    after every fix of the sorted epochs, last exclusive """
+    epochs = np.asarray(epochs, dtype=np.float64)
+    return (np.searchsorted(epochs, epochs - window / 2.0, 'left'),
+            np.searchsorted(epochs, epochs + window / 2.0, 'right'))
+
+
+def get_rolling_median(values, first, last):
+    """ upper median of values[first[i]:last[i]] for every window i (first and last
+    ascending); equal windows (fixes with the same epoch) are only computed once """
+    values = np.asarray(values, dtype=np.float64)
+    count = len(first)
+    changes = np.flatnonzero((first[1:] != first[:-1]) | (last[1:] != last[:-1])) + 1
+    starts = np.concatenate(([0], changes))
+    first = first[starts]
+    sizes = last[starts] - first
+    medians = np.empty(len(starts), dtype=np.float64)
+    # the windows of one size are gathered into a matrix and partitioned row by row
+    order = np.argsort(sizes, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(sizes[order])) + 1
+    for group in np.split(order, bounds):
+        size = int(sizes[group[0]])
+        offsets = np.arange(size)
+        rows = max(MEDIAN_CHUNK // size, 1)
+        for start in range(0, len(group), rows):
+            chunk = group[start:start + rows]
+            windows = values[first[chunk][:, None] + offsets]
+            medians[chunk] = np.partition(windows, size // 2, axis=1)[:, size // 2]
+    return np.repeat(medians, np.diff(np.concatenate((starts, [count]))))
+
+
+def find_outliers_py(lats, lons, epochs, window, max_speed):
+    """ pure python version of find_outliers_np """
+    count = len(epochs)
+    distances = {}
+
+    def get_reference_distance(index):
+        if index not in distances:
+            first = bisect.bisect_left(epochs, epochs[index] - window / 2.0)
+            last = bisect.bisect_right(epochs, epochs[index] + window / 2.0)
+            window_lats = sorted(lats[first:last])
+            window_lons = sorted(lons[first:last])
+            distances[index] = get_distance(window_lats[len(window_lats) // 2],
+                                            window_lons[len(window_lons) // 2],
+                                            lats[index], lons[index])
+        return distances[index]
+
+    outliers = [False] * count
+    speeds = [0.0] * count
+    kept = list(range(count))
+    while True:
+        blamed = []
+        for first, second in zip(kept, kept[1:]):
+            speed = (get_distance(lats[first], lons[first], lats[second], lons[second])
+                     / max(epochs[second] - epochs[first], MIN_FIX_INTERVAL))
+            if speed > max_speed:
+                fix = (first if get_reference_distance(first) > get_reference_distance(second)
+                       else second)
+                speeds[fix] = max(speeds[fix], speed)
+                blamed.append(fix)
+        if not blamed:
+            return outliers, speeds
+        for fix in blamed:
+            outliers[fix] = True
+        kept = [index for index in kept if not outliers[index]]
+
+
+def find_outliers_np(lats, lons, epochs, window, max_speed):
+    """ flags the fixes (sorted by epoch) that could only be reached from a neighbour
+    with more than max_speed: of every such pair of consecutive fixes the one farther
+    from the median position of the fixes within 'window' seconds around it is an
+    outlier, repeated without the outliers until no pair is left (a run of bad fixes
+    is peeled off from both ends); returns (outlier flags, speeds). The median is only
+    needed for the fixes of such pairs and only computed for them """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    epochs = np.asarray(epochs, dtype=np.float64)
+    count = len(epochs)
+    first, last = get_window_bounds(epochs, window)
+    # distance to the median position, NaN until needed
+    distances = np.full(count, np.nan)
+    outliers = np.zeros(count, dtype=bool)
+    speeds = np.zeros(count, dtype=np.float64)
+    kept = np.arange(count)
+    while len(kept) > 1:
+        before, after = kept[:-1], kept[1:]
+        pair_speeds = (get_distances_np(lats[before], lons[before], lats[after], lons[after])
+                       / np.maximum(epochs[after] - epochs[before], MIN_FIX_INTERVAL))
+        bad = pair_speeds > max_speed
+        if not bad.any():
+            break
+        pending = np.union1d(before[bad], after[bad])
+        pending = pending[np.isnan(distances[pending])]
+        if len(pending):
+            distances[pending] = get_distances_np(
+                get_rolling_median(lats, first[pending], last[pending]),
+                get_rolling_median(lons, first[pending], last[pending]),
+                lats[pending], lons[pending])
+        blamed = np.where(distances[before[bad]] > distances[after[bad]],
+                          before[bad], after[bad])
+        np.maximum.at(speeds, blamed, pair_speeds[bad])
+        outliers[blamed] = True
+        kept = kept[~outliers[kept]]
+    return outliers.tolist(), speeds.tolist()
+
+
+def remove_outliers(gps_data, window=OUTLIER_WINDOW, max_speed=OUTLIER_SPEED):
+    """ crudely deletes outliers based on timestamp and coordinate delta: a fix is dropped
+    when reaching it from the fix before or after it would need more than max_speed m/s
+    and it is the one of the two farther from the median position of the fixes within
+    'window' seconds around it """
     if not gps_data:
         return gps_data
-    # geting median lat and lon
-    lats = []
-    lons = []
-    epochs = []
+    fixes = []
     for item in gps_data:
-        try:
-            lats.append(item['Loc']['Lat']['Float'])
-            lons.append(item['Loc']['Lon']['Float'])
-            epochs.append(item['Epoch'])
-        except TypeError:
+        fix = as_fix(item)
+        if fix is None:
+            # as before: None entries (undecodable payloads) are skipped
             continue
-    lats.sort()
-    lons.sort()
-    epochs.sort()
-    # crude midpoint, but fine for the task
-    mid_point = (lats[int(len(lats) / 2)],
-                 lons[int(len(lons) / 2)],
-                 epochs[int(len(epochs) / 2)])
+        # the item itself is kept, so dicts come back as dicts
+        fixes.append((fix.epoch, fix.lat, fix.lon, len(fixes), item))
+    if not fixes:
+        return []
+    fixes.sort(key=lambda fix: fix[0])
+    epochs = [fix[0] for fix in fixes]
+    lats = [fix[1] for fix in fixes]
+    lons = [fix[2] for fix in fixes]
+    if np is not None:
+        outliers, speeds = find_outliers_np(lats, lons, epochs, window, max_speed)
+    else:
+        outliers, speeds = find_outliers_py(lats, lons, epochs, window, max_speed)
+    removed = {}
+    for fix, outlier, speed in zip(fixes, outliers, speeds):
+        if outlier:
+            removed[fix[3]] = speed
     gps_data_filtered = []
-    for data_point in gps_data:
-        try:
-            point = (data_point['Loc']['Lat']['Float'],
-                     data_point['Loc']['Lon']['Float'],
-                     data_point['Epoch'])
-            speed = calculate_speed(mid_point, point)
-        except TypeError:
-            continue
-        if speed > 1000:
-            print("Removed outlier %s (estimated speed: %.2fm/s)." % (point, speed))
+    for fix in sorted(fixes, key=lambda fix: fix[3]):
+        if fix[3] in removed:
+            print("Removed outlier %s (estimated speed: %.2fm/s)."
+                  % ((fix[1], fix[2], fix[0]), removed[fix[3]]))
         else:
-            gps_data_filtered.append(data_point)
+            gps_data_filtered.append(fix[4])
     return gps_data_filtered
 
 
-def process_file(in_file, deobfuscate, del_outliers):
-    """ process input file, looks for either MP4 or TS file signatures """
-    print("Processing file '%s'..." % in_file)
+def parse_file(in_file, deobfuscate):
+    """ parses a whole MP4 (memory-mapped) or TS file, returns its list of GpsFix """
     gps_data = []
     with open(in_file, "rb") as in_fh:
         gps_data, is_moov = parse_moov(in_fh, deobfuscate)
@@ -547,78 +1445,177 @@ def process_file(in_file, deobfuscate, del_outliers):
                 print("\tFound a TS header.")
             else:
                 print("\tFile %s is not a TS file." % in_file)
-    out = list(filter(None, gps_data))
+    return list(filter(None, gps_data))
+
+
+def iter_gps_batches(in_file, deobfuscate, batch_atoms):
+    """ yields the GpsFix of a MP4 or TS file in lists as soon as they are decoded;
+    MP4 files are decoded batch_atoms 'GPS ' atoms at a time """
+    with open(in_file, "rb") as in_fh:
+        gps_atom_infos, is_moov = read_gps_index(in_fh)
+        if is_moov:
+            for start in range(0, len(gps_atom_infos), batch_atoms):
+                yield list(filter(None, get_gps_atoms(
+                    gps_atom_infos[start:start + batch_atoms], in_fh, deobfuscate)))
+            return
+        if not is_ts_file(in_fh):
+            print("\tFile %s is neither a MP4/MOV nor a TS file." % in_file)
+            return
+        in_fh.seek(0, 0)
+        scanner = TsScanner(deobfuscate)
+        while True:
+            chunk = in_fh.read(TS_PACKET_SIZE * TS_CHUNK_PACKETS)
+            if not chunk:
+                break
+            yield list(filter(None, scanner.feed(chunk)))
+        yield list(filter(None, scanner.finish()))
+
+
+def iter_gps_data(in_file, deobfuscate, batch_atoms=GPS_BATCH_ATOMS, cache=None):
+    """ yields the GPS data of a MP4 or TS file in batches (lists of GpsFix) as soon as
+    they are decoded, so a caller can use the start of a track before the rest is parsed;
+    MP4 files are decoded batch_atoms 'GPS ' atoms at a time, with batch_atoms None the
+    whole file is parsed at once. With a cache (track_cache.TrackCache) files that were
+    parsed before are not parsed again, a parsed track is cached once it was read to the end """
+    if cache is not None:
+        gps_data = cache.get(in_file, deobfuscate)
+        if gps_data is not None:
+            print("\tLoaded %d GPS data points from the cache." % len(gps_data))
+            step = batch_atoms or len(gps_data)
+            for start in range(0, len(gps_data), max(step, 1)):
+                yield gps_data[start:start + step]
+            return
+    if batch_atoms is None:
+        batches = iter([parse_file(in_file, deobfuscate)])
+    else:
+        batches = iter_gps_batches(in_file, deobfuscate, batch_atoms)
+    gps_data = []
+    for batch in batches:
+        if batch:
+            gps_data += batch
+            yield batch
+    if cache is not None:
+        cache.put(in_file, deobfuscate, gps_data)
+
+
+def process_file(in_file, deobfuscate, del_outliers, cache=None):
+    """ process input file, looks for either MP4 or TS file signatures;
+    with a cache (track_cache.TrackCache) files that were parsed before are not parsed again """
+    print("Processing file '%s'..." % in_file)
+    out = list(itertools.chain.from_iterable(iter_gps_data(in_file, deobfuscate, None, cache)))
     if del_outliers:
         out = remove_outliers(out)
     return out
 
 
-def write_file(gpx, out_file):
-    """ writes given data to a given out put file """
-    with open(out_file, "w") as of_h:
-        print("Writing data to the output file '%s'." % out_file)
-        of_h.write(gpx)
+def process_file_isolated(in_file, deobfuscate, del_outliers, cache=None):
+    """ process_file that reports errors instead of raising them, so that
+    one broken file does not abort a whole batch """
+    try:
+        return process_file(in_file, deobfuscate, del_outliers, cache)
+    except Exception as error:
+        print("Error: failed to process file '%s' (%s), skipping it." % (in_file, error))
+        return None
+
+
+def process_files(in_files, deobfuscate, del_outliers, jobs=1, cache=None):
+    """ yields (in_file, gps_data) in the order of in_files; with jobs > 1 the files are
+    fanned out to a pool of worker processes, gps_data is None for failed files """
+    if jobs <= 1:
+        for in_file in in_files:
+            yield in_file, process_file_isolated(in_file, deobfuscate, del_outliers, cache)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # only keep a few files in flight per worker, so the results waiting
+        # for an earlier (slower) file do not pile up in memory
+        pending = collections.deque()
+        in_files = iter(in_files)
+        while True:
+            while len(pending) < jobs * 4:
+                in_file = next(in_files, None)
+                if in_file is None:
+                    break
+                pending.append((in_file, executor.submit(
+                    process_file_isolated, in_file, deobfuscate, del_outliers, cache)))
+            if not pending:
+                break
+            in_file, future = pending.popleft()
+            try:
+                gps_data = future.result()
+            except Exception as error:
+                # the worker itself died (eg. out of memory)
+                print("Error: failed to process file '%s' (%s), skipping it." % (in_file, error))
+                gps_data = None
+            yield in_file, gps_data
 
 
 def write_if_gps_data(gps_data, out_file):
-    """ checks if the gps_data is there and then generates the gpx """
-    if gps_data:
-        gpx = generate_gpx(gps_data, out_file)
-        print("Found %d GPS data points." % len(gps_data))
-        write_file(gpx, out_file)
-    else:
+    """ checks if there is any gps data and then streams it as gpx into the out_file,
+    gps_data can be a list or a generator (it is consumed only once) """
+    gps_data = iter(gps_data or [])
+    first = next(gps_data, None)
+    if not first:
         print("GPS data not found in the '%s'!" % out_file)
         return False
+    with open(out_file, "w", buffering=1024 * 1024) as of_h:
+        print("Writing data to the output file '%s'." % out_file)
+        count = write_gpx(itertools.chain([first], gps_data), of_h, out_file)
+    print("Found %d GPS data points." % count)
     return True
 
 
 def sort_gps_data_by_dt(gps_data):
-    """ sorting by the 'Epoch' key value of the dicts in the gps_data list """
-    gps_data.sort(key=lambda item: item['Epoch'])
+    """ sorting by the epoch of the fixes (GpsFix or dicts) in the gps_data list """
+    gps_data.sort(key=lambda item: as_fix(item).epoch)
     return gps_data
 
 
-def get_data_package(infilepath):
-    deobfuscate = None
-    del_outliers = None
-    gps_data = []
-    with open(infilepath, "rb") as in_fh:
-        gps_data, is_moov = parse_moov(in_fh, deobfuscate)
-        if not is_moov:
-            print("\tFile %s is not a MP4/MOV file." % in_file)
-            gps_data, is_ts = parse_ts(in_fh, deobfuscate)
-            if is_ts:
-                print("\tFound a TS header.")
-            else:
-                print("\tFile %s is not a TS file." % in_file)
-    out = list(filter(None, gps_data))
-    if del_outliers:
-        out = remove_outliers(out)
-    return out
-
+def get_data_package(infilepath, cache=None):
+    """ returns the GPS data of a single file (as used by the viewer) """
+    return process_file(infilepath, False, False, cache)
 
 
 def main():
     """ main function """
-    in_files, out_file, force, multiple, deobfuscate, sort_by, del_outliers = get_args()
+    (in_files, out_file, force, multiple, deobfuscate, sort_by, del_outliers,
+     jobs, cache, follow, store) = get_args()
     gps_data = []
     success = False
     if sort_by == 'f':
         in_files.sort()
-    if multiple:
+    if follow is not None:
+        if len(in_files) > 1:
+            print("Warning: '-F' follows a single file, using '%s'." % in_files[0])
+        success = follow_file(in_files[0], deobfuscate, follow if follow >= 0 else None)
+    elif store is not None:
+        with store:
+            for in_file, gps_data in process_files(in_files, deobfuscate, del_outliers,
+                                                   jobs, cache):
+                if gps_data and not store.add(os.path.abspath(in_file), gps_data):
+                    print("File '%s' is already in the track store." % in_file)
+        print("Appended %d GPS data points to the track store '%s' (vehicle '%s')."
+              % (store.rows, store.root, store.vehicle))
+        success = store.rows > 0 or store.skipped > 0
+    elif multiple:
+        out_files = {}
         for in_file in in_files:
             f_name, _ = os.path.splitext(in_file)
             out_file = f_name + '.gpx'
-            if not check_out_file(out_file, force):
-                continue
-            gps_data = process_file(in_file, deobfuscate, del_outliers)
-            write_success = write_if_gps_data(gps_data, out_file)
+            if check_out_file(out_file, force):
+                out_files[in_file] = out_file
+        in_files = [in_file for in_file in in_files if in_file in out_files]
+        for in_file, gps_data in process_files(in_files, deobfuscate, del_outliers,
+                                               jobs, cache):
+            write_success = write_if_gps_data(gps_data, out_files[in_file])
             success = success or write_success
     else:
-        for in_file in in_files:
-            gps_data += process_file(in_file, deobfuscate, del_outliers)
+        # the files are chained into the writer one by one, only sorting by date
+        # needs all the data in memory at once
+        gps_data = itertools.chain.from_iterable(
+            file_gps_data or [] for _, file_gps_data in
+            process_files(in_files, deobfuscate, del_outliers, jobs, cache))
         if sort_by == 'd':
-            gps_data = sort_gps_data_by_dt(gps_data)
+            gps_data = sort_gps_data_by_dt(list(gps_data))
         success = write_if_gps_data(gps_data, out_file)
     if not success:
         print("Failure!")
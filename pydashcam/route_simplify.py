@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" Level of detail for the route on the map: Douglas-Peucker simplification
+with NumPy, one simplified polyline per zoom range, the tolerance being a
+pixel at the most detailed zoom of that range. """
+
+import math
+
+import numpy as np
+
+# each level is used up to this zoom, the last one also above
+LOD_ZOOMS = (10, 13, 16, 18)
+# metres per pixel at zoom 0 on the equator (256px Web Mercator tiles)
+METERS_PER_PIXEL = 156543.03
+EARTH_R = 6.3781E6
+# decimals of the coordinates written into the page (~0.1m)
+COORD_DECIMALS = 6
+
+
+def project(lats, lons):
+    """ equirectangular projection around the mean latitude, in metres, as (n, 2) array """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    scale = math.cos(float(lats.mean())) if len(lats) else 1.0
+    return np.column_stack((lons * scale * EARTH_R, lats * EARTH_R))
+
+
+def get_tolerance(zoom, lat, pixels=1.0):
+    """ metres covered by 'pixels' pixels at the given zoom and latitude """
+    return pixels * METERS_PER_PIXEL * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def douglas_peucker(points, tolerance):
+    """ returns the sorted indexes of the points (n, 2) kept by Douglas-Peucker; instead
+    of recursing span by span, every round splits all open spans at once """
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    # points of spans that are within the tolerance of their chord
+    done = keep.copy()
+    tolerance2 = tolerance * tolerance
+    while True:
+        candidates = np.flatnonzero(~done)
+        if not len(candidates):
+            break
+        kept = np.flatnonzero(keep)
+        # span of each candidate: the last kept point before it
+        spans = np.cumsum(keep)[candidates] - 1
+        starts = points[kept[spans]]
+        chords = points[kept[spans + 1]] - starts
+        offsets = points[candidates] - starts
+        length2 = np.einsum('ij,ij->i', chords, chords)
+        # distance to the chord segment (not the infinite line), so turning
+        # back on the same road is not lost
+        ratio = np.clip(np.einsum('ij,ij->i', offsets, chords) / np.where(length2 > 0, length2, 1),
+                        0.0, 1.0)
+        offsets -= ratio[:, None] * chords
+        distances2 = np.einsum('ij,ij->i', offsets, offsets)
+        # farthest point of each span (the first one on ties, like argmax)
+        first = np.flatnonzero(np.r_[True, spans[1:] != spans[:-1]])
+        order = np.lexsort((-distances2, spans))
+        farthest = order[first]
+        split = distances2[farthest] > tolerance2
+        keep[candidates[farthest[split]]] = True
+        done[candidates[np.repeat(~split, np.diff(np.r_[first, len(candidates)]))]] = True
+        done |= keep
+    return np.flatnonzero(keep)
+
+
+def simplify_levels(lats, lons, zooms=LOD_ZOOMS, pixels=1.0):
+    """ returns [(max zoom, indexes of the kept points), ...] from detailed to coarse;
+    each level is simplified from the previous one, which is much smaller than the track """
+    lats = np.asarray(lats, dtype=np.float64)
+    points = project(lats, lons)
+    mean_lat = float(lats.mean()) if len(lats) else 0.0
+    indexes = np.arange(len(points))
+    levels = []
+    for zoom in sorted(zooms, reverse=True):
+        kept = douglas_peucker(points[indexes], get_tolerance(zoom, mean_lat, pixels))
+        indexes = indexes[kept]
+        levels.append((zoom, indexes))
+    return levels
+
+
+def get_route_levels(lats, lons, zooms=LOD_ZOOMS, pixels=1.0):
+    """ the simplified levels as plain lists for the page:
+    [{"maxZoom": zoom, "points": [[lat, lon], ...]}, ...] sorted by zoom """
+    lats = np.round(np.asarray(lats, dtype=np.float64), COORD_DECIMALS)
+    lons = np.round(np.asarray(lons, dtype=np.float64), COORD_DECIMALS)
+    return [{"maxZoom": zoom, "points": np.column_stack((lats[indexes], lons[indexes])).tolist()}
+            for zoom, indexes in reversed(simplify_levels(lats, lons, zooms, pixels))]
@@ -1,11 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import struct
-import datetime
+import base64
+import bisect
+import json
 import os
+import queue
 import sys
 import tempfile
+import threading
 import tkinter as tk
 from tkinter import filedialog
 import cv2
@@ -13,119 +16,153 @@ from PIL import Image, ImageTk
 import time
 import folium
 from cefpython3 import cefpython as cef
+import frame_pipeline
 import nvtk_mp42gpx
+import route_simplify
+import thumbnail_cache
+import track_cache
+import track_index
 import win32gui, win32con
 from tkinter import ttk
 
 def read_mp4_creation_time(file_path):
     use_daylight_saving_time = True
     with open(file_path, "rb") as f:
-        data = f.read()
-
-        # Suche nach dem 'mvhd' Atom, das die Erstellungszeit, Timescale und Dauer enthält
-        mvhd_index = data.find(b'mvhd')
-        if mvhd_index == -1:
-            raise ValueError("Kein 'mvhd' Atom gefunden.")
-
-        # Die 'mvhd' Box enthält die Zeitstempel 4 Bytes nach ihrem Start
-        creation_time_offset = mvhd_index + 4 + 4  # 'mvhd' + Version/Flags (4 Bytes)
-        timescale_offset = mvhd_index + 4 + 12  # Timescale befindet sich 12 Bytes nach 'mvhd'
-        duration_offset = mvhd_index + 4 + 16  # Duration befindet sich 16 Bytes nach 'mvhd'
-
-        # Extrahiere die 4-Byte Erstellungszeit
-        creation_time_bytes = data[creation_time_offset:creation_time_offset + 4]
-        creation_time = struct.unpack('>I', creation_time_bytes)[0]  # Unsigned 32-bit big-endian integer
-
-        # MP4-Zeit beginnt am 1. Januar 1904
-        epoch = datetime.datetime(1904, 1, 1)
-        creation_datetime = epoch + datetime.timedelta(seconds=creation_time)
-
-        # Ausgabe als Unix-Epoch
-        epoch_time = int(creation_datetime.timestamp())
-
-        # Sommer- oder Winterzeit prüfen und ggf. eine Stunde abziehen
-        is_dst = time.localtime(epoch_time).tm_isdst
-        if use_daylight_saving_time == True:
-            if not is_dst:
-                epoch_time -= 3600  # Eine Stunde (3600 Sekunden) abziehen, wenn Winterzeit
-
-        # Extrahiere Timescale (Anzahl der Zeiteinheiten pro Sekunde)
-        timescale_bytes = data[timescale_offset:timescale_offset + 4]
-        timescale = struct.unpack('>I', timescale_bytes)[0]
-
-        # Extrahiere Dauer (Gesamtdauer in Timescale-Einheiten)
-        duration_bytes = data[duration_offset:duration_offset + 4]
-        duration = struct.unpack('>I', duration_bytes)[0]
-
-        # Berechnung der Dauer in Sekunden
-        duration_seconds = duration / timescale if timescale > 0 else 0
-
-        # FPS aus der 'stts' Box extrahieren
-        stts_index = data.find(b'stts')
-        if stts_index != -1:
-            entry_count_offset = stts_index + 8  # Anzahl der Einträge in der STTS-Box
-            entry_count_bytes = data[entry_count_offset:entry_count_offset + 4]
-            entry_count = struct.unpack('>I', entry_count_bytes)[0]
-
-            total_samples = 0
-            total_duration = 0
-
-            for i in range(entry_count):
-                sample_count_offset = entry_count_offset + 4 + (i * 8)
-                sample_count_bytes = data[sample_count_offset:sample_count_offset + 4]
-                sample_count = struct.unpack('>I', sample_count_bytes)[0]
-
-                frame_duration_offset = sample_count_offset + 4
-                frame_duration_bytes = data[frame_duration_offset:frame_duration_offset + 4]
-                frame_duration = struct.unpack('>I', frame_duration_bytes)[0]
-
-                total_samples += sample_count
-                total_duration += sample_count * frame_duration
-
-            if total_duration > 0:
-                fps = total_samples / (total_duration / timescale)
-            else:
-                fps = 0
-        else:
-            fps = 0  # Falls 'stts' nicht gefunden wird
+        # Nur die 'moov' Box lesen (nicht die ganze Datei), darin liegen 'mvhd' und 'stts'
+        probe = nvtk_mp42gpx.probe_mp4(f)
+    if probe is None:
+        raise ValueError("Kein 'mvhd' Atom gefunden.")
+
+    # MP4-Zeit beginnt am 1. Januar 1904; Ausgabe als Unix-Epoch.
+    # Wie die GPS-Zeitstempel (nvtk_mp42gpx.get_epoch) als UTC gerechnet,
+    # damit beide Zeitachsen zueinander passen.
+    epoch_time = probe['CreationTime'] - nvtk_mp42gpx.MP4_EPOCH_OFFSET
+
+    # Sommer- oder Winterzeit prüfen und ggf. eine Stunde abziehen
+    is_dst = time.localtime(epoch_time).tm_isdst
+    if use_daylight_saving_time == True:
+        if not is_dst:
+            epoch_time -= 3600  # Eine Stunde (3600 Sekunden) abziehen, wenn Winterzeit
+
+    # Dauer in Sekunden und FPS (aus der 'stts' Box der Videospur)
+    duration_seconds = probe['Duration']
+    fps = probe['FPS']
 
-        return epoch_time, is_dst, duration_seconds, fps
+    return epoch_time, is_dst, duration_seconds, fps
+
+
+def get_coordinate(step):
+    return {
+        "epoch": step.epoch,
+        "lat": step.lat,
+        "lon": step.lon,
+        "speed" : step.speed,
+        "bear" : step.bearing,
+        "date" : step.dt
+    }
 
 
 def extract_coordinates_from_mp4(file_path):
+    """
+    Liest alle GPS-Daten des Clips auf einmal: (video_start_epoch, [coordinate, ...]).
+    """
     vepoch_time, is_dst, duration_seconds, fps = read_mp4_creation_time(file_path)
-    video_start_epoch = vepoch_time - duration_seconds
-    positions = nvtk_mp42gpx.get_data_package(file_path)
+    coordinates = [get_coordinate(step) for batch in
+                   nvtk_mp42gpx.iter_gps_data(file_path, False, cache=track_cache.TrackCache())
+                   for step in batch]
+    return vepoch_time - duration_seconds, coordinates
 
-    coordinates = []
-    for step in positions:
-        newd = {
-            "epoch": step['Epoch'],
-            "lat": step['Loc']['Lat']['Float'],
-            "lon": step['Loc']['Lon']['Float'],
-            "speed" : step['Loc']['Speed'],
-            "bear" : step['Loc']['Bearing'],
-            "date" : step['DT']['DT']
-        }
-        coordinates.append(newd)
 
-    for i in coordinates:
-        print(i)
-        print()
+def extract_coordinates_worker(file_path, gps_queue, batch_size=500):
+    """
+    Läuft in einem Hintergrund-Thread und schickt die Ergebnisse über die
+    (thread-sichere) Queue an die Tk-Schleife: ("fixes", [coordinate, ...]) in
+    Blöcken (bei MP4 je batch_size GPS-Atome), zum Schluss ("done", None). Fehler
+    kommen als ("error", text). Jeder Block geht raus, sobald er dekodiert ist,
+    nicht erst nach dem ganzen Clip.
+    """
+    try:
+        for batch in nvtk_mp42gpx.iter_gps_data(file_path, False, batch_size,
+                                                track_cache.TrackCache()):
+            gps_queue.put(("fixes", [get_coordinate(step) for step in batch]))
+    except Exception as error:
+        gps_queue.put(("error", str(error)))
+    gps_queue.put(("done", None))
 
-    return video_start_epoch, coordinates
+
+def start_extraction(file_path):
+    """
+    Startet die GPS-Extraktion im Hintergrund, gibt die Queue mit den Ergebnissen zurück.
+    """
+    gps_queue = queue.Queue()
+    worker = threading.Thread(target=extract_coordinates_worker, args=(file_path, gps_queue),
+                              daemon=True)
+    worker.start()
+    return gps_queue
 
 
-# -------------------------------------------------------------------
-# Erstelle die Folium-Karte (mit dynamischem Marker)
-# -------------------------------------------------------------------
-def create_map(initial_coord, fullset):
+class TripSegment(object):
     """
-    Erzeugt eine Folium‑Karte, in die per JavaScript ein Marker eingebettet wird,
-    der über window.updateMarker(lat, lng) aktualisiert werden kann.
+    Ein Clip einer Fahrt: Pfad, Video-Startzeit (Epoch), Dauer in s und FPS.
     """
-    m = folium.Map(location=initial_coord, zoom_start=15)
+    __slots__ = ("path", "start_epoch", "duration", "fps")
+
+    def __init__(self, path, start_epoch, duration, fps):
+        self.path = path
+        self.start_epoch = start_epoch
+        self.duration = duration
+        self.fps = fps
+
+
+class Trip(object):
+    """
+    Eine Fahrt aus aufeinanderfolgenden Clips (nach Startzeit sortiert) mit einer
+    durchgehenden Zeitachse, auf der die Clips direkt hintereinander liegen.
+    """
+    def __init__(self, segments):
+        self.segments = sorted(segments, key=lambda segment: segment.start_epoch)
+        # Beginn jedes Clips auf der Zeitachse der Fahrt in s
+        self.offsets = []
+        offset = 0.0
+        for segment in self.segments:
+            self.offsets.append(offset)
+            offset += segment.duration
+        self.duration = offset
+
+    def locate(self, position):
+        """
+        Gibt (Index des Clips, Position im Clip in ms) zur Position auf der Zeitachse (ms) zurück.
+        """
+        index = max(0, bisect.bisect_right(self.offsets, position / 1000.0) - 1)
+        local = position - self.offsets[index] * 1000.0
+        return index, min(max(local, 0.0), self.segments[index].duration * 1000.0)
 
+
+def load_trip(path):
+    """
+    Eine einzelne Datei oder alle MP4-Dateien eines Verzeichnisses als Fahrt;
+    gelesen wird dafür nur der Header (read_mp4_creation_time) jeder Datei.
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                 if name.lower().endswith(".mp4")]
+    else:
+        files = [path]
+    segments = []
+    for file_path in files:
+        try:
+            vepoch_time, is_dst, duration_seconds, fps = read_mp4_creation_time(file_path)
+        except (OSError, ValueError) as error:
+            print("Datei wird übersprungen:", file_path, error)
+            continue
+        segments.append(TripSegment(file_path, vepoch_time - duration_seconds, duration_seconds, fps))
+    return Trip(segments)
+
+
+# -------------------------------------------------------------------
+# Erstelle die Folium-Karte (mit dynamischem Marker)
+# -------------------------------------------------------------------
+def get_route(fullset):
     route = []
     for step in fullset:
         posLat = step['lat']
@@ -133,21 +170,153 @@ def create_map(initial_coord, fullset):
         if posLat != 0 and posLon != 0:
             newpos = [posLat, posLon]
             route.append(newpos)
+    return route
+
+
+def get_route_levels(fullset):
+    """
+    Die Route in mehreren vereinfachten Stufen (Douglas-Peucker, je Zoombereich),
+    siehe route_simplify.get_route_levels().
+    """
+    route = get_route(fullset)
+    if not route:
+        return []
+    return route_simplify.get_route_levels([p[0] for p in route], [p[1] for p in route])
 
-    folium.PolyLine(route, tooltip="Route").add_to(m)
+
+def create_map(initial_coord=None, fullset=()):
+    """
+    Erzeugt eine Folium‑Karte, in die per JavaScript ein Marker eingebettet wird,
+    der über window.updateMarker(lat, lng) aktualisiert werden kann.
+    Die Route wird in mehreren vereinfachten Stufen eingebettet, die Karte zeigt
+    je nach Zoom die passende; über window.setRoute(levels) kann sie (z.B. wenn
+    die GPS-Daten erst nach und nach ankommen) ersetzt werden.
+    Der Marker bewegt sich selbständig: die Seite bekommt einmal den ganzen Track
+    (window.setTrack) und den Stand der Wiedergabe (window.setPlayback), läuft
+    dann mit eigener Uhr und interpoliert die Position bei jedem Bild (requestAnimationFrame).
+    Ohne Startposition zeigt die Karte zunächst die Welt.
+    """
+    if initial_coord:
+        m = folium.Map(location=initial_coord, zoom_start=15)
+    else:
+        m = folium.Map()
 
     map_name = m.get_name()
+    if initial_coord:
+        marker_js = f"window.marker = L.marker([{initial_coord[0]}, {initial_coord[1]}]).addTo({map_name});"
+    else:
+        # der Marker wird beim ersten updateMarker() angelegt
+        marker_js = "window.marker = null;"
     custom_js = f"""
     <script>
+    // Stufen der Route [{{maxZoom, points}}], nach Zoom sortiert
+    window.routeLevels = [];
+    window.routeLine = null;
+    window.routeLevel = null;
+    window.showRouteLevel = function(){{
+        if (!window.routeLine || window.routeLevels.length == 0) return;
+        var zoom = {map_name}.getZoom();
+        var level = window.routeLevels[window.routeLevels.length - 1];
+        for (var i = 0; i < window.routeLevels.length; i++){{
+            if (zoom <= window.routeLevels[i].maxZoom){{
+                level = window.routeLevels[i];
+                break;
+            }}
+        }}
+        if (level !== window.routeLevel){{
+            window.routeLevel = level;
+            window.routeLine.setLatLngs(level.points);
+        }}
+    }};
+    window.setRoute = function(levels){{
+        var first = window.routeLevels.length == 0;
+        window.routeLevels = levels;
+        window.routeLevel = null;
+        // vor dem Laden der Karte nur merken
+        if (!window.mapReady) return;
+        window.showRouteLevel();
+        var detailed = levels.length > 0 ? levels[levels.length - 1].points : [];
+        if (first && detailed.length > 0 && !window.marker){{
+            {map_name}.setView(detailed[0], 15);
+        }}
+    }};
+    window.setRoute({json.dumps(get_route_levels(fullset))});
     window.addEventListener('load', function(){{
         console.log("Map fully loaded, initializing dynamic marker.");
-        window.marker = L.marker([{initial_coord[0]}, {initial_coord[1]}]).addTo({map_name});
+        {marker_js}
         window.updateMarker = function(lat, lng){{
-            console.log("Updating marker to:", lat, lng);
+            if (!window.marker){{
+                window.marker = L.marker([lat, lng]).addTo({map_name});
+            }}
             window.marker.setLatLng([lat, lng]);
-            {map_name}.panTo([lat, lng]);
+            // nur verschieben, wenn der Marker den inneren Bereich der Karte verlässt
+            if (!{map_name}.getBounds().pad(-0.2).contains([lat, lng])){{
+                {map_name}.panTo([lat, lng]);
+            }}
         }};
+        window.routeLine = L.polyline([]).bindTooltip("Route").addTo({map_name});
+        {map_name}.on('zoomend', window.showRouteLevel);
+        // Vorschaubild beim Überfahren der Route (Funktionen aus Python, siehe BrowserFrame)
+        window.routeLine.on('mousemove', function(e){{
+            if (window.pyMapHover) window.pyMapHover(e.latlng.lat, e.latlng.lng);
+        }});
+        window.routeLine.on('mouseout', function(){{
+            if (window.pyMapHoverEnd) window.pyMapHoverEnd();
+        }});
+        window.mapReady = true;
+        window.setRoute(window.routeLevels);
+        window.requestAnimationFrame(window.animateMarker);
     }});
+
+    // Track als Float32Array mit (Zeit, Lat, Lon) relativ zum ersten Fix
+    window.track = null;
+    window.setTrack = function(epoch0, lat0, lon0, data){{
+        var bytes = window.atob(data);
+        var buffer = new Uint8Array(bytes.length);
+        for (var i = 0; i < bytes.length; i++) buffer[i] = bytes.charCodeAt(i);
+        window.track = {{epoch0: epoch0, lat0: lat0, lon0: lon0,
+                        values: new Float32Array(buffer.buffer), count: buffer.length / 12}};
+        window.lastMarkerEpoch = null;
+    }};
+    // Stand der Wiedergabe, danach läuft die Uhr der Seite selbst weiter
+    window.playback = {{epoch: null, rate: 1, playing: false, at: 0}};
+    window.setPlayback = function(epoch, rate, playing){{
+        window.playback = {{epoch: epoch, rate: rate, playing: playing, at: performance.now()}};
+        window.lastMarkerEpoch = null;
+    }};
+    window.trackPosition = function(epoch){{
+        var track = window.track, values = track.values;
+        var time = epoch - track.epoch0;
+        // erster Fix nach time (binäre Suche)
+        var low = 0, high = track.count;
+        while (low < high){{
+            var middle = (low + high) >> 1;
+            if (values[middle * 3] <= time) low = middle + 1; else high = middle;
+        }}
+        if (low == 0 || low == track.count){{
+            var index = low == 0 ? 0 : track.count - 1;
+            return [track.lat0 + values[index * 3 + 1], track.lon0 + values[index * 3 + 2]];
+        }}
+        var before = (low - 1) * 3, after = low * 3;
+        var span = values[after] - values[before];
+        var ratio = span > 0 ? (time - values[before]) / span : 0;
+        return [track.lat0 + values[before + 1] + (values[after + 1] - values[before + 1]) * ratio,
+                track.lon0 + values[before + 2] + (values[after + 2] - values[before + 2]) * ratio];
+    }};
+    window.lastMarkerEpoch = null;
+    window.animateMarker = function(){{
+        var playback = window.playback;
+        if (window.track && window.track.count > 0 && playback.epoch !== null){{
+            var epoch = playback.epoch;
+            if (playback.playing) epoch += (performance.now() - playback.at) / 1000 * playback.rate;
+            if (epoch !== window.lastMarkerEpoch){{
+                window.lastMarkerEpoch = epoch;
+                var position = window.trackPosition(epoch);
+                window.updateMarker(position[0], position[1]);
+            }}
+        }}
+        window.requestAnimationFrame(window.animateMarker);
+    }};
     </script>
     """
     m.get_root().html.add_child(folium.Element(custom_js))
@@ -161,11 +330,14 @@ class BrowserFrame(tk.Frame):
     """
     Dieser Frame bettet den CEF‑Browser in ein Tkinter‑Frame ein und sorgt
     für das regelmäßige Aufrufen von cef.MessageLoopWork().
+    js_functions: Python-Funktionen, die im JavaScript der Seite als window.<name> aufrufbar sind.
     """
-    def __init__(self, master, url, *args, **kwargs):
+    def __init__(self, master, url, js_functions=None, *args, **kwargs):
         tk.Frame.__init__(self, master, *args, **kwargs)
         self.url = url
+        self.js_functions = js_functions or {}
         self.browser = None
+        self.loaded = False  # wird gesetzt, sobald die Seite fertig geladen ist
         self.browser_frame = tk.Frame(self, width=800, height=600)
         self.browser_frame.grid(row=0, column=1, sticky="n")
         self.after(100, self.embed_browser)
@@ -176,6 +348,12 @@ class BrowserFrame(tk.Frame):
         rect = [0, 0, self.winfo_width(), self.winfo_height()]
         window_info.SetAsChild(self.browser_frame.winfo_id(), rect)
         self.browser = cef.CreateBrowserSync(window_info=window_info, url=self.url)
+        self.browser.SetClientHandler(LoadHandler(self))
+        if self.js_functions:
+            bindings = cef.JavascriptBindings()
+            for name, function in self.js_functions.items():
+                bindings.SetFunction(name, function)
+            self.browser.SetJavascriptBindings(bindings)
         self.message_loop_work()
 
     def on_configure(self, event):
@@ -187,6 +365,19 @@ class BrowserFrame(tk.Frame):
         self.after(10, self.message_loop_work)
 
 
+class LoadHandler(object):
+    """
+    Meldet dem BrowserFrame, wann die Karte geladen ist (vorher ausgeführtes
+    JavaScript würde verloren gehen).
+    """
+    def __init__(self, browser_frame):
+        self.browser_frame = browser_frame
+
+    def OnLoadEnd(self, browser, frame, http_code, **_):
+        if frame.IsMain():
+            self.browser_frame.loaded = True
+
+
 # -------------------------------------------------------------------
 # OpenCVVideoPlayer: Videoanzeige mit OpenCV in Tkinter
 # -------------------------------------------------------------------
@@ -195,20 +386,58 @@ class OpenCVVideoPlayer(tk.Frame):
     Dieser Frame integriert einen OpenCV-basierten Videoplayer in Tkinter.
     Er beinhaltet einen Videobereich, Play-/Pause‑Buttons und einen Schieberegler,
     mit dem man im Video navigieren kann.
+    Abgespielt wird eine Fahrt (Trip) aus einem oder mehreren Clips auf einer
+    durchgehenden Zeitachse; geöffnet sind nur der aktive Clip und (im Voraus)
+    der nächste, damit der Speicherbedarf nicht mit der Länge der Fahrt wächst.
+    Dekodiert wird in einem eigenen Thread (frame_pipeline.FrameDecoder) in
+    einen Ringpuffer mit buffer_depth Bildern, Tk zeigt nur die fertigen Bilder an.
+    Welches Bild gerade dran ist, bestimmt die Uhr (frame_pipeline.PlaybackScheduler):
+    kommt die Anzeige nicht hinterher, werden Bilder übersprungen statt langsamer abzuspielen.
     """
-    def __init__(self, master, video_path, *args, **kwargs):
+    # Wählbare Wiedergabegeschwindigkeiten
+    rates = ("0.5", "1", "2", "4", "8")
+    # Breite der Videoanzeige in Pixeln
+    video_width = 600
+
+    def __init__(self, master, trip, buffer_depth=frame_pipeline.DEFAULT_DEPTH, *args, **kwargs):
         tk.Frame.__init__(self, master, *args, **kwargs)
-        self.video_path = video_path
-        self.cap = cv2.VideoCapture(self.video_path)
-        if not self.cap.isOpened():
-            raise Exception("Fehler beim Öffnen des Videos.")
-        # Videoeigenschaften ermitteln
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-        self.frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
-        self.duration = (self.frame_count / self.fps) * 1000  # Gesamtdauer in ms
+        self.trip = trip
+        self.buffer_depth = buffer_depth
+        self.duration = trip.duration * 1000  # Gesamtdauer der Fahrt in ms
+        # Wird aufgerufen (mit dem Index des Clips), wenn ein anderer Clip aktiv wird
+        self.on_segment = None
 
         self.playing = False  # Wiedergabezustand
         self.current_frame = None
+        self.position = 0.0   # Position des angezeigten Frames im aktiven Clip in ms
+        self.photo = None     # wird für jedes Bild wiederverwendet
+
+        # Aktiver Clip (siehe open_segment) und im Hintergrund schon geöffneter nächster Clip
+        self.segment_index = None
+        self.video_path = None
+        self.cap = None
+        self.decoder = None
+        self.scheduler = None
+        self.keyframes = frame_pipeline.KeyframeIndex()
+        self.prefetched = {}
+        self.prefetch_index = None
+        self.prefetch_lock = threading.Lock()
+
+        self.dragging = False
+        self.last_seek = None
+        self.paused_pending = False
+
+        # Vorschaubilder des aktiven Clips (aus dem Cache oder im Hintergrund erzeugt).
+        # Erst beim ersten Hovern angefordert, damit Clips, die nur durchgesprungen
+        # werden, keine bekommen; ein einziger Thread erzeugt sie nacheinander im
+        # Prozess des Viewers (keine Worker-Prozesse, die cef/win32 neu importieren
+        # und dem Decoder die CPU wegnehmen)
+        self.thumbnails = None
+        self.thumbnails_requested = None
+        self.thumbnail_queue = queue.Queue()
+        threading.Thread(target=self.thumbnail_worker, daemon=True).start()
+        self.preview = None
+        self.preview_photo = None
 
         # --- Grid-Konfiguration für den gesamten Frame ---
         # self.rowconfigure(0, weight=1)   # Videoanzeige soll sich ausdehnen
@@ -245,22 +474,125 @@ class OpenCVVideoPlayer(tk.Frame):
             command=self.on_slider
         )
         self.slider.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
+        self.slider.bind("<ButtonPress-1>", self.on_slider_press)
+        self.slider.bind("<ButtonRelease-1>", self.on_slider_release)
+        self.slider.bind("<Motion>", self.on_slider_hover)
+        self.slider.bind("<Leave>", self.hide_preview)
 
         # Lade neue Datei
         self.loadfile_button = tk.Button(self.controls, text="load file", command=self.loadfilefromdisk)
         self.loadfile_button.grid(row=1, column=0, columnspan=2, padx=5, pady=5)
 
+        # Wiedergabegeschwindigkeit und Anzahl übersprungener/verspäteter Bilder
+        self.rate_frame = tk.Frame(self.controls)
+        self.rate_frame.grid(row=1, column=2, padx=5, pady=5, sticky="w")
+        tk.Label(self.rate_frame, text="Geschwindigkeit:").grid(row=0, column=0)
+        self.rate_var = tk.StringVar(value="1")
+        self.rate_box = tk.Spinbox(self.rate_frame, values=self.rates, textvariable=self.rate_var,
+                                   width=4, state="readonly", command=self.on_rate)
+        self.rate_box.grid(row=0, column=1, padx=5)
+        self.frames_var = tk.StringVar()
+        tk.Label(self.rate_frame, textvariable=self.frames_var).grid(row=0, column=2, padx=10)
+        # Aktiver Clip der Fahrt
+        self.segment_var = tk.StringVar()
+        tk.Label(self.rate_frame, textvariable=self.segment_var).grid(row=0, column=3, padx=10)
+
+        self.open_segment(0)
+
         # Starte das regelmäßige Aktualisieren des Sliders
         self.update_slider()
         #self.play()
 
+    def open_segment(self, index, position=0.0):
+        """
+        Macht den Clip index der Fahrt zum aktiven Clip (ab position ms): der alte
+        Decoder wird beendet und seine VideoCapture freigegeben, der nächste Clip
+        wird im Hintergrund schon geöffnet.
+        """
+        rate = self.scheduler.clock.rate if self.scheduler else 1.0
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.cap.release()
+        segment = self.trip.segments[index]
+        self.segment_index = index
+        self.video_path = segment.path
+        cap = self.take_prefetched(index) or cv2.VideoCapture(segment.path)
+        if not cap.isOpened():
+            raise Exception("Fehler beim Öffnen des Videos.")
+        # Videoeigenschaften ermitteln
+        self.cap = cap
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+
+        # Ab hier gehört self.cap dem Decoder-Thread
+        self.decoder = frame_pipeline.FrameDecoder(self.cap, self.video_width, depth=self.buffer_depth)
+        if position > 0:
+            self.decoder.seek(position)
+        self.decoder.start()
+        self.scheduler = frame_pipeline.PlaybackScheduler(self.decoder, self.fps, rate)
+        self.scheduler.clock.seek(position)
+        if self.playing:
+            self.scheduler.clock.start()
+        self.position = position
+
+        # Keyframe-Index aus der 'stss'/'stts' Box: beim Ziehen des Sliders wird nur
+        # zu Keyframes gesprungen, erst beim Loslassen an die genaue Position
+        with open(self.video_path, "rb") as f:
+            self.keyframes = frame_pipeline.KeyframeIndex(nvtk_mp42gpx.read_keyframe_times(f))
+
+        self.thumbnails = None
+        self.thumbnails_requested = None
+        self.prefetch(index + 1)
+        self.segment_var.set("Clip %d/%d: %s" % (index + 1, len(self.trip.segments),
+                                                 os.path.basename(segment.path)))
+        if self.on_segment:
+            self.on_segment(index)
+
+    def prefetch(self, index):
+        """
+        Öffnet die VideoCapture des Clips index im Hintergrund; andere vorab
+        geöffnete Clips werden freigegeben.
+        """
+        with self.prefetch_lock:
+            self.prefetch_index = index
+            for other in list(self.prefetched):
+                if other != index:
+                    self.prefetched.pop(other).release()
+            if index >= len(self.trip.segments) or index in self.prefetched:
+                return
+
+        def open_capture():
+            cap = cv2.VideoCapture(self.trip.segments[index].path)
+            with self.prefetch_lock:
+                if self.prefetch_index == index and index not in self.prefetched:
+                    self.prefetched[index] = cap
+                    return
+            cap.release()
+
+        threading.Thread(target=open_capture, daemon=True).start()
+
+    def take_prefetched(self, index):
+        with self.prefetch_lock:
+            return self.prefetched.pop(index, None)
+
+    def get_segment_offset(self):
+        """
+        Beginn des aktiven Clips auf der Zeitachse der Fahrt in ms
+        """
+        return self.trip.offsets[self.segment_index] * 1000.0
+
     def play(self):
         if not self.playing:
             self.playing = True
+            self.scheduler.clock.start()
             self.update_frame()
 
     def pause(self):
         self.playing = False
+        self.scheduler.clock.pause()
+
+    def on_rate(self):
+        self.scheduler.clock.set_rate(float(self.rate_var.get()))
 
     def loadfilefromdisk(self):
         print('xxx')
@@ -282,65 +614,223 @@ class OpenCVVideoPlayer(tk.Frame):
         resized = cv2.resize(image, dim, interpolation = inter)
         return resized
 
+    def show_frame(self, frame):
+        """
+        Zeigt ein (schon verkleinertes RGB-) Bild an; das PhotoImage wird
+        nur einmal angelegt (und bei einem Clip mit anderer Größe neu) und
+        danach nur noch überschrieben.
+        """
+        image = Image.fromarray(frame)
+        if self.photo is None or (self.photo.width(), self.photo.height()) != image.size:
+            self.photo = ImageTk.PhotoImage(image=image)
+            self.video_panel.config(image=self.photo)
+        else:
+            self.photo.paste(image)
+
+    def take_frame(self):
+        """
+        Holt das jetzt fällige Bild vom Decoder und zeigt es an.
+        Gibt False zurück, wenn (noch) keines bereit ist.
+        """
+        item = self.scheduler.tick()
+        if item is None:
+            return False
+        _, self.position, frame = item
+        self.current_frame = frame
+        self.show_frame(frame)
+        return True
+
     def update_frame(self):
         """
-        Liest den nächsten Frame, konvertiert ihn und zeigt ihn im Label an.
-        Falls das Video noch läuft, wird die Funktion erneut über after() aufgerufen.
+        Zeigt das nach der Uhr fällige, vom Decoder-Thread fertig vorbereitete Bild
+        im Label an. Falls das Video noch läuft, wird die Funktion erneut über after()
+        aufgerufen, und zwar genau dann, wenn das nächste Bild fällig ist.
+        Am Ende eines Clips geht es mit dem nächsten Clip der Fahrt weiter.
         """
         if self.playing:
-            ret, frame = self.cap.read()
-            if ret:
-                self.current_frame = frame
-                # Konvertiere BGR (OpenCV) zu RGB (Pillow)
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_rgb = self.image_resize(frame_rgb, 600)
-                image = Image.fromarray(frame_rgb)
-
-                imgtk = ImageTk.PhotoImage(image=image)
-                self.video_panel.imgtk = imgtk  # Referenz speichern
-                self.video_panel.config(image=imgtk)
+            if self.take_frame():
                 # Aktualisiere den Slider basierend auf der aktuellen Wiedergabezeit
-                current_time = self.cap.get(cv2.CAP_PROP_POS_MSEC)
-                if self.duration > 0:
-                    normalized = (current_time / self.duration) * 1000
-                    self.scale_var.set(normalized)
-                delay = int(1000 / self.fps)
-                self.after(delay, self.update_frame)
+                self.set_slider()
+                self.after(self.scheduler.delay(), self.update_frame)
+            elif self.decoder.is_finished():
+                if self.segment_index + 1 < len(self.trip.segments):
+                    self.open_segment(self.segment_index + 1)
+                    self.after(1, self.update_frame)
+                else:
+                    # Fahrt zu Ende – Wiedergabe stoppen
+                    self.playing = False
             else:
-                # Video zu Ende – Wiedergabe stoppen
-                self.playing = False
+                # Decoder ist noch nicht so weit, gleich nochmal versuchen
+                self.after(5, self.update_frame)
 
-    def on_slider(self, value):
+    def show_paused_frame(self):
         """
-        Wird aufgerufen, wenn der Schieberegler bewegt wird.
-        Setzt den Videostand basierend auf dem normierten Slider-Wert.
+        Zeigt nach dem Springen im pausierten Zustand das erste Bild an der neuen Position.
+        """
+        if self.paused_pending:
+            # es wartet schon eine Abfrage auf das Bild
+            return
+        self.poll_paused_frame()
+
+    def poll_paused_frame(self):
+        self.paused_pending = False
+        if not self.playing and not self.take_frame() and not self.decoder.is_finished():
+            self.paused_pending = True
+            self.after(10, self.poll_paused_frame)
+
+    def seek(self, new_time):
+        """
+        Springt an new_time (ms auf der Zeitachse der Fahrt), falls nötig in einen
+        anderen Clip. Der Decoder-Thread führt nur die jeweils letzte Anfrage aus,
+        noch nicht bearbeitete Sprünge werden verworfen.
         """
+        index, position = self.trip.locate(new_time)
+        if index != self.segment_index:
+            self.open_segment(index, position)
+        else:
+            self.scheduler.seek(position)
+        self.position = position
+        if not self.playing:
+            self.show_paused_frame()
+
+    def get_slider_time(self, value):
         try:
             val = float(value)
         except ValueError:
             val = 0.0
-        new_time = (val / 1000) * self.duration
-        self.cap.set(cv2.CAP_PROP_POS_MSEC, new_time)
-        if not self.playing:
-            ret, frame = self.cap.read()
-            if ret:
-                self.current_frame = frame
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                image = Image.fromarray(frame_rgb)
-                panel_width = self.video_panel.winfo_width()
-                panel_height = self.video_panel.winfo_height()
-                if panel_width > 0 and panel_height > 0:
-                    image = image.resize((panel_width, panel_height))
-                imgtk = ImageTk.PhotoImage(image=image)
-                self.video_panel.imgtk = imgtk
-                self.video_panel.config(image=imgtk)
+        return (val / 1000) * self.duration
+
+    def set_slider(self):
+        if self.duration > 0:
+            normalized = ((self.get_segment_offset() + self.position) / self.duration) * 1000
+            self.scale_var.set(normalized)
+
+    def on_slider(self, value):
+        """
+        Wird aufgerufen, wenn der Schieberegler bewegt wird.
+        Setzt den Videostand basierend auf dem normierten Slider-Wert;
+        während des Ziehens nur auf den nächstgelegenen Keyframe des aktiven Clips
+        (in andere Clips wird erst beim Loslassen gewechselt).
+        """
+        new_time = self.get_slider_time(value)
+        if self.dragging:
+            index, position = self.trip.locate(new_time)
+            if index != self.segment_index:
+                return
+            new_time = self.get_segment_offset() + self.keyframes.nearest(position)
+            if new_time == self.last_seek:
+                # gleicher Keyframe wie beim letzten Ereignis
+                return
+            self.last_seek = new_time
+        self.seek(new_time)
+
+    def on_slider_press(self, event):
+        self.dragging = True
+        self.last_seek = None
+
+    def on_slider_release(self, event):
+        """
+        Beim Loslassen an die genaue Position springen.
+        """
+        self.dragging = False
+        self.seek(self.get_slider_time(self.scale_var.get()))
+
+    def request_thumbnails(self):
+        """
+        Fordert die Vorschaubilder des aktiven Clips an (einmal pro Clip).
+        """
+        if self.thumbnails is None and self.thumbnails_requested != self.segment_index:
+            self.thumbnails_requested = self.segment_index
+            self.thumbnail_queue.put(self.segment_index)
+
+    def thumbnail_worker(self):
+        """
+        Thumbnail-Thread: arbeitet die angeforderten Clips nacheinander ab, None beendet ihn.
+        """
+        while True:
+            index = self.thumbnail_queue.get()
+            if index is None:
+                return
+            self.load_thumbnails(index)
+
+    def load_thumbnails(self, index):
+        """
+        Läuft im Thumbnail-Thread; self.thumbnails bleibt None, bis alle Bilder
+        des Clips da sind (und wird nicht gesetzt, wenn inzwischen ein anderer Clip aktiv ist).
+        Clips, die bis zum Start nicht mehr aktiv sind, werden übersprungen.
+        """
+        if index != self.segment_index:
+            return
+        segment = self.trip.segments[index]
+        try:
+            thumbnails = thumbnail_cache.load_or_build_interval(segment.path, segment.duration * 1000,
+                                                               jobs=1)
+        except Exception as error:
+            print("Fehler beim Erzeugen der Vorschaubilder:", error)
+            return
+        if index == self.segment_index:
+            self.thumbnails = thumbnails
+
+    def show_preview(self, position, x, y):
+        """
+        Zeigt das Vorschaubild zur Position (ms im aktiven Clip) in einem kleinen
+        Fenster bei (x, y) an, ohne den Decoder zu benutzen.
+        """
+        if self.thumbnails is None:
+            self.request_thumbnails()
+            return
+        thumbnail = self.thumbnails.get(position)
+        if thumbnail is None:
+            return
+        image = Image.fromarray(thumbnail)
+        if self.preview is None:
+            self.preview = tk.Toplevel(self)
+            self.preview.overrideredirect(True)
+            self.preview_photo = ImageTk.PhotoImage(image=image)
+            tk.Label(self.preview, image=self.preview_photo, bd=1, relief="solid").pack()
+        else:
+            self.preview_photo.paste(image)
+            self.preview.deiconify()
+        self.preview.geometry("+%d+%d" % (x, y))
+
+    def hide_preview(self, event=None):
+        if self.preview is not None:
+            self.preview.withdraw()
+
+    def on_slider_hover(self, event):
+        """
+        Vorschaubild zur Stelle unter dem Mauszeiger über dem Slider (nur im aktiven Clip).
+        """
+        thumbnails = self.thumbnails
+        if self.dragging:
+            return
+        if thumbnails is None:
+            self.request_thumbnails()
+            return
+        value = str(self.slider.tk.call(str(self.slider), "get", event.x, event.y))
+        index, position = self.trip.locate(self.get_slider_time(value))
+        if index != self.segment_index:
+            self.hide_preview()
+            return
+        height = thumbnails.thumbnails.shape[1]
+        self.show_preview(position, event.x_root - thumbnails.thumbnails.shape[2] // 2,
+                          event.y_root - height - 20)
+
+    def close(self):
+        """
+        Stoppt die Wiedergabe und den Decoder-Thread.
+        """
+        self.playing = False
+        self.decoder.stop()
+        self.cap.release()
+        self.prefetch(len(self.trip.segments))
+        self.thumbnail_queue.put(None)
 
     def update_slider(self):
         if self.playing:
-            current_time = self.cap.get(cv2.CAP_PROP_POS_MSEC)
-            if self.duration > 0:
-                normalized = (current_time / self.duration) * 1000
-                self.scale_var.set(normalized)
+            self.set_slider()
+        self.frames_var.set("übersprungen: %d, verspätet: %d"
+                            % (self.scheduler.dropped, self.scheduler.late))
         self.after(500, self.update_slider)
 
 
@@ -348,10 +838,31 @@ class OpenCVVideoPlayer(tk.Frame):
 # VideoMapApp: Hauptanwendung – links der Videoplayer, rechts die Karte
 # -------------------------------------------------------------------
 class VideoMapApp(tk.Frame):
-    def __init__(self, master, video_path, map_url, video_start_epoch, coordinates, *args, **kwargs):
+    # Aktualisierungsintervall der Anzeigen in ms (zwischen den 1Hz-Fixes wird interpoliert);
+    # den Marker bewegt die Karte selbst
+    marker_interval = 100
+    # Abweichung in s zwischen Video und der Uhr der Karte, ab der neu abgeglichen wird
+    sync_tolerance = 0.25
+    # Mindestabstand in s zwischen zwei Aktualisierungen der Route, solange noch Daten ankommen
+    route_interval = 2.0
+
+    # Abfrageintervall der Queue mit den GPS-Daten aus dem Hintergrund-Thread in ms
+    queue_interval = 50
+
+    def __init__(self, master, trip, map_url, *args, **kwargs):
         tk.Frame.__init__(self, master, *args, **kwargs)
-        self.video_start_epoch = video_start_epoch  # Video-Startzeit (Epoch Time in s)
-        self.coordinates = coordinates              # Liste der GPS-Daten (Dicts mit "lat", "lon", "epoch")
+        self.trip = trip
+        # Die GPS-Daten werden nur für den aktiven und den nächsten Clip im Hintergrund
+        # extrahiert: Index des Clips -> {"queue", "coordinates", "done"}
+        self.segment_gps = {}
+        self.gps_done = False
+        self.video_start_epoch = None  # Video-Startzeit des aktiven Clips (Epoch Time in s)
+        self.coordinates = []          # Liste der GPS-Daten (Dicts mit "lat", "lon", "epoch")
+        self.route_dirty = False       # Route/Track müssen neu an die Karte geschickt werden
+        self.route_time = 0.0          # Zeitpunkt der letzten Aktualisierung der Route
+        self.playback_sent = None      # zuletzt an die Karte geschickter Stand der Wiedergabe
+        # Nach Zeit sortierter Index für schnelle Suche (bisect), wächst mit den Daten
+        self.track = track_index.TrackIndex.from_coordinates(self.coordinates)
 
         # Layout: Zwei Spalten (links: Video, rechts: Karte)
         self.columnconfigure(0, weight=1)
@@ -359,7 +870,7 @@ class VideoMapApp(tk.Frame):
         self.rowconfigure(0, weight=1)
 
         # Linker Bereich: OpenCV-Videoplayer
-        self.video_frame = OpenCVVideoPlayer(self, video_path)
+        self.video_frame = OpenCVVideoPlayer(self, trip)
         self.video_frame.grid(row=0, column=0, sticky="nsew")
 
         # Rechter Bereich: Karte und Steuerung
@@ -369,7 +880,10 @@ class VideoMapApp(tk.Frame):
         right_frame.rowconfigure(1, weight=0)
         right_frame.columnconfigure(0, weight=1)
 
-        self.browser_frame = BrowserFrame(right_frame, map_url)
+        self.browser_frame = BrowserFrame(right_frame, map_url, {
+            "pyMapHover": self.on_map_hover,
+            "pyMapHoverEnd": self.video_frame.hide_preview,
+        })
         self.browser_frame.grid(row=0, column=0, sticky="nsew")
 
         # Optionale manuelle Map-Daten
@@ -407,7 +921,10 @@ class VideoMapApp(tk.Frame):
         self.Label_gps_time.grid(row=0, column=0, sticky="ew", padx=15, pady=2)
 
 
-        # Starte den periodischen Timer zur Aktualisierung des Markers
+        # Starte die Abfrage der GPS-Daten und den periodischen Timer zur Aktualisierung des Markers
+        self.on_segment_change(self.video_frame.segment_index)
+        self.video_frame.on_segment = self.on_segment_change
+        self.poll_gps_queue()
         self.update_map_marker()
         self.video_frame.play()
         self.video_frame.pause()
@@ -415,110 +932,221 @@ class VideoMapApp(tk.Frame):
 
         self.after(3000, self.video_frame.play)
 
+    def poll_gps_queue(self):
+        """
+        Übernimmt die vom Hintergrund-Thread gelieferten Daten, ohne die
+        Tk-Schleife zu blockieren; läuft alle queue_interval ms.
+        """
+        changed = False
+        for gps in self.segment_gps.values():
+            try:
+                while True:
+                    kind, value = gps["queue"].get_nowait()
+                    if kind == "fixes":
+                        gps["coordinates"].extend(value)
+                        changed = True
+                    elif kind == "error":
+                        print("Fehler beim Lesen der GPS-Daten:", value)
+                    elif kind == "done":
+                        gps["done"] = True
+                        changed = True
+            except queue.Empty:
+                pass
+        if changed:
+            self.update_coordinates()
+        self.after(self.queue_interval, self.poll_gps_queue)
+
+    def on_segment_change(self, index):
+        """
+        Ein anderer Clip ist aktiv: GPS-Daten nur für ihn und den nächsten Clip
+        behalten bzw. im Hintergrund extrahieren, die übrigen verwerfen.
+        """
+        wanted = [i for i in (index, index + 1) if i < len(self.trip.segments)]
+        for other in list(self.segment_gps):
+            if other not in wanted:
+                del self.segment_gps[other]
+        for i in wanted:
+            if i not in self.segment_gps:
+                self.segment_gps[i] = {"queue": start_extraction(self.trip.segments[i].path),
+                                       "coordinates": [], "done": False}
+        self.video_start_epoch = self.trip.segments[index].start_epoch
+        # die Karte mit dem neuen Clip neu abgleichen
+        self.playback_sent = None
+        self.update_coordinates()
+
+    def update_coordinates(self):
+        """
+        Fasst die GPS-Daten der geladenen Clips zusammen und baut den Index neu auf.
+        """
+        self.coordinates = []
+        for i in sorted(self.segment_gps):
+            self.coordinates.extend(self.segment_gps[i]["coordinates"])
+        self.track = track_index.TrackIndex.from_coordinates(self.coordinates)
+        self.route_dirty = True
+        self.gps_done = all(gps["done"] for gps in self.segment_gps.values())
+        if self.gps_done and not self.coordinates:
+            print("Keine GPS-Daten gefunden.")
+            self.gui_var_gpstime.set("Keine GPS-Daten")
+
+    def send_route(self):
+        """
+        Schickt die Route (vereinfacht, in Stufen je Zoom) und den ganzen Track
+        (für den Marker, in voller Auflösung) an die Karte, sobald neue Punkte
+        angekommen sind; während noch Daten ankommen höchstens alle route_interval s.
+        """
+        if not self.route_dirty or not self.browser_frame.loaded:
+            return
+        if not self.gps_done and time.time() - self.route_time < self.route_interval:
+            return
+        levels = json.dumps(get_route_levels(self.coordinates))
+        epoch0, lat0, lon0, data = self.track.pack()
+        data = base64.b64encode(data).decode("ascii")
+        self.browser_frame.browser.ExecuteJavascript(
+            f"window.setRoute({levels}); window.setTrack({epoch0}, {lat0}, {lon0}, '{data}');")
+        self.route_dirty = False
+        self.route_time = time.time()
+
+    def sync_playback(self):
+        """
+        Die Karte bewegt den Marker mit eigener Uhr; geschickt wird nur, wenn sich der
+        Stand der Wiedergabe ändert (Play/Pause, Springen, Geschwindigkeit) oder die
+        Uhr der Karte um mehr als sync_tolerance s vom Video abweicht.
+        """
+        clock = self.video_frame.scheduler.clock
+        epoch = self.video_start_epoch + clock.position() / 1000.0
+        playing = self.video_frame.playing
+        now = time.time()
+        if self.playback_sent:
+            sent_epoch, sent_rate, sent_playing, sent_time = self.playback_sent
+            expected = sent_epoch + ((now - sent_time) * sent_rate if sent_playing else 0.0)
+            if (sent_rate == clock.rate and sent_playing == playing
+                    and abs(expected - epoch) <= self.sync_tolerance):
+                return
+        self.browser_frame.browser.ExecuteJavascript(
+            f"window.setPlayback({epoch}, {clock.rate}, {'true' if playing else 'false'});")
+        self.playback_sent = (epoch, clock.rate, playing, now)
+
+    def on_map_hover(self, lat, lon):
+        """
+        Wird aus der Karte aufgerufen, wenn die Maus über der Route ist:
+        zeigt das Vorschaubild zum nächstgelegenen GPS-Punkt.
+        """
+        if self.video_start_epoch is None or not len(self.track):
+            return
+        index = self.track.nearest_point(lat, lon)
+        position = (self.track.epochs[index] - self.video_start_epoch) * 1000.0
+        if not 0 <= position <= self.trip.segments[self.video_frame.segment_index].duration * 1000.0:
+            # Punkt gehört zum nächsten Clip, für den es noch keine Vorschaubilder gibt
+            self.video_frame.hide_preview()
+            return
+        x, y = self.winfo_pointerxy()
+        self.video_frame.show_preview(position, x + 15, y + 15)
+
     def get_nearest_coordinate(self, current_epoch):
         """
-        Sucht in der Liste der GPS-Daten den Eintrag,
-        dessen "epoch" am nächsten an current_epoch liegt.
+        Sucht im Track-Index den Eintrag,
+        dessen "epoch" am nächsten an current_epoch liegt (O(log n)).
         """
-        nearest = None
-        smallest_diff = float('inf')
-        for coord in self.coordinates:
-            diff = abs(coord["epoch"] - current_epoch)
-            if diff < smallest_diff:
-                smallest_diff = diff
-                nearest = coord
-        return nearest
+        index = self.track.nearest(current_epoch)
+        if index is None:
+            return None
+        return self.track.get(index)
+
+    def get_current_epoch(self):
+        """
+        Aktuelle Epoch Time = Video-Startzeit + aktuelle Videoposition (in s)
+        """
+        return self.video_start_epoch + (self.video_frame.position / 1000.0)
+
+    def set_marker(self, lat, lon):
+        if self.browser_frame.browser:
+            js_code = f"window.updateMarker({lat}, {lon});"
+            self.browser_frame.browser.ExecuteJavascript(js_code)
 
     def update_map_marker(self):
         """
         Ermittelt anhand der aktuellen Video-Position (plus Video-Startzeit)
-        den nächstgelegenen GPS-Punkt und aktualisiert den Marker in der Karte.
-        Diese Funktion wird alle 500 ms erneut aufgerufen.
-        """
-        # Hole die aktuelle Wiedergabezeit (in ms)
-        current_time_ms = self.video_frame.cap.get(cv2.CAP_PROP_POS_MSEC)
-        # Umrechnung in Sekunden
-        current_time = current_time_ms / 1000.0
-        # Aktuelle Epoch Time = Video-Startzeit + aktuelle Videodauer (in s)
-        current_epoch = self.video_start_epoch + current_time
+        die zwischen den GPS-Punkten interpolierte Position und aktualisiert
+        die Anzeigen; den Marker bewegt die Karte selbst (siehe sync_playback).
+        Diese Funktion wird alle marker_interval ms erneut aufgerufen.
+        """
+        self.send_route()
+        if self.video_start_epoch is None or not self.browser_frame.loaded:
+            self.after(self.marker_interval, self.update_map_marker)
+            return
+        self.sync_playback()
+        current_epoch = self.get_current_epoch()
         nearest_coord = self.get_nearest_coordinate(current_epoch)
         if nearest_coord and self.browser_frame.browser:
-            lat = nearest_coord["lat"]
-            lon = nearest_coord["lon"]
-            js_code = f"window.updateMarker({lat}, {lon});"
-            self.browser_frame.browser.ExecuteJavascript(js_code)
+            lat, lon, speed, _ = self.track.interpolate(current_epoch)
 
-            speed_kmh = round(nearest_coord["speed"] * 3.6, 2)
-            speed_mps = round(nearest_coord["speed"], 4)
+            speed_kmh = round(speed * 3.6, 2)
+            speed_mps = round(speed, 4)
             speedstring_kmh = str(str(speed_kmh) + " km/h")
             speedstring_mps = str(str(speed_mps) + " m/s")
             self.gui_speed_kmh_var.set(speedstring_kmh)
             self.gui_speed_mps_var.set(speedstring_mps)
-            plat_str = str( "Lat.: " + str(nearest_coord["lat"]))
-            plon_str = str( "Lon.: " + str(nearest_coord["lon"]))
+            plat_str = str( "Lat.: " + str(round(lat, 6)))
+            plon_str = str( "Lon.: " + str(round(lon, 6)))
             self.gui_var_lat.set(plat_str)
             self.gui_var_lon.set(plon_str)
             ptime = str(nearest_coord["date"])
             self.gui_var_gpstime.set(ptime)
 
-        self.after(500, self.update_map_marker)
+        self.after(self.marker_interval, self.update_map_marker)
 
     def go_forward(self):
         """
         Manuelle Steuerung: Setzt den Marker auf den nächsten GPS-Punkt.
         (Kann alternativ zur automatischen Aktualisierung verwendet werden.)
         """
-        # Finde den aktuell angezeigten Punkt
-        current_epoch = self.video_start_epoch + (self.video_frame.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
-        # Suche den ersten Punkt, dessen epoch größer als current_epoch ist
-        for coord in self.coordinates:
-            if coord["epoch"] > current_epoch:
-                if self.browser_frame.browser:
-                    js_code = f"window.updateMarker({coord['lat']}, {coord['lon']});"
-                    self.browser_frame.browser.ExecuteJavascript(js_code)
-                break
+        if self.video_start_epoch is None:
+            return
+        index = self.track.next_index(self.get_current_epoch())
+        if index is not None:
+            self.set_marker(self.track.lats[index], self.track.lons[index])
 
     def go_back(self):
         """
         Manuelle Steuerung: Setzt den Marker auf den vorherigen GPS-Punkt.
         """
-        current_epoch = self.video_start_epoch + (self.video_frame.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
-        for coord in reversed(self.coordinates):
-            if coord["epoch"] < current_epoch:
-                if self.browser_frame.browser:
-                    js_code = f"window.updateMarker({coord['lat']}, {coord['lon']});"
-                    self.browser_frame.browser.ExecuteJavascript(js_code)
-                break
+        if self.video_start_epoch is None:
+            return
+        index = self.track.previous_index(self.get_current_epoch())
+        if index is not None:
+            self.set_marker(self.track.lats[index], self.track.lons[index])
 
 
 # -------------------------------------------------------------------
 # Hauptfunktion
 # -------------------------------------------------------------------
-def main():
-    # 1. Dateiauswahl: Wähle die MP4-Datei aus.
-    file_root = tk.Tk()
-    file_root.withdraw()  # Hauptfenster verstecken
-    video_file = filedialog.askopenfilename(
-        title="Bitte wählen Sie eine MP4-Datei",
-        filetypes=[("MP4 Dateien", "*.mp4")]
-    )
-    file_root.destroy()
+def main(video_file=None):
+    # 1. Dateiauswahl: Wähle die MP4-Datei aus (oder übergebene Datei bzw.
+    #    übergebenes Verzeichnis: alle Clips darin als eine Fahrt).
+    if video_file is None:
+        file_root = tk.Tk()
+        file_root.withdraw()  # Hauptfenster verstecken
+        video_file = filedialog.askopenfilename(
+            title="Bitte wählen Sie eine MP4-Datei",
+            filetypes=[("MP4 Dateien", "*.mp4")]
+        )
+        file_root.destroy()
 
     if not video_file:
         print("Keine Datei ausgewählt. Programm wird beendet.")
         return
     print("Ausgewählte Datei:", video_file)
 
-    # 2. Extrahiere die Video-Startzeit und GPS-Daten aus dem Video.
-    video_start_epoch, coordinates = extract_coordinates_from_mp4(video_file)
-    if not coordinates:
-        print("Keine GPS-Daten gefunden. Programm wird beendet.")
+    # 2. Clips der Fahrt nach ihrer Startzeit ordnen (nur die Header werden gelesen).
+    #    Video-Startzeit und GPS-Daten werden im Hintergrund für den aktiven und den
+    #    nächsten Clip extrahiert, das Fenster öffnet sich sofort.
+    trip = load_trip(video_file)
+    if not trip.segments:
+        print("Keine lesbaren Videos gefunden. Programm wird beendet.")
         return
-    # Verwende als initiale Kartenposition den ersten GPS-Punkt
-    initial_coord = (coordinates[0]["lat"], coordinates[0]["lon"])
 
-    # 3. Erstelle die Folium‑Karte und speichere sie als temporäre HTML‑Datei.
-    m = create_map(initial_coord, coordinates)
+    # 3. Erstelle die (noch leere) Folium‑Karte und speichere sie als temporäre HTML‑Datei.
+    m = create_map()
     temp_dir = tempfile.gettempdir()
     map_file = os.path.join(temp_dir, "folium_map.html")
     m.save(map_file)
@@ -533,14 +1161,14 @@ def main():
     #root.geometry("1200x700")
     root.title("Python dashcam player")
 
-    app = VideoMapApp(root, video_file, map_url, video_start_epoch, coordinates)
+    app = VideoMapApp(root, trip, map_url)
     app.grid(row=0, column=0, sticky="n")
 
     def on_closing():
         if app.browser_frame.browser:
             app.browser_frame.browser.CloseBrowser(True)
-        # Stoppe das Video (falls es läuft)
-        app.video_frame.playing = False
+        # Stoppe das Video (falls es läuft) und den Decoder-Thread
+        app.video_frame.close()
         root.destroy()
         cef.Shutdown()
         print("xxxx")
@@ -558,4 +1186,5 @@ if __name__ == '__main__':
     if 'rundashcamscript' in dsp_name and startup_arguments in dsp_name:
         the_program_to_hide = win32gui.GetForegroundWindow()
         win32gui.ShowWindow(the_program_to_hide , win32con.SW_HIDE)
-    main()
+    # optional: MP4-Datei oder Verzeichnis mit den Clips einer Fahrt
+    main(sys.argv[2] if len(sys.argv) > 2 else None)
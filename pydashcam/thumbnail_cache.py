@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+""" Low resolution thumbnails of a video for scrubbing previews.
+
+The thumbnails are taken at a fixed interval (or at any given positions) by a
+couple of worker processes (each decoding its own part of the video) or in the
+calling process, and stored as a compressed .npz next to the track cache, so a
+preview never has to go through the player's decoder.
+"""
+
+import concurrent.futures
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+import frame_pipeline
+import track_cache
+
+THUMB_SUFFIX = '.thumbs.npz'
+THUMB_WIDTH = 160
+# ms between two thumbnails
+DEFAULT_INTERVAL = 1000
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# worker processes of build_thumbnails, few so they do not starve the video playback
+DEFAULT_JOBS = 2
+# thumbnails closer than this (in s of video) are reached with grab() instead of a seek
+GRAB_SECONDS = 2
+
+
+def get_interval_positions(duration, interval=DEFAULT_INTERVAL):
+    """ thumbnail positions (ms) every 'interval' ms of a video of 'duration' ms """
+    return np.arange(0, max(duration, 0), interval, dtype=np.float64)
+
+
+def extract_thumbnails(video_path, positions, width=THUMB_WIDTH):
+    """ decodes the frames at the sorted positions (ms) into an array of RGB thumbnails;
+    frames that cannot be read stay black """
+    cap = cv2.VideoCapture(video_path)
+    size = frame_pipeline.get_scaled_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                          int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width)
+    thumbnails = np.zeros((len(positions), size[1], size[0], 3), np.uint8)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    next_frame = None
+    for index, position in enumerate(positions):
+        frame_index = int(round(position * fps / 1000.0))
+        if next_frame is None or not 0 <= frame_index - next_frame <= GRAB_SECONDS * fps:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            next_frame = frame_index
+        while next_frame < frame_index and cap.grab():
+            next_frame += 1
+        ret, frame = cap.read()
+        if not ret:
+            break
+        next_frame += 1
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=thumbnails[index])
+    cap.release()
+    return thumbnails
+
+
+def build_thumbnails(video_path, positions, width=THUMB_WIDTH, jobs=None):
+    """ extracts the thumbnails with 'jobs' worker processes (default: DEFAULT_JOBS, 1
+    decodes in the calling process), each one decoding a contiguous part of the video;
+    returns a ThumbnailStrip """
+    positions = np.sort(np.asarray(positions, dtype=np.float64))
+    jobs = max(1, min(jobs or DEFAULT_JOBS, os.cpu_count() or 1, len(positions)))
+    parts = np.array_split(positions, jobs)
+    if jobs == 1:
+        thumbnails = [extract_thumbnails(video_path, positions, width)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            thumbnails = list(executor.map(extract_thumbnails, [video_path] * jobs, parts,
+                                           [width] * jobs))
+    return ThumbnailStrip(positions, np.concatenate(thumbnails))
+
+
+class ThumbnailStrip(object):
+    """ thumbnails sorted by their position in the video (ms) """
+
+    def __init__(self, positions, thumbnails):
+        self.positions = positions
+        self.thumbnails = thumbnails
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, position):
+        """ the thumbnail closest to position (ms), None for an empty strip """
+        if not len(self.positions):
+            return None
+        index = int(np.searchsorted(self.positions, position))
+        if index == len(self.positions) or (
+                index > 0 and position - self.positions[index - 1] <= self.positions[index] - position):
+            index -= 1
+        return self.thumbnails[index]
+
+
+class ThumbnailCache(track_cache.TrackCache):
+    """ thumbnail strips in the track cache directory, evicted (LRU) separately from the tracks """
+    suffix = THUMB_SUFFIX
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        track_cache.TrackCache.__init__(self, cache_dir, max_bytes)
+
+    def get_entry_path(self, path, label):
+        """ path of the strip for the given file and thumbnail settings (label) """
+        key = "%s-%s" % (track_cache.get_file_identity(path), label)
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, path, label):
+        """ returns the cached ThumbnailStrip for the file, or None on a cache miss """
+        try:
+            entry = self.get_entry_path(path, label)
+            with np.load(entry) as data:
+                strip = ThumbnailStrip(data['positions'], data['thumbnails'])
+            os.utime(entry)
+        except (OSError, KeyError, ValueError):
+            return None
+        return strip
+
+    def put(self, path, label, strip):
+        """ stores the ThumbnailStrip for the file, then evicts old entries if needed """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry = self.get_entry_path(path, label)
+            tmp_fh, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            with os.fdopen(tmp_fh, 'wb') as out_fh:
+                np.savez_compressed(out_fh, positions=strip.positions, thumbnails=strip.thumbnails)
+            os.replace(tmp_path, entry)
+        except OSError as error:
+            print("Warning: could not write the thumbnail cache (%s)." % error)
+            return False
+        self.evict()
+        return True
+
+
+def load_or_build(video_path, positions, label, cache=None, width=THUMB_WIDTH, jobs=None):
+    """ returns the ThumbnailStrip from the cache, or builds and caches it """
+    cache = cache or ThumbnailCache()
+    strip = cache.get(video_path, label)
+    if strip is None:
+        strip = build_thumbnails(video_path, positions, width, jobs)
+        cache.put(video_path, label, strip)
+    return strip
+
+
+def load_or_build_interval(video_path, duration, interval=DEFAULT_INTERVAL, cache=None,
+                           width=THUMB_WIDTH, jobs=None):
+    """ thumbnails every 'interval' ms of a video of 'duration' ms, see load_or_build() """
+    return load_or_build(video_path, get_interval_positions(duration, interval),
+                         "i%d-w%d" % (interval, width), cache, width, jobs)
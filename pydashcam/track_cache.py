@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+""" On-disk cache of decoded GPS tracks, so a clip that was parsed once
+does not have to go through the container parser again.
+
+Entries are keyed by the file identity (absolute path, size, mtime and a hash
+of the first/last KB) plus the decoding options, and stored as packed binary
+records. The cache is size limited, the least recently used entries are
+evicted first.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+
+import nvtk_mp42gpx
+
+# bump when the record layout or the meaning of a field changes
+CACHE_VERSION = 2
+CACHE_MAGIC = b'NVTKGPS\x00'
+CACHE_SUFFIX = '.trk'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# bytes hashed at the beginning and at the end of the file
+HASH_BYTES = 1024
+
+HEADER = struct.Struct('<8sHI')
+# epoch, year, month, day, hour, minute, second, lat hemi, lon hemi,
+# lat raw, lat, lon raw, lon, speed, bearing
+RECORD = struct.Struct('<qHBBBBBccdddddd')
+
+
+def get_default_cache_dir():
+    """ PYDASHCAM_CACHE or a 'pydashcam' folder in the user's cache directory """
+    cache_dir = os.environ.get('PYDASHCAM_CACHE')
+    if cache_dir:
+        return cache_dir
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pydashcam')
+
+
+def get_file_identity(path):
+    """ returns a hex digest identifying the file content without reading all of it """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(("%s|%d|%d|" % (path, stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    with open(path, 'rb') as in_fh:
+        digest.update(in_fh.read(HASH_BYTES))
+        if stat.st_size > HASH_BYTES:
+            in_fh.seek(max(stat.st_size - HASH_BYTES, HASH_BYTES), 0)
+            digest.update(in_fh.read(HASH_BYTES))
+    return digest.hexdigest()
+
+
+def pack_track(gps_data):
+    """ packs a list of GpsFix into the binary cache format """
+    chunks = [HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(gps_data))]
+    for gps in gps_data:
+        chunks.append(RECORD.pack(
+            gps.epoch, gps.year, gps.month, gps.day, gps.hour, gps.minute, gps.second,
+            gps.lat_hemi.encode('latin-1'), gps.lon_hemi.encode('latin-1'),
+            gps.lat_raw, gps.lat, gps.lon_raw, gps.lon, gps.speed, gps.bearing))
+    return b''.join(chunks)
+
+
+def unpack_track(data):
+    """ unpacks the binary cache format, returns None if the data is not valid """
+    try:
+        magic, version, count = HEADER.unpack_from(data)
+    except struct.error:
+        return None
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if len(data) != HEADER.size + count * RECORD.size:
+        return None
+    gps_data = []
+    for (epoch, year, month, day, hour, minute, second, lat_hemi, lon_hemi,
+         lat_raw, lat, lon_raw, lon, speed, bearing) in RECORD.iter_unpack(data[HEADER.size:]):
+        gps_data.append(nvtk_mp42gpx.GpsFix(
+            year, month, day, hour, minute, second,
+            lat_hemi.decode('latin-1'), lat_raw, lat,
+            lon_hemi.decode('latin-1'), lon_raw, lon, speed, bearing, epoch))
+    return gps_data
+
+
+class TrackCache(object):
+    """ size limited on-disk cache of decoded tracks with LRU eviction """
+    # entries of other kinds (eg: thumbnails) share the directory with another suffix
+    suffix = CACHE_SUFFIX
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def get_entry_path(self, path, deobfuscate):
+        """ path of the cache entry for the given file and decoding options """
+        key = "%s-%d" % (get_file_identity(path), bool(deobfuscate))
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, path, deobfuscate):
+        """ returns the cached list of GpsFix for the file, or None on a cache miss """
+        try:
+            entry = self.get_entry_path(path, deobfuscate)
+            with open(entry, 'rb') as in_fh:
+                gps_data = unpack_track(in_fh.read())
+            # the mtime of an entry is its last use, see evict()
+            os.utime(entry)
+        except OSError:
+            return None
+        return gps_data
+
+    def put(self, path, deobfuscate, gps_data):
+        """ stores the list of GpsFix for the file, then evicts old entries if needed """
+        try:
+            data = pack_track(gps_data)
+        except (struct.error, UnicodeEncodeError, TypeError):
+            # values that do not fit into the record layout, do not cache
+            return False
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry = self.get_entry_path(path, deobfuscate)
+            # written to a temporary file first so readers never see half an entry
+            tmp_fh, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            with os.fdopen(tmp_fh, 'wb') as out_fh:
+                out_fh.write(data)
+            os.replace(tmp_path, entry)
+        except OSError as error:
+            print("Warning: could not write the track cache (%s)." % error)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """ deletes the least recently used entries until the cache fits into max_bytes """
+        entries = []
+        total = 0
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(self.suffix) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # another process got there first
+                pass
+            total -= size
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+""" Time index over a GPS track for the viewer: sorted parallel arrays with
+O(log n) lookups by epoch and interpolation between the (1Hz) fixes, plus a
+grid over the positions for nearest-point lookups by location. """
+
+import array
+import bisect
+import math
+
+# edge of a cell of the location grid in degrees of latitude (~220m)
+GRID_CELL = 0.002
+
+
+class TrackIndex(object):
+    """ a track sorted by epoch, stored as parallel arrays """
+
+    def __init__(self, epochs, lats, lons, speeds, bearings, dates=None):
+        order = sorted(range(len(epochs)), key=lambda index: epochs[index])
+        self.epochs = array.array('d', (epochs[index] for index in order))
+        self.lats = array.array('d', (lats[index] for index in order))
+        self.lons = array.array('d', (lons[index] for index in order))
+        self.speeds = array.array('d', (speeds[index] for index in order))
+        self.bearings = array.array('d', (bearings[index] for index in order))
+        self.dates = [dates[index] for index in order] if dates else None
+        self.grid = None
+
+    @classmethod
+    def from_coordinates(cls, coordinates):
+        """ builds the index from the viewer's list of coordinate dicts
+        (keys: epoch, lat, lon, speed, bear, date) """
+        return cls([coord["epoch"] for coord in coordinates],
+                   [coord["lat"] for coord in coordinates],
+                   [coord["lon"] for coord in coordinates],
+                   [coord["speed"] for coord in coordinates],
+                   [coord["bear"] for coord in coordinates],
+                   [coord["date"] for coord in coordinates])
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def get(self, index):
+        """ returns the fix at the given index as a coordinate dict """
+        return {
+            "epoch": self.epochs[index],
+            "lat": self.lats[index],
+            "lon": self.lons[index],
+            "speed": self.speeds[index],
+            "bear": self.bearings[index],
+            "date": self.dates[index] if self.dates else None,
+        }
+
+    def pack(self):
+        """ returns (epoch, lat, lon) of the first fix and the track as float32
+        (epoch, lat, lon) triples relative to it, in native byte order (for a
+        JavaScript Float32Array); as offsets float32 stays precise to ~1cm and a few ms """
+        if not self.epochs:
+            return 0.0, 0.0, 0.0, b''
+        epoch0, lat0, lon0 = self.epochs[0], self.lats[0], self.lons[0]
+        data = array.array('f')
+        for epoch, lat, lon in zip(self.epochs, self.lats, self.lons):
+            data.extend((epoch - epoch0, lat - lat0, lon - lon0))
+        return epoch0, lat0, lon0, data.tobytes()
+
+    def nearest(self, epoch):
+        """ index of the fix closest in time to epoch, None for an empty track """
+        if not self.epochs:
+            return None
+        index = bisect.bisect_left(self.epochs, epoch)
+        if index == 0:
+            return 0
+        if index == len(self.epochs):
+            return index - 1
+        if epoch - self.epochs[index - 1] <= self.epochs[index] - epoch:
+            return index - 1
+        return index
+
+    def build_grid(self):
+        """ sorts the fixes into square cells (longitudes scaled by the cosine of
+        the track's middle latitude, so the cells are square on the ground) """
+        middle = (min(self.lats) + max(self.lats)) / 2.0
+        self.grid_scale = math.cos(math.radians(middle))
+        self.grid = {}
+        for index, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            cell = (int(math.floor(lon * self.grid_scale / GRID_CELL)),
+                    int(math.floor(lat / GRID_CELL)))
+            self.grid.setdefault(cell, []).append(index)
+        cols = [col for col, _ in self.grid]
+        rows = [row for _, row in self.grid]
+        self.grid_bounds = (min(cols), max(cols), min(rows), max(rows))
+
+    def nearest_point(self, lat, lon):
+        """ index of the fix closest to (lat, lon), None for an empty track;
+        searches the grid (built on first use) in rings of cells around the
+        point until no closer fix can be left """
+        if not self.epochs:
+            return None
+        if self.grid is None:
+            self.build_grid()
+        x, y = lon * self.grid_scale, lat
+        col, row = int(math.floor(x / GRID_CELL)), int(math.floor(y / GRID_CELL))
+        min_col, max_col, min_row, max_row = self.grid_bounds
+        best, best_distance = None, float('inf')
+        radius = 0
+        while True:
+            for cell_row in range(max(row - radius, min_row), min(row + radius, max_row) + 1):
+                if abs(cell_row - row) == radius:
+                    cell_cols = range(max(col - radius, min_col), min(col + radius, max_col) + 1)
+                else:
+                    cell_cols = [cell_col for cell_col in (col - radius, col + radius)
+                                 if min_col <= cell_col <= max_col]
+                for cell_col in cell_cols:
+                    for index in self.grid.get((cell_col, cell_row), ()):
+                        distance = ((self.lats[index] - y) ** 2
+                                    + (self.lons[index] * self.grid_scale - x) ** 2)
+                        if distance < best_distance or (distance == best_distance and index < best):
+                            best, best_distance = index, distance
+            # every cell outside the rings so far is at least radius cells away
+            if best_distance <= (radius * GRID_CELL) ** 2:
+                return best
+            if (col - radius <= min_col and col + radius >= max_col
+                    and row - radius <= min_row and row + radius >= max_row):
+                return best
+            radius += 1
+
+    def next_index(self, epoch):
+        """ index of the first fix after epoch, None if there is none """
+        index = bisect.bisect_right(self.epochs, epoch)
+        return index if index < len(self.epochs) else None
+
+    def previous_index(self, epoch):
+        """ index of the last fix before epoch, None if there is none """
+        index = bisect.bisect_left(self.epochs, epoch)
+        return index - 1 if index > 0 else None
+
+    def interpolate(self, epoch, great_circle=False):
+        """ returns (lat, lon, speed, bearing) at epoch, interpolated between the two
+        surrounding fixes (linearly or along the great circle); clamped at the ends """
+        if not self.epochs:
+            return None
+        after = bisect.bisect_right(self.epochs, epoch)
+        if after == 0 or after == len(self.epochs):
+            index = 0 if after == 0 else after - 1
+            return self.lats[index], self.lons[index], self.speeds[index], self.bearings[index]
+        before = after - 1
+        span = self.epochs[after] - self.epochs[before]
+        ratio = (epoch - self.epochs[before]) / span if span > 0 else 0.0
+        if great_circle:
+            lat, lon = interpolate_great_circle(
+                self.lats[before], self.lons[before], self.lats[after], self.lons[after], ratio)
+        else:
+            lat = self.lats[before] + (self.lats[after] - self.lats[before]) * ratio
+            lon = self.lons[before] + (self.lons[after] - self.lons[before]) * ratio
+        speed = self.speeds[before] + (self.speeds[after] - self.speeds[before]) * ratio
+        # bearings turn the short way round (350 -> 10 passes 0, not 180)
+        turn = (self.bearings[after] - self.bearings[before] + 180.0) % 360.0 - 180.0
+        bearing = (self.bearings[before] + turn * ratio) % 360.0
+        return lat, lon, speed, bearing
+
+
+def interpolate_great_circle(lat1, lon1, lat2, lon2, ratio):
+    """ spherical linear interpolation between two points (degrees) """
+    phi1, lambda1 = math.radians(lat1), math.radians(lon1)
+    phi2, lambda2 = math.radians(lat2), math.radians(lon2)
+    point1 = (math.cos(phi1) * math.cos(lambda1), math.cos(phi1) * math.sin(lambda1),
+              math.sin(phi1))
+    point2 = (math.cos(phi2) * math.cos(lambda2), math.cos(phi2) * math.sin(lambda2),
+              math.sin(phi2))
+    dot = max(-1.0, min(1.0, sum(a * b for a, b in zip(point1, point2))))
+    angle = math.acos(dot)
+    if angle < 1e-12:
+        return (lat1 + (lat2 - lat1) * ratio, lon1 + (lon2 - lon1) * ratio)
+    weight1 = math.sin((1 - ratio) * angle) / math.sin(angle)
+    weight2 = math.sin(ratio * angle) / math.sin(angle)
+    x, y, z = (weight1 * a + weight2 * b for a, b in zip(point1, point2))
+    return (math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x)))
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+""" Columnar store of decoded tracks for fleet analytics over long periods.
+
+The store is partitioned by vehicle and (UTC) day, every partition holds
+chunks of column files:
+
+    <root>/<vehicle>/<YYYY-MM-DD>/<chunk>/{epoch,lat,lon,speed,bearing,clip}.npy
+    <root>/<vehicle>/<YYYY-MM-DD>/<chunk>/clips.json
+    <root>/<vehicle>/manifest.json
+
+The rows of a chunk are sorted by epoch and 'clip' indexes the chunk's list of
+source clips (absolute path, size and mtime). Chunks are never modified,
+appending writes new ones; a clip that is stored again replaces the chunks
+holding its older rows. The manifest maps every clip of the vehicle to its
+entry and the days it has rows in, so those are found wherever they are; it
+is saved before a chunk is written and may list days without rows of the
+clip, never the other way round. The reader memory-maps only the columns of the
+partitions and chunks a query touches and only pages in the rows within its
+time range.
+"""
+
+import calendar
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+COLUMNS = ('epoch', 'lat', 'lon', 'speed', 'bearing', 'clip')
+DTYPES = {
+    'epoch': np.int64,
+    'lat': np.float64,
+    'lon': np.float64,
+    'speed': np.float32,
+    'bearing': np.float32,
+    'clip': np.int32,
+}
+CLIPS_FILE = 'clips.json'
+MANIFEST_FILE = 'manifest.json'
+DAY_FORMAT = '%Y-%m-%d'
+# rows buffered per partition before a chunk is written
+CHUNK_ROWS = 64 * 1024
+# vehicle names end up as directory names
+VEHICLE_NAME = re.compile(r'^[\w.-]+$')
+
+
+def get_day(epoch):
+    """ the partition (UTC day, YYYY-MM-DD) of an epoch """
+    return time.strftime(DAY_FORMAT, time.gmtime(epoch))
+
+
+def get_day_range(day):
+    """ (first epoch, first epoch of the next day) of a partition day """
+    start = calendar.timegm(time.strptime(day, DAY_FORMAT))
+    return start, start + 86400
+
+
+def check_vehicle(vehicle):
+    if not VEHICLE_NAME.match(vehicle) or vehicle in ('.', '..'):
+        raise ValueError("invalid vehicle name '%s' (letters, digits, '_', '-' and '.')"
+                         % vehicle)
+    return vehicle
+
+
+def write_chunk(partition_dir, columns, clips):
+    """ writes the columns (dict of arrays sorted by epoch) as a new chunk of the
+    partition; the chunk appears at once, readers never see half of it """
+    os.makedirs(partition_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(suffix='.tmp', dir=partition_dir)
+    try:
+        for name in COLUMNS:
+            np.save(os.path.join(tmp_dir, name + '.npy'), columns[name])
+        with open(os.path.join(tmp_dir, CLIPS_FILE), 'w') as out_fh:
+            json.dump(clips, out_fh)
+        # chunk names sort in the order they were written; another writer
+        # may take a name first, then the next one is tried
+        number = len(list_chunks(partition_dir))
+        while True:
+            chunk_dir = os.path.join(partition_dir, '%08d' % number)
+            try:
+                os.rename(tmp_dir, chunk_dir)
+                return chunk_dir
+            except OSError:
+                if not os.path.exists(chunk_dir):
+                    raise
+                number += 1
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def get_clip_entry(clip):
+    """ the clips.json entry of a clip: absolute path, size and mtime (ns), the latter
+    None if the file cannot be read """
+    path = os.path.abspath(clip)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {'path': path, 'size': None, 'mtime': None}
+    return {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def read_clips(chunk_dir):
+    """ the clips.json entries of a chunk """
+    with open(os.path.join(chunk_dir, CLIPS_FILE)) as in_fh:
+        # chunks written before sizes and mtimes were recorded only list the paths
+        return [entry if isinstance(entry, dict) else {'path': entry, 'size': None, 'mtime': None}
+                for entry in json.load(in_fh)]
+
+
+def get_stored_clips(partition_dir):
+    """ path -> clips.json entry of the clips with rows in the partition """
+    return {entry['path']: entry for chunk_dir in list_chunks(partition_dir)
+            for entry in read_clips(chunk_dir)}
+
+
+def remove_clip(partition_dir, path):
+    """ replaces the chunks of the partition with rows of the clip by chunks
+    without them; readers may see both versions of such a chunk for a moment """
+    for chunk_dir in list_chunks(partition_dir):
+        clips = read_clips(chunk_dir)
+        paths = [entry['path'] for entry in clips]
+        if path not in paths:
+            continue
+        index = paths.index(path)
+        columns = {name: np.load(os.path.join(chunk_dir, name + '.npy')) for name in COLUMNS}
+        keep = columns['clip'] != index
+        if keep.any():
+            columns = {name: values[keep] for name, values in columns.items()}
+            # the indexes after the removed clip move down by one
+            columns['clip'] = np.where(columns['clip'] > index, columns['clip'] - 1,
+                                       columns['clip']).astype(DTYPES['clip'])
+            write_chunk(partition_dir, columns, clips[:index] + clips[index + 1:])
+        shutil.rmtree(chunk_dir)
+
+
+def list_chunks(partition_dir):
+    """ the chunk directories of a partition in the order they were written """
+    try:
+        names = sorted(name for name in os.listdir(partition_dir) if name.isdigit())
+    except OSError:
+        return []
+    return [os.path.join(partition_dir, name) for name in names]
+
+
+class TrackStoreWriter(object):
+    """ appends tracks of a vehicle to the store, buffering up to chunk_rows rows
+    per day before writing a chunk; use as a context manager or call close() """
+
+    def __init__(self, root, vehicle, chunk_rows=CHUNK_ROWS):
+        self.root = root
+        self.vehicle = check_vehicle(vehicle)
+        self.chunk_rows = chunk_rows
+        # day -> (list of row tuples, list of clips.json entries)
+        self.pending = {}
+        self.rows = 0
+        # clips that were already stored unchanged
+        self.skipped = 0
+        # path -> clips.json entry with the 'days' of its rows, loaded on first use
+        self.manifest = None
+        self.manifest_changed = False
+        # path -> days of the clips added by this writer
+        self.added = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_partition_dir(self, day):
+        return os.path.join(self.root, self.vehicle, day)
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.root, self.vehicle, MANIFEST_FILE)) as in_fh:
+                return json.load(in_fh)
+        except (OSError, ValueError):
+            pass
+        # no (readable) manifest: stores written before it existed, rebuilt from the chunks
+        manifest = {}
+        for day in TrackStore(self.root).days(self.vehicle):
+            for path, entry in get_stored_clips(self.get_partition_dir(day)).items():
+                manifest.setdefault(path, dict(entry, days=[]))['days'].append(day)
+        self.manifest_changed = True
+        return manifest
+
+    def save_manifest(self):
+        vehicle_dir = os.path.join(self.root, self.vehicle)
+        os.makedirs(vehicle_dir, exist_ok=True)
+        out_fh = tempfile.NamedTemporaryFile('w', suffix='.tmp', dir=vehicle_dir, delete=False)
+        try:
+            with out_fh:
+                json.dump(self.manifest, out_fh, sort_keys=True)
+            os.replace(out_fh.name, os.path.join(vehicle_dir, MANIFEST_FILE))
+        except BaseException:
+            os.unlink(out_fh.name)
+            raise
+        self.manifest_changed = False
+
+    def is_stored(self, entry):
+        """ True if the clip is stored unchanged: its manifest entry matches and every
+        partition listed for it holds it """
+        known = self.manifest.get(entry['path'])
+        if known is None or entry['mtime'] is None:
+            return False
+        if any(known[key] != entry[key] for key in entry):
+            return False
+        # the manifest days of a clip added in this run still include the replaced ones
+        days = self.added.get(entry['path'], known['days'])
+        return bool(days) and all(
+            get_stored_clips(self.get_partition_dir(day)).get(entry['path']) == entry
+            for day in days)
+
+    def add(self, clip, gps_data):
+        """ adds the list of GpsFix decoded from 'clip'; returns False if the clip is
+        already stored and did not change since, rows of an older version are replaced
+        (in all partitions, also those the new rows do not fall into) """
+        if self.manifest is None:
+            self.manifest = self.load_manifest()
+        entry = get_clip_entry(clip)
+        days = {}
+        for gps in gps_data:
+            days.setdefault(get_day(gps.epoch), []).append(gps)
+        known = self.manifest.get(entry['path'])
+        old_days = known['days'] if known is not None else []
+        for day in set(old_days) | set(days):
+            if any(pending['path'] == entry['path']
+                   for pending in self.pending.get(day, ([], []))[1]):
+                # the clip came twice in this run, compare against the written rows
+                self.flush_day(day)
+        if self.is_stored(entry):
+            self.skipped += 1
+            return False
+        for day in old_days:
+            remove_clip(self.get_partition_dir(day), entry['path'])
+        self.manifest[entry['path']] = dict(entry, days=sorted(set(old_days) | set(days)))
+        self.manifest_changed = True
+        self.added[entry['path']] = sorted(days)
+        for day, fixes in sorted(days.items()):
+            rows, clips = self.pending.setdefault(day, ([], []))
+            clips.append(entry)
+            for gps in fixes:
+                rows.append((gps.epoch, gps.lat, gps.lon, gps.speed, gps.bearing, len(clips) - 1))
+                self.rows += 1
+                if len(rows) >= self.chunk_rows:
+                    self.flush_day(day)
+                    rows, clips = self.pending.setdefault(day, ([], [entry]))
+        return True
+
+    def flush_day(self, day):
+        rows, clips = self.pending.pop(day, ([], []))
+        if not rows:
+            return
+        if self.manifest_changed:
+            self.save_manifest()
+        rows.sort(key=lambda row: row[0])
+        columns = {name: np.array([row[index] for row in rows], dtype=DTYPES[name])
+                   for index, name in enumerate(COLUMNS)}
+        write_chunk(self.get_partition_dir(day), columns, clips)
+
+    def flush(self):
+        """ writes all buffered rows """
+        for day in sorted(self.pending):
+            self.flush_day(day)
+
+    def close(self):
+        self.flush()
+        if self.manifest is None:
+            return
+        # all rows are written, the days of the added clips are exact now
+        for path, days in self.added.items():
+            if days:
+                self.manifest[path]['days'] = days
+            else:
+                del self.manifest[path]
+            self.manifest_changed = True
+        self.added = {}
+        if self.manifest_changed:
+            self.save_manifest()
+
+
+class TrackStore(object):
+    """ reader of the columnar store """
+
+    def __init__(self, root):
+        self.root = root
+
+    def vehicles(self):
+        try:
+            return sorted(name for name in os.listdir(self.root)
+                          if os.path.isdir(os.path.join(self.root, name)))
+        except OSError:
+            return []
+
+    def days(self, vehicle):
+        """ the partition days of the vehicle, sorted """
+        try:
+            return sorted(name for name in os.listdir(os.path.join(self.root, vehicle))
+                          if re.match(r'^\d{4}-\d\d-\d\d$', name))
+        except OSError:
+            return []
+
+    def get_partitions(self, vehicles=None, start=None, end=None):
+        """ (vehicle, day, partition dir) of the partitions overlapping [start, end] """
+        for vehicle in vehicles or self.vehicles():
+            for day in self.days(vehicle):
+                day_start, day_end = get_day_range(day)
+                if (start is None or day_end > start) and (end is None or day_start <= end):
+                    yield vehicle, day, os.path.join(self.root, vehicle, day)
+
+    def iter_chunks(self, vehicles=None, start=None, end=None, columns=COLUMNS):
+        """ yields (vehicle, day, {column: array}) for every chunk with rows in
+        [start, end] (epochs, None for open ends); the arrays are memory-mapped slices,
+        only the requested columns are opened and only the rows in range paged in.
+        'clip' yields the source clip paths instead of their indexes """
+        for vehicle, day, partition_dir in self.get_partitions(vehicles, start, end):
+            for chunk_dir in list_chunks(partition_dir):
+                epochs = np.load(os.path.join(chunk_dir, 'epoch.npy'), mmap_mode='r')
+                first = 0 if start is None else int(np.searchsorted(epochs, start, 'left'))
+                last = len(epochs) if end is None else int(np.searchsorted(epochs, end, 'right'))
+                if first >= last:
+                    continue
+                data = {}
+                for name in columns:
+                    if name == 'epoch':
+                        data[name] = epochs[first:last]
+                        continue
+                    values = np.load(os.path.join(chunk_dir, name + '.npy'), mmap_mode='r')
+                    if name == 'clip':
+                        clips = np.array([entry['path'] for entry in read_clips(chunk_dir)],
+                                         dtype=object)
+                        data[name] = clips[values[first:last]]
+                    else:
+                        data[name] = values[first:last]
+                yield vehicle, day, data
+
+    def query(self, vehicles=None, start=None, end=None, columns=COLUMNS):
+        """ the rows in [start, end] of the vehicles (default: all) as a dict of
+        arrays, with a 'vehicle' entry if more than one vehicle is involved;
+        rows are sorted by vehicle, then (if requested) by epoch """
+        parts = {name: [] for name in columns}
+        names = []
+        counts = []
+        for vehicle, _, data in self.iter_chunks(vehicles, start, end, columns):
+            for name in columns:
+                parts[name].append(data[name])
+            if vehicle not in names:
+                names.append(vehicle)
+            counts.append((names.index(vehicle), len(data[columns[0]])))
+        result = {name: (np.concatenate(parts[name]) if parts[name]
+                         else np.empty(0, dtype=object if name == 'clip' else DTYPES[name]))
+                  for name in columns}
+        codes = np.repeat([code for code, _ in counts], [count for _, count in counts])
+        if 'epoch' in result and len(counts) > 1:
+            # chunks of a day overlap in time when clips were added out of order
+            order = np.lexsort((result['epoch'], codes))
+            result = {name: values[order] for name, values in result.items()}
+            codes = codes[order]
+        if len(names) > 1:
+            result['vehicle'] = np.array(names, dtype=object)[codes]
+        return result
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules import each other as top-level modules (they are run from pydashcam/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'pydashcam'))
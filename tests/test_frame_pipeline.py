@@ -0,0 +1,158 @@
+import pytest
+
+import frame_pipeline
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeDecoder(object):
+    """ the part of FrameDecoder the scheduler uses, with frames 'decoded' on demand """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.ready = []
+        self.dropped = 0
+        self.skip_target = None
+        self.seeks = []
+
+    def decode(self, *indexes):
+        self.ready.extend(indexes)
+
+    def seek(self, position):
+        self.seeks.append(position)
+        self.ready = []
+
+    def skip_to(self, frame_index):
+        self.skip_target = frame_index
+
+    def get(self, frame_index=None):
+        if not self.ready:
+            return None
+        count = 1 if frame_index is None else sum(
+            1 for index in self.ready if index <= frame_index)
+        if count == 0:
+            return None
+        self.dropped += count - 1
+        index = self.ready[count - 1]
+        del self.ready[:count]
+        return index, index * 1000.0 / self.fps, None
+
+
+def test_clock_runs_at_rate():
+    now = FakeTime()
+    clock = frame_pipeline.PlaybackClock(2.0, clock=now)
+    now.advance(1)
+    assert clock.position() == 0.0
+    clock.start()
+    now.advance(1.5)
+    assert clock.position() == 3000.0
+    assert clock.time_until(5000.0) == 1.0
+    assert clock.time_until(1000.0) == 0.0
+
+
+def test_clock_rate_change_keeps_position():
+    now = FakeTime()
+    clock = frame_pipeline.PlaybackClock(clock=now)
+    clock.start()
+    now.advance(2)
+    assert clock.set_rate(4.0) == 4.0
+    assert clock.position() == 2000.0
+    now.advance(1)
+    assert clock.position() == 6000.0
+    assert clock.set_rate(100) == frame_pipeline.MAX_RATE
+    assert clock.set_rate(0.1) == frame_pipeline.MIN_RATE
+    assert clock.position() == 6000.0
+
+
+def test_clock_pause_resume_and_seek():
+    now = FakeTime()
+    clock = frame_pipeline.PlaybackClock(clock=now)
+    clock.start()
+    now.advance(1)
+    clock.pause()
+    now.advance(10)
+    assert clock.position() == 1000.0
+    assert clock.time_until(2000.0) == 0.0
+    clock.start()
+    now.advance(0.5)
+    assert clock.position() == 1500.0
+    clock.seek(30000.0)
+    assert clock.position() == 30000.0
+    now.advance(1)
+    assert clock.position() == 31000.0
+
+
+def make_scheduler(rate=1.0):
+    now = FakeTime()
+    decoder = FakeDecoder(30)
+    scheduler = frame_pipeline.PlaybackScheduler(decoder, 30, rate, clock=now)
+    return now, decoder, scheduler
+
+
+def test_scheduler_drops_frames_that_are_overdue():
+    now, decoder, scheduler = make_scheduler()
+    decoder.decode(*range(10))
+    scheduler.clock.start()
+    now.advance(0.2)
+    index, position, _ = scheduler.tick()
+    assert (index, position) == (6, 200.0)
+    assert decoder.skip_target == 6
+    assert scheduler.dropped == 6
+    assert (scheduler.shown, scheduler.late) == (1, 0)
+    # frame 7 is due at 233.3 ms
+    assert scheduler.delay() == 33
+    assert scheduler.tick() is None
+
+
+def test_scheduler_counts_late_frames():
+    now, decoder, scheduler = make_scheduler()
+    decoder.decode(0, 1, 2)
+    scheduler.clock.start()
+    now.advance(0.5)
+    assert scheduler.tick()[0] == 2
+    assert decoder.skip_target == 15
+    assert (scheduler.shown, scheduler.late, scheduler.dropped) == (1, 1, 2)
+    # the next frame is overdue already
+    assert scheduler.delay() == 1
+
+
+def test_scheduler_follows_the_rate():
+    now, decoder, scheduler = make_scheduler(rate=2.0)
+    decoder.decode(*range(20))
+    scheduler.clock.start()
+    now.advance(0.2)
+    assert scheduler.tick()[0] == 12
+    assert scheduler.delay() == 17
+    scheduler.clock.set_rate(0.5)
+    assert scheduler.tick() is None
+    now.advance(0.1)
+    assert scheduler.tick()[0] == 13
+    assert scheduler.delay() == 33
+
+
+def test_scheduler_paused_and_seek():
+    now, decoder, scheduler = make_scheduler()
+    scheduler.seek(10000.0)
+    assert decoder.seeks == [10000.0]
+    assert scheduler.last_index is None
+    assert scheduler.delay() == 1
+    # paused: the first frame after the seek is shown and the clock moves to it
+    decoder.decode(299, 300, 301)
+    now.advance(5)
+    assert scheduler.tick()[0] == 299
+    assert scheduler.clock.position() == pytest.approx(9966.67, abs=0.01)
+    assert scheduler.dropped == 0
+    # resumed: playback continues from the shown frame, not from the wall time
+    scheduler.clock.start()
+    now.advance(0.04)
+    assert scheduler.tick()[0] == 300
+    assert scheduler.dropped == 0
@@ -0,0 +1,60 @@
+import importlib.util
+import time
+
+import pytest
+
+import make_fixtures
+import nvtk_mp42gpx
+
+
+def make_fixes(count=120):
+    fixes = []
+    for epoch, lat, lon, speed, bearing in make_fixtures.make_drive(count, outliers=0):
+        tm_time = time.gmtime(epoch)
+        fixes.append(nvtk_mp42gpx.GpsFix(
+            tm_time.tm_year, tm_time.tm_mon, tm_time.tm_mday, tm_time.tm_hour, tm_time.tm_min,
+            tm_time.tm_sec, 'N', 0.0, lat, 'E', 0.0, lon, speed, bearing, epoch))
+    return fixes
+
+
+def test_dict_round_trip():
+    fix = make_fixes(1)[0]
+    copy = nvtk_mp42gpx.GpsFix.from_dict(fix.as_dict())
+    assert (copy.epoch, copy.dt, copy.lat, copy.lon) == (fix.epoch, fix.dt, fix.lat, fix.lon)
+
+
+def test_remove_outliers_accepts_dicts():
+    fixes = make_fixes()
+    fixes[50].lat += 5
+    dicts = nvtk_mp42gpx.fixes_as_dicts(fixes) + [None]
+    kept = nvtk_mp42gpx.remove_outliers(dicts)
+    assert len(kept) == len(fixes) - 1
+    assert all(isinstance(item, dict) for item in kept)
+    assert dicts[50] not in kept
+
+
+def test_generate_gpx_and_sort_accept_dicts():
+    fixes = make_fixes(10)
+    dicts = nvtk_mp42gpx.fixes_as_dicts(fixes)
+    assert (nvtk_mp42gpx.generate_gpx(dicts + [None], 'x.gpx')
+            == nvtk_mp42gpx.generate_gpx(fixes, 'x.gpx'))
+    assert nvtk_mp42gpx.sort_gps_data_by_dt(dicts[::-1]) == dicts
+
+
+def test_unknown_items_are_rejected():
+    with pytest.raises(TypeError):
+        nvtk_mp42gpx.remove_outliers([(1, 2, 3)])
+    with pytest.raises(TypeError):
+        nvtk_mp42gpx.generate_gpx([(1, 2, 3)], 'x.gpx')
+
+
+def test_fixes_of_another_module_copy():
+    # run as a script the module is __main__, the cache and the worker processes
+    # return fixes of the imported nvtk_mp42gpx module
+    spec = importlib.util.spec_from_file_location('__main__copy', nvtk_mp42gpx.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    fixes = make_fixes(10)[::-1]
+    assert [gps.epoch for gps in module.sort_gps_data_by_dt(fixes)] == sorted(
+        gps.epoch for gps in fixes)
+    assert len(module.remove_outliers(fixes)) == 10
@@ -0,0 +1,26 @@
+import random
+
+import make_fixtures
+import nvtk_mp42gpx
+
+
+def make_payload(head, tail):
+    record = make_fixtures.make_record(make_fixtures.DEFAULT_START, 52.5, 13.4, 15.0, 90.0)
+    return b'\x00' * head + record + b'\x00' * tail
+
+
+def test_same_offset_as_the_scan():
+    rnd = random.Random(3)
+    for _ in range(5000):
+        data = bytes(rnd.choice(b'ANSEW\x00x') for _ in range(rnd.randint(0, 80)))
+        assert nvtk_mp42gpx.get_gps_offset(data) == nvtk_mp42gpx.scan_gps_offset(data)
+
+
+def test_independent_of_earlier_calls():
+    short = make_payload(4, 24)
+    # a marker where the previous payload had its own, plus a later one
+    long = make_payload(4, 24) + make_payload(0, 24)
+    expected = [nvtk_mp42gpx.scan_gps_offset(data) for data in (short, long)]
+    for order in ((short, long), (long, short), (short, short, long)):
+        for data in order:
+            assert nvtk_mp42gpx.get_gps_offset(data) == expected[data is long]
@@ -0,0 +1,45 @@
+import make_fixtures
+import nvtk_mp42gpx
+import track_cache
+
+
+def test_mp4_batches(tmpdir):
+    path = str(tmpdir.join('clip.mp4'))
+    make_fixtures.make_mp4(path, 120, video_rate=1024)
+    batches = list(nvtk_mp42gpx.iter_gps_data(path, False, batch_atoms=50))
+    assert [len(batch) for batch in batches] == [50, 50, 20]
+    expected = nvtk_mp42gpx.process_file(path, False, False)
+    assert ([gps.epoch for batch in batches for gps in batch]
+            == [gps.epoch for gps in expected])
+
+
+def test_ts_batches(tmpdir):
+    path = str(tmpdir.join('clip.ts'))
+    make_fixtures.make_ts(path, 120)
+    batches = list(nvtk_mp42gpx.iter_gps_data(path, False))
+    assert len(batches) > 1
+    expected = nvtk_mp42gpx.process_file(path, False, False)
+    assert ([(gps.epoch, gps.lat) for batch in batches for gps in batch]
+            == [(gps.epoch, gps.lat) for gps in expected])
+
+
+def test_other_file(tmpdir):
+    path = tmpdir.join('clip.bin')
+    path.write_binary(b'\x00' * 4096)
+    assert list(nvtk_mp42gpx.iter_gps_data(str(path), False)) == []
+
+
+def test_cache_is_shared(tmpdir):
+    path = str(tmpdir.join('clip.mp4'))
+    make_fixtures.make_mp4(path, 120, video_rate=1024)
+    cache = track_cache.TrackCache(str(tmpdir.join('cache')))
+    # an abandoned iteration does not cache a partial track
+    next(nvtk_mp42gpx.iter_gps_data(path, False, 50, cache))
+    assert cache.get(path, False) is None
+    batches = list(nvtk_mp42gpx.iter_gps_data(path, False, 50, cache))
+    assert len(cache.get(path, False)) == 120
+    # the CLI path reads the track the viewer path cached, and the other way round
+    assert ([gps.epoch for gps in nvtk_mp42gpx.process_file(path, False, False, cache)]
+            == [gps.epoch for batch in batches for gps in batch])
+    cached = list(nvtk_mp42gpx.iter_gps_data(path, False, 50, cache))
+    assert [len(batch) for batch in cached] == [50, 50, 20]
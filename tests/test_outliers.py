@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+import pytest
+
+import make_fixtures
+import nvtk_mp42gpx
+
+FINDERS = [nvtk_mp42gpx.find_outliers_np, nvtk_mp42gpx.find_outliers_py]
+
+
+def make_track(count, gps_rate=1):
+    fixes = list(make_fixtures.make_drive(count, gps_rate, outliers=0))
+    return ([fix[1] for fix in fixes], [fix[2] for fix in fixes], [fix[0] for fix in fixes])
+
+
+def find_outliers(finder, lats, lons, epochs):
+    outliers, _ = finder(lats, lons, epochs, nvtk_mp42gpx.OUTLIER_WINDOW,
+                         nvtk_mp42gpx.OUTLIER_SPEED)
+    return [index for index, outlier in enumerate(outliers) if outlier]
+
+
+@pytest.mark.parametrize('finder', FINDERS)
+def test_clean_drive_is_kept(finder):
+    assert find_outliers(finder, *make_track(3600)) == []
+
+
+@pytest.mark.parametrize('finder', FINDERS)
+@pytest.mark.parametrize('offset', [0.02, 1.0, 5.0])
+def test_single_glitch(finder, offset):
+    lats, lons, epochs = make_track(3600)
+    lats[1800] += offset
+    lons[0] -= offset
+    lats[-1] += offset
+    assert find_outliers(finder, lats, lons, epochs) == [0, 1800, 3599]
+
+
+@pytest.mark.parametrize('finder', FINDERS)
+def test_run_of_glitches(finder):
+    lats, lons, epochs = make_track(3600)
+    for index in range(1000, 1004):
+        lats[index] += 1.0
+    assert find_outliers(finder, lats, lons, epochs) == [1000, 1001, 1002, 1003]
+
+
+def test_repeated_epochs():
+    lats, lons, _ = make_track(20000)
+    epochs = [make_fixtures.DEFAULT_START] * len(lats)
+    lats[5000] += 1.0
+    started = time.perf_counter()
+    assert find_outliers(nvtk_mp42gpx.find_outliers_np, lats, lons, epochs) == [5000]
+    assert time.perf_counter() - started < 1.0
+
+
+@pytest.mark.parametrize('finder', FINDERS)
+def test_sub_second_rate(finder):
+    # 10Hz, but the epochs are whole seconds
+    lats, lons, epochs = make_track(6000, gps_rate=10)
+    first, last = nvtk_mp42gpx.get_window_bounds(epochs, nvtk_mp42gpx.OUTLIER_WINDOW)
+    assert epochs[last[3000] - 1] - epochs[first[3000]] == nvtk_mp42gpx.OUTLIER_WINDOW
+    lats[3000] += 0.1
+    assert find_outliers(finder, lats, lons, epochs) == [3000]
+
+
+def test_rolling_median():
+    values = np.array([5.0, 1.0, 4.0, 2.0, 3.0, 9.0])
+    first = np.array([0, 0, 1, 2, 2, 4])
+    last = np.array([2, 3, 4, 5, 5, 6])
+    assert (nvtk_mp42gpx.get_rolling_median(values, first, last).tolist()
+            == [5.0, 4.0, 2.0, 3.0, 3.0, 9.0])
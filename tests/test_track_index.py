@@ -0,0 +1,47 @@
+import math
+import random
+
+import track_index
+
+
+def make_track(count, seed):
+    rnd = random.Random(seed)
+    lats, lons = [], []
+    lat, lon = 48.1, 11.5
+    for _ in range(count):
+        lat += rnd.uniform(-0.0005, 0.0005)
+        lon += rnd.uniform(-0.0002, 0.001)
+        lats.append(lat)
+        lons.append(lon)
+    epochs = [1.6e9 + second for second in range(count)]
+    zeros = [0.0] * count
+    return track_index.TrackIndex(epochs, lats, lons, zeros, zeros)
+
+
+def scan_nearest(track, lat, lon):
+    scale = math.cos(math.radians((min(track.lats) + max(track.lats)) / 2.0))
+    return min(range(len(track)),
+               key=lambda i: ((track.lats[i] - lat) ** 2 + ((track.lons[i] - lon) * scale) ** 2, i))
+
+
+def test_nearest_point_matches_a_scan():
+    rnd = random.Random(3)
+    track = make_track(3000, 1)
+    for _ in range(500):
+        index = rnd.randrange(len(track))
+        lat = track.lats[index] + rnd.gauss(0, 0.003)
+        lon = track.lons[index] + rnd.gauss(0, 0.003)
+        assert track.nearest_point(lat, lon) == scan_nearest(track, lat, lon)
+
+
+def test_nearest_point_far_off_the_track():
+    track = make_track(200, 2)
+    for lat, lon in ((0.0, 0.0), (48.1, 30.0), (60.0, 11.5), (track.lats[0], track.lons[0])):
+        assert track.nearest_point(lat, lon) == scan_nearest(track, lat, lon)
+
+
+def test_nearest_point_repeated_positions():
+    # a parked car: the same position over and over, the earliest fix wins
+    track = track_index.TrackIndex([3.0, 1.0, 2.0], [48.0] * 3, [11.0] * 3, [0.0] * 3, [0.0] * 3)
+    assert track.nearest_point(48.001, 11.0) == 0
+    assert track_index.TrackIndex([], [], [], [], []).nearest_point(48.0, 11.0) is None
@@ -0,0 +1,91 @@
+import os
+
+import make_fixtures
+import nvtk_mp42gpx
+import track_store
+
+
+def decode(path):
+    return nvtk_mp42gpx.process_file(path, False, False)
+
+
+def test_reexport_is_idempotent(tmpdir):
+    clip = str(tmpdir.join('clip.mp4'))
+    make_fixtures.make_mp4(clip, 120, video_rate=1024)
+    root = str(tmpdir.join('store'))
+    gps_data = decode(clip)
+    for _ in range(2):
+        with track_store.TrackStoreWriter(root, 'car') as writer:
+            writer.add(clip, gps_data)
+    assert writer.skipped == 1
+    assert len(track_store.TrackStore(root).query()['epoch']) == len(gps_data)
+
+
+def test_changed_clip_replaces_its_rows(tmpdir):
+    clip = str(tmpdir.join('clip.mp4'))
+    other = str(tmpdir.join('other.mp4'))
+    make_fixtures.make_mp4(clip, 120, video_rate=1024)
+    make_fixtures.make_mp4(other, 60, video_rate=1024,
+                           start_epoch=make_fixtures.DEFAULT_START + 600)
+    root = str(tmpdir.join('store'))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        writer.add(clip, decode(clip))
+        writer.add(other, decode(other))
+    # the clip is recorded over with a shorter one
+    make_fixtures.make_mp4(clip, 30, video_rate=1024)
+    os.utime(clip, ns=(0, os.stat(clip).st_mtime_ns + 10 ** 9))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        assert writer.add(clip, decode(clip))
+    result = track_store.TrackStore(root).query()
+    paths = list(result['clip'])
+    assert paths.count(os.path.abspath(clip)) == 30
+    assert paths.count(os.path.abspath(other)) == len(decode(other))
+    assert list(result['epoch']) == sorted(result['epoch'])
+
+
+def test_reimport_moves_clip_to_another_day(tmpdir):
+    clip = str(tmpdir.join('clip.mp4'))
+    # recorded just before midnight with the camera clock a day ahead
+    wrong_start = make_fixtures.DEFAULT_START + 86400 + 13 * 3600 + 59 * 60
+    make_fixtures.make_mp4(clip, 120, video_rate=1024, start_epoch=wrong_start)
+    root = str(tmpdir.join('store'))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        writer.add(clip, decode(clip))
+    store = track_store.TrackStore(root)
+    assert store.days('car') == ['2021-01-10', '2021-01-11']
+    # the clock is fixed and the clip decoded again
+    make_fixtures.make_mp4(clip, 120, video_rate=1024)
+    os.utime(clip, ns=(0, os.stat(clip).st_mtime_ns + 10 ** 9))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        assert writer.add(clip, decode(clip))
+    result = store.query()
+    assert len(result['epoch']) == 120
+    assert result['epoch'][0] == make_fixtures.DEFAULT_START
+    assert len(store.query(start=wrong_start)['epoch']) == 0
+    # and a third import finds it unchanged
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        assert not writer.add(clip, decode(clip))
+    assert len(store.query()['epoch']) == 120
+
+
+def test_store_without_manifest(tmpdir):
+    clip = str(tmpdir.join('clip.mp4'))
+    make_fixtures.make_mp4(clip, 60, video_rate=1024)
+    root = str(tmpdir.join('store'))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        writer.add(clip, decode(clip))
+    os.remove(os.path.join(root, 'car', track_store.MANIFEST_FILE))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        assert not writer.add(clip, decode(clip))
+    assert os.path.exists(os.path.join(root, 'car', track_store.MANIFEST_FILE))
+    assert len(track_store.TrackStore(root).query()['epoch']) == 60
+
+
+def test_clip_added_twice_in_one_run(tmpdir):
+    clip = str(tmpdir.join('clip.mp4'))
+    make_fixtures.make_mp4(clip, 60, video_rate=1024)
+    root = str(tmpdir.join('store'))
+    with track_store.TrackStoreWriter(root, 'car') as writer:
+        assert writer.add(clip, decode(clip))
+        assert not writer.add(clip, decode(clip))
+    assert len(track_store.TrackStore(root).query()['epoch']) == 60
@@ -0,0 +1,26 @@
+import make_fixtures
+import nvtk_mp42gpx
+
+
+def make_gps_packet(epoch):
+    record = make_fixtures.make_record(epoch, 52.5, 13.4, 10.0, 90.0)
+    return make_fixtures.make_ts_packet(
+        nvtk_mp42gpx.GPS_PID, make_fixtures.PES_PRIVATE_2 + b'\x00' * 20 + record, True)
+
+
+def test_garbage_does_not_pile_up():
+    scanner = nvtk_mp42gpx.TsScanner(False)
+    chunk = b'\x00' * (1024 * 1024)
+    for _ in range(32):
+        assert scanner.feed(chunk) == []
+        assert len(scanner.pending) <= 2 * nvtk_mp42gpx.TS_PACKET_SIZE
+    assert scanner.offset + len(scanner.pending) == 32 * len(chunk)
+
+
+def test_resync_after_garbage():
+    scanner = nvtk_mp42gpx.TsScanner(False)
+    packets = b''.join(make_gps_packet(1610186400 + index) for index in range(5))
+    gps_data = scanner.feed(b'\x00' * 100001 + packets[:300])
+    gps_data += scanner.feed(packets[300:])
+    gps_data += scanner.finish()
+    assert [gps.epoch for gps in gps_data] == [1610186400 + index for index in range(5)]